@@ -0,0 +1,204 @@
+"""
+Climatologie mensuelle des débits par localisation.
+Compteur, moyenne et somme des carrés des écarts (M2) par (localisation, mois),
+mis à jour en ligne (fusion de Chan, numériquement stable) et persistés.
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class MonthlyClimatology:
+    """
+    Table (localisation x 12 mois) de statistiques cumulées.
+    `update` n'intègre que les observations plus récentes que le dernier horodatage vu;
+    `backfill` charge un historique complet (chargement initial).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._index: Dict[str, int] = {}
+        self.count = np.zeros((0, 12), dtype=np.int64)
+        self.mean = np.zeros((0, 12))
+        self.m2 = np.zeros((0, 12))
+        self.last_time = np.zeros(0, dtype="datetime64[ns]")
+        self.updated_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def _row(self, location_id: str) -> int:
+        row = self._index.get(location_id)
+        if row is None:
+            row = len(self._index)
+            self._index[location_id] = row
+            self.count = np.vstack([self.count, np.zeros((1, 12), dtype=np.int64)])
+            self.mean = np.vstack([self.mean, np.zeros((1, 12))])
+            self.m2 = np.vstack([self.m2, np.zeros((1, 12))])
+            self.last_time = np.append(self.last_time, np.datetime64("NaT", "ns"))
+        return row
+
+    def locations(self) -> Iterable[str]:
+        return list(self._index)
+
+    def _merge(self, location_id: str, timestamps: np.ndarray, values: np.ndarray, newer_only: bool) -> int:
+        timestamps = np.asarray(pd.DatetimeIndex(timestamps).values, dtype="datetime64[ns]")
+        values = np.asarray(values, dtype=float)
+
+        with self._lock:
+            row = self._row(location_id)
+            keep = np.isfinite(values)
+            if newer_only and not np.isnat(self.last_time[row]):
+                keep &= timestamps > self.last_time[row]
+            timestamps, values = timestamps[keep], values[keep]
+            if len(values) == 0:
+                return 0
+
+            # Statistiques du lot par mois (deux passes: moyenne puis écarts)
+            months = pd.DatetimeIndex(timestamps).month.values - 1
+            count_b = np.bincount(months, minlength=12)
+            present = count_b > 0
+            mean_b = np.zeros(12)
+            mean_b[present] = np.bincount(months, weights=values, minlength=12)[present] / count_b[present]
+            m2_b = np.bincount(months, weights=(values - mean_b[months]) ** 2, minlength=12)
+
+            # Fusion avec l'état cumulé (Chan et al.)
+            count_a, mean_a, m2_a = self.count[row], self.mean[row], self.m2[row]
+            total = count_a + count_b
+            delta = mean_b - mean_a
+            safe_total = np.maximum(total, 1)
+            self.mean[row] = np.where(present, mean_a + delta * count_b / safe_total, mean_a)
+            self.m2[row] = np.where(present, m2_a + m2_b + delta ** 2 * count_a * count_b / safe_total, m2_a)
+            self.count[row] = total
+
+            latest = timestamps.max()
+            if np.isnat(self.last_time[row]) or latest > self.last_time[row]:
+                self.last_time[row] = latest
+            self.updated_at = datetime.utcnow()
+            return int(len(values))
+
+    def update(self, location_id: str, timestamps, values) -> int:
+        """Intègre les nouvelles observations (postérieures au dernier horodatage vu)"""
+        return self._merge(location_id, timestamps, values, newer_only=True)
+
+    def update_frame(self, location_id: str, frame: pd.DataFrame, column: str = "discharge_m3_s") -> int:
+        """`update` depuis un DataFrame (colonne `timestamp` ou DatetimeIndex)"""
+        timestamps = frame["timestamp"] if "timestamp" in frame.columns else frame.index
+        return self.update(location_id, timestamps, frame[column].values)
+
+    def backfill(self, location_id: str, timestamps, values) -> int:
+        """Chargement en bloc d'un historique (toutes les observations, vectorisé)"""
+        return self._merge(location_id, timestamps, values, newer_only=False)
+
+    def has_data(self, location_id: str) -> bool:
+        row = self._index.get(location_id)
+        return row is not None and bool(self.count[row].any())
+
+    def last_seen(self, location_id: str) -> Optional[pd.Timestamp]:
+        """Horodatage de la dernière observation intégrée (None si aucune)"""
+        row = self._index.get(location_id)
+        if row is None or np.isnat(self.last_time[row]):
+            return None
+        return pd.Timestamp(self.last_time[row])
+
+    def stats(self, location_id: str) -> Dict[int, Dict[str, float]]:
+        """{mois: {'mean', 'std', 'count'}} pour les mois observés (écart-type d'échantillon)"""
+        row = self._index.get(location_id)
+        if row is None:
+            return {}
+        count, mean, m2 = self.count[row], self.mean[row], self.m2[row]
+        std = np.sqrt(m2 / np.maximum(count - 1, 1))
+        return {
+            int(month) + 1: {"mean": float(mean[month]), "std": float(std[month]), "count": int(count[month])}
+            for month in np.flatnonzero(count)
+        }
+
+    def summary(self) -> Dict:
+        """Observations intégrées et dernier horodatage par localisation"""
+        return {
+            "path": self.path,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "locations": {
+                location_id: {
+                    "observations": int(self.count[row].sum()),
+                    "months_covered": int((self.count[row] > 0).sum()),
+                    "last_time": None if np.isnat(self.last_time[row]) else str(self.last_time[row]),
+                }
+                for location_id, row in self._index.items()
+            },
+        }
+
+    def to_records(self) -> list:
+        """Lignes (location_id, month, count, mean, m2, last_time) — format de la table climatology_monthly"""
+        with self._lock:
+            return [
+                {
+                    "location_id": location_id,
+                    "month": int(month) + 1,
+                    "count": int(self.count[row, month]),
+                    "mean": float(self.mean[row, month]),
+                    "m2": float(self.m2[row, month]),
+                    "last_time": None if np.isnat(self.last_time[row]) else pd.Timestamp(self.last_time[row]).to_pydatetime(),
+                }
+                for location_id, row in self._index.items()
+                for month in np.flatnonzero(self.count[row])
+            ]
+
+    def load_records(self, records: Iterable[Dict]) -> int:
+        """Charge des lignes au format de to_records (table climatology_monthly); retourne leur nombre"""
+        loaded = 0
+        with self._lock:
+            for record in records:
+                row = self._row(record["location_id"])
+                month = record["month"] - 1
+                self.count[row, month] = record["count"]
+                self.mean[row, month] = record["mean"]
+                self.m2[row, month] = record["m2"]
+                if record.get("last_time") is not None:
+                    last_time = np.datetime64(pd.Timestamp(record["last_time"]).to_datetime64(), "ns")
+                    if np.isnat(self.last_time[row]) or last_time > self.last_time[row]:
+                        self.last_time[row] = last_time
+                loaded += 1
+            if loaded:
+                self.updated_at = datetime.utcnow()
+        return loaded
+
+    def save(self, path: Optional[str] = None):
+        """Écrit la table (fichier JSON, remplacement atomique)"""
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            payload = {
+                "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+                "last_time": {
+                    location_id: None if np.isnat(self.last_time[row]) else str(self.last_time[row])
+                    for location_id, row in self._index.items()
+                },
+            }
+        payload["records"] = [
+            {key: value for key, value in record.items() if key != "last_time"} for record in self.to_records()
+        ]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: Optional[str] = None):
+        path = path or self.path
+        with open(path) as f:
+            payload = json.load(f)
+        with self._lock:
+            for location_id, last_time in payload.get("last_time", {}).items():
+                row = self._row(location_id)
+                self.last_time[row] = np.datetime64(last_time, "ns") if last_time else np.datetime64("NaT", "ns")
+        self.load_records(payload.get("records", []))
+        with self._lock:
+            if payload.get("updated_at"):
+                self.updated_at = datetime.fromisoformat(payload["updated_at"])
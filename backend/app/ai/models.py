@@ -9,6 +9,10 @@ from typing import Dict, Tuple, List, Optional
 import warnings
 warnings.filterwarnings('ignore')
 
+from scipy import sparse
+
+from app.ai.climatology import MonthlyClimatology
+
 # Imports ML (simplifiés pour déploiement rapide)
 try:
     from sklearn.preprocessing import StandardScaler, MinMaxScaler
@@ -18,6 +22,60 @@ except ImportError:
     pass
 
 
+def sliding_windows(
+    data: np.ndarray,
+    lookback: int,
+    stride: int = 1,
+    horizon: int = 1
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fenêtres glissantes sans copie pour l'entraînement.
+    X[i] = data[i*stride : i*stride + lookback], y[i] = valeur `horizon` pas après la fenêtre.
+    X et y sont des vues (strided) sur `data`.
+    """
+    data = np.asarray(data)
+    n_windows = len(data) - lookback - horizon + 1
+    if n_windows <= 0:
+        return np.empty((0, lookback), dtype=data.dtype), np.empty(0, dtype=data.dtype)
+    
+    X = np.lib.stride_tricks.sliding_window_view(data, lookback)[:n_windows:stride]
+    first_target = lookback + horizon - 1
+    y = data[first_target:first_target + n_windows:stride]
+    return X, y
+
+
+def resample_series(data: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Agrège une série par blocs de `factor` pas (ex: 24 pour horaire -> journalier).
+    Les valeurs les plus anciennes qui ne remplissent pas un bloc sont ignorées.
+    """
+    data = np.asarray(data, dtype=float)
+    if factor <= 1:
+        return data
+    n_blocks = len(data) // factor
+    if n_blocks == 0:
+        return data[:0]
+    return data[len(data) - n_blocks * factor:].reshape(n_blocks, factor).mean(axis=1)
+
+
+def fill_gaps(data: np.ndarray) -> np.ndarray:
+    """
+    Série sans NaN: retire les valeurs manquantes de tête, interpole les trous.
+    Renvoie `data` tel quel (sans copie) s'il n'y a aucun trou.
+    """
+    data = np.asarray(data, dtype=float)
+    missing = np.isnan(data)
+    if not missing.any():
+        return data
+    valid = np.flatnonzero(~missing)
+    if len(valid) == 0:
+        return data[:0]
+    data = data[valid[0]:]
+    missing = missing[valid[0]:]
+    positions = np.arange(len(data))
+    return np.interp(positions, positions[~missing], data[~missing])
+
+
 class LSTMForecaster:
     """
     Prévision court terme (7-15 jours) des débits.
@@ -25,8 +83,19 @@ class LSTMForecaster:
     NSE = 0,88 sur données test 2020-2024.
     """
     
-    def __init__(self, lookback_days: int = 30):
+    # Contribution des variables (modèle entraîné / repli sur la tendance)
+    MODEL_DRIVERS = {
+        "recent_discharge": 0.60,
+        "seasonal_pattern": 0.25,
+        "antecedent_rainfall": 0.10,
+        "soil_moisture": 0.05
+    }
+    FALLBACK_DRIVERS = {"recent_discharge": 0.60, "seasonal_pattern": 0.30, "uncertainty": 0.10}
+    
+    def __init__(self, lookback_days: int = 30, stride: int = 1, resample_factor: int = 1):
         self.lookback_days = lookback_days
+        self.stride = stride                    # Pas entre fenêtres d'entraînement
+        self.resample_factor = resample_factor  # Ex: 24 pour entraîner sur moyennes journalières
         self.scaler = StandardScaler()
         self.model = GradientBoostingRegressor(
             n_estimators=100,
@@ -35,28 +104,36 @@ class LSTMForecaster:
         )
         self.is_fitted = False
     
+    @property
+    def input_samples(self) -> int:
+        """Pas bruts (horaires) nécessaires en entrée de la prévision: fenêtre x ré-échantillonnage"""
+        return self.lookback_days * self.resample_factor
+    
+    def usable(self, n_samples: int) -> bool:
+        """Le modèle entraîné s'applique à une entrée de `n_samples` pas bruts (sinon repli)"""
+        return self.is_fitted and n_samples // max(self.resample_factor, 1) >= self.lookback_days
+    
+    def drivers(self, usable: bool) -> Dict:
+        """Contribution des variables (copie) selon le mode de prévision"""
+        return dict(self.MODEL_DRIVERS if usable else self.FALLBACK_DRIVERS)
+    
     def _prepare_sequences(
         self,
         data: np.ndarray,
         lookback: int = 30
     ) -> Tuple[np.ndarray, np.ndarray]:
-        """Crée séquences pour LSTM"""
-        X, y = [], []
-        for i in range(len(data) - lookback - 1):
-            X.append(data[i:i+lookback])
-            y.append(data[i+lookback])
-        return np.array(X), np.array(y)
+        """Crée séquences pour LSTM (vues sans copie)"""
+        return sliding_windows(data, lookback, stride=self.stride)
     
     def fit(self, historical_discharge: np.ndarray):
-        """Entraîner le modèle"""
-        scaled = self.scaler.fit_transform(historical_discharge.reshape(-1, 1))
-        scaled = scaled.flatten()
+        """Entraîner le modèle (accepte une vue de l'archive, trous interpolés)"""
+        series = resample_series(fill_gaps(historical_discharge), self.resample_factor)
+        scaled = self.scaler.fit_transform(series.reshape(-1, 1)).ravel()
         
         X, y = self._prepare_sequences(scaled, self.lookback_days)
         
         if len(X) > 0:
-            X_features = X.reshape(X.shape[0], -1)
-            self.model.fit(X_features, y)
+            self.model.fit(X, y)
             self.is_fitted = True
     
     def forecast(
@@ -68,49 +145,55 @@ class LSTMForecaster:
         Prévision 7-15 jours.
         Retourne: valeurs, intervalle de confiance, drivers.
         """
-        recent_discharge = np.array(recent_discharge)
-        
-        if not self.is_fitted or len(recent_discharge) < self.lookback_days:
-            # Fallback : tendance simple
-            trend = np.mean(recent_discharge[-5:])
-            noise = np.std(recent_discharge[-10:]) * 0.1
-            forecasts = trend + np.random.normal(0, noise, forecast_days)
-            confidence_low = forecasts * 0.85
-            confidence_high = forecasts * 1.15
-            drivers = {"recent_discharge": 0.60, "seasonal_pattern": 0.30, "uncertainty": 0.10}
-            return forecasts, (confidence_low, confidence_high), drivers
+        forecasts, (confidence_low, confidence_high), drivers = self.forecast_batch(
+            [recent_discharge], forecast_days
+        )
+        return forecasts[0], (confidence_low[0], confidence_high[0]), drivers[0]
+    
+    def forecast_batch(
+        self,
+        recent_discharges: List[np.ndarray],
+        forecast_days: int = 10
+    ) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray], List[Dict]]:
+        """
+        Prévision 7-15 jours pour plusieurs stations en un seul passage.
+        Récursion vectorisée: un appel `predict` par jour pour toutes les stations.
+        Les séries reçoivent le même ré-échantillonnage qu'à l'entraînement.
+        Retourne: valeurs (stations x jours), intervalle de confiance, drivers par station.
+        """
+        series = [resample_series(r, self.resample_factor) for r in recent_discharges]
+        n_series = len(series)
+        forecasts = np.empty((n_series, forecast_days))
         
-        # Normalisation
-        scaled = self.scaler.transform(recent_discharge.reshape(-1, 1)).flatten()
+        usable = np.array([self.usable(len(r)) for r in recent_discharges], dtype=bool)
         
-        # Prévisions itératives
-        forecasts = []
-        current_sequence = scaled[-self.lookback_days:].copy()
+        for i in np.flatnonzero(~usable):
+            # Fallback : tendance simple
+            trend = np.mean(series[i][-5:])
+            noise = np.std(series[i][-10:]) * 0.1
+            forecasts[i] = trend + np.random.normal(0, noise, forecast_days)
         
-        for day in range(forecast_days):
-            X_pred = current_sequence.reshape(1, -1)
-            pred_scaled = self.model.predict(X_pred)[0]
-            forecasts.append(pred_scaled)
+        rows = np.flatnonzero(usable)
+        if len(rows) > 0:
+            lookback = self.lookback_days
+            # Fenêtre glissante préallouée: [historique normalisé | prévisions]
+            window = np.empty((len(rows), lookback + forecast_days))
+            recent = np.stack([series[i][-lookback:] for i in rows])
+            window[:, :lookback] = self.scaler.transform(recent.reshape(-1, 1)).reshape(recent.shape)
+            
+            for day in range(forecast_days):
+                window[:, lookback + day] = self.model.predict(window[:, day:day + lookback])
             
-            # Glissement
-            current_sequence = np.append(current_sequence[1:], pred_scaled)
+            # Inverse transform
+            predicted = window[:, lookback:]
+            forecasts[rows] = self.scaler.inverse_transform(predicted.reshape(-1, 1)).reshape(predicted.shape)
         
-        # Inverse transform
-        forecasts = np.array(forecasts)
-        forecasts = self.scaler.inverse_transform(forecasts.reshape(-1, 1)).flatten()
+        drivers = [self.drivers(is_usable) for is_usable in usable]
         
         # Intervalle de confiance (±15%)
         confidence_low = forecasts * 0.85
         confidence_high = forecasts * 1.15
         
-        # Drivers (contribution des variables)
-        drivers = {
-            "recent_discharge": 0.60,
-            "seasonal_pattern": 0.25,
-            "antecedent_rainfall": 0.10,
-            "soil_moisture": 0.05
-        }
-        
         return forecasts, (confidence_low, confidence_high), drivers
 
 
@@ -121,25 +204,42 @@ class TransformerSeasonalForecaster:
     Skill score = 0,65.
     """
     
-    def __init__(self):
+    def __init__(self, climatology: Optional[MonthlyClimatology] = None):
+        # Statistiques mensuelles cumulées par localisation (mises à jour en ligne)
+        self.climatology = climatology or MonthlyClimatology()
+        self.location_id = "default"
         self.monthly_climatology = {}
     
-    def fit(self, historical_data: pd.DataFrame):
-        """Calculer climatologie par mois"""
-        monthly_avg = historical_data.groupby(
-            historical_data.index.month
-        )['discharge_m3_s'].agg(['mean', 'std'])
-        self.monthly_climatology = monthly_avg.to_dict()
+    def fit(self, historical_data: pd.DataFrame, location_id: str = "default"):
+        """
+        Intègre à la climatologie les observations postérieures au dernier horodatage vu
+        (pas de recalcul sur tout l'historique).
+        """
+        timestamps = historical_data['timestamp'] if 'timestamp' in historical_data.columns else historical_data.index
+        self.fit_series(timestamps, historical_data['discharge_m3_s'].values, location_id)
+    
+    def fit_series(self, timestamps: np.ndarray, discharge: np.ndarray, location_id: str = "default"):
+        """`fit` depuis des tableaux (ex. vues de l'archive horaire)"""
+        self.climatology.update(location_id, timestamps, discharge)
+        self.location_id = location_id
+        # {mois: {'mean': ..., 'std': ..., 'count': ...}}
+        self.monthly_climatology = self.climatology.stats(location_id)
     
     def forecast(
         self,
         current_month: int,
         forecast_months: int = 3,
-        enso_phase: str = "neutral"
+        enso_phase: str = "neutral",
+        location_id: Optional[str] = None
     ) -> Dict:
         """
         Prévision saisonnière avec impact ENSO.
+        Climatologie de `location_id` si elle existe, sinon celle du dernier entraînement.
         """
+        monthly_climatology = self.monthly_climatology
+        if location_id is not None and location_id != self.location_id and self.climatology.has_data(location_id):
+            monthly_climatology = self.climatology.stats(location_id)
+        
         # Influence ENSO
         enso_factor = {
             "strong_la_nina": 1.15,    # Plus d'eau
@@ -154,8 +254,8 @@ class TransformerSeasonalForecaster:
         for month_offset in range(forecast_months):
             month = ((current_month + month_offset - 1) % 12) + 1
             
-            if month in self.monthly_climatology:
-                climatology = self.monthly_climatology[month]
+            if month in monthly_climatology:
+                climatology = monthly_climatology[month]
                 mean = climatology['mean']
                 std = climatology['std']
                 
@@ -169,7 +269,7 @@ class TransformerSeasonalForecaster:
         avg_discharge = np.mean(predictions)
         
         # Classifier la saison
-        normal_mean = np.mean(list(self.monthly_climatology.values())) if self.monthly_climatology else 1000
+        normal_mean = np.mean([c['mean'] for c in monthly_climatology.values()]) if monthly_climatology else 1000
         
         if avg_discharge < normal_mean * 0.7:
             season_type = "drought"
@@ -217,10 +317,12 @@ class FloodPredictionConvLSTM:
         self,
         discharge_m3_s: float,
         recent_discharge: np.ndarray,
-        location_id: str
+        location_id: str,
+        as_array: bool = False
     ) -> Dict:
         """
         Génère carte probabiliste d'inondation.
+        `as_array=True` renvoie la grille en ndarray (pas de conversion en listes).
         """
         # Seuil d'inondation par localisation
         flood_thresholds = {
@@ -271,42 +373,141 @@ class FloodPredictionConvLSTM:
             })
         
         return {
-            "inundation_probability_map": grid.tolist(),
+            "inundation_probability_map": grid if as_array else grid.tolist(),
             "affected_area_km2": float(affected_area_km2),
             "affected_population": affected_population,
             "critical_zones": critical_zones
         }
 
 
+# Topologie Sénégal simplifiée
+SENEGAL_RIVER_NODES = {
+    "fouta_djallon": {"name": "Fouta Djallon", "type": "source", "coords": (10.5, -10.5)},
+    "bakel": {"name": "Bakel", "type": "station", "coords": (14.22, -11.92)},
+    "matam": {"name": "Matam", "type": "station", "coords": (14.13, -11.77)},
+    "manantali": {"name": "Manantali", "type": "dam", "coords": (12.08, -7.98)},
+    "kaedi": {"name": "Kaédi", "type": "station", "coords": (13.83, -13.15)},
+    "diama": {"name": "Diama", "type": "dam", "coords": (14.72, -14.65)},
+    "delta": {"name": "Delta", "type": "outlet", "coords": (14.8, -14.5)},
+}
+
+# Arêtes (connexions + délai de propagation en jours)
+SENEGAL_RIVER_EDGES = [
+    ("fouta_djallon", "manantali", 3),
+    ("fouta_djallon", "bakel", 8),
+    ("manantali", "matam", 5),
+    ("manantali", "kaedi", 7),
+    ("bakel", "matam", 1),
+    ("matam", "kaedi", 3),
+    ("kaedi", "diama", 8),
+    ("diama", "delta", 2),
+]
+
+
+class PropagationOperator:
+    """
+    Réseau compilé en opérateur creux de propagation.
+    x[j] = somme sur les délais L de w(L) * A_L @ x[j - L], w(L) = 0.7 * (1 - L / (2 * horizon)),
+    A_L = matrice (destination x source) des arêtes de délai L.
+    """
+    
+    def __init__(self, node_ids: List[str], edges: List[Tuple[str, str, int]]):
+        self.node_ids = list(node_ids)
+        self.index = {node: i for i, node in enumerate(self.node_ids)}
+        n = len(self.node_ids)
+        
+        src = np.array([self.index[e[0]] for e in edges], dtype=np.intp)
+        dst = np.array([self.index[e[1]] for e in edges], dtype=np.intp)
+        delay = np.array([e[2] for e in edges], dtype=np.intp)
+        if (delay < 1).any():
+            raise ValueError("Les délais de propagation doivent être >= 1 jour")
+        self.max_lag = int(delay.max()) if len(delay) else 1
+        self.edge_src, self.edge_dst, self.edge_delay = src, dst, delay
+        
+        # Opérateur empilé [A_Lmax ... A_1] (n x Lmax*n): appliqué à l'historique
+        # x[j-Lmax..j-1] (contigu en mémoire) en un seul produit par jour.
+        # Les arêtes parallèles s'additionnent (comme dans la diffusion itérative).
+        self._stacked = sparse.csr_matrix(
+            (np.ones(len(delay)), (dst, (self.max_lag - delay) * n + src)),
+            shape=(n, self.max_lag * n)
+        )
+    
+    @staticmethod
+    def attenuation(delay: np.ndarray, days_ahead: int) -> np.ndarray:
+        return 0.7 * (1.0 - delay / (days_ahead * 2.0))
+    
+    def weighted(self, days_ahead: int):
+        """Opérateur empilé avec l'atténuation de l'horizon appliquée aux coefficients"""
+        operator = self._stacked.copy()
+        operator.data *= self.attenuation(self.max_lag - operator.indices // len(self.node_ids), days_ahead)
+        return operator
+    
+    def run(self, initial: np.ndarray, days_ahead: int) -> np.ndarray:
+        """
+        initial: (scénarios, nœuds) anomalies au jour 0.
+        Retourne (scénarios, jours, nœuds).
+        """
+        initial = np.atleast_2d(np.asarray(initial, dtype=float))
+        n_scenarios, n = initial.shape
+        pad = self.max_lag - 1
+        operator = self.weighted(days_ahead)
+        
+        # (jours, nœuds, scénarios) précédé de `pad` jours nuls: fenêtre d'historique = vue contiguë
+        state = np.zeros((pad + days_ahead, n, n_scenarios))
+        state[pad] = initial.T
+        for day in range(pad + 1, pad + days_ahead):
+            state[day] = operator @ state[day - self.max_lag:day].reshape(-1, n_scenarios)
+        return state[pad:].transpose(2, 0, 1)
+
+
 class GraphNeuralNetwork:
     """
     Modélise réseau hydrographique comme graphe.
     Propage l'information de propagation de crues.
     """
     
-    def __init__(self):
-        # Topologie Sénégal simplifiée
-        self.nodes = {
-            "fouta_djallon": {"name": "Fouta Djallon", "type": "source", "coords": (10.5, -10.5)},
-            "bakel": {"name": "Bakel", "type": "station", "coords": (14.22, -11.92)},
-            "matam": {"name": "Matam", "type": "station", "coords": (14.13, -11.77)},
-            "manantali": {"name": "Manantali", "type": "dam", "coords": (12.08, -7.98)},
-            "kaedi": {"name": "Kaédi", "type": "station", "coords": (13.83, -13.15)},
-            "diama": {"name": "Diama", "type": "dam", "coords": (14.72, -14.65)},
-            "delta": {"name": "Delta", "type": "outlet", "coords": (14.8, -14.5)},
-        }
+    def __init__(
+        self,
+        nodes: Optional[Dict[str, Dict]] = None,
+        edges: Optional[List[Tuple[str, str, int]]] = None
+    ):
+        self.nodes = nodes if nodes is not None else dict(SENEGAL_RIVER_NODES)
+        self.edges = edges if edges is not None else list(SENEGAL_RIVER_EDGES)
+        self._operator: Optional[PropagationOperator] = None
+    
+    def set_network(self, nodes: Dict[str, Dict], edges: List[Tuple[str, str, int]]):
+        """Remplace la topologie (recompilée au prochain appel)"""
+        self.nodes = nodes
+        self.edges = edges
+        self._operator = None
+    
+    def compile(self) -> PropagationOperator:
+        if self._operator is None:
+            self._operator = PropagationOperator(list(self.nodes), self.edges)
+        return self._operator
+    
+    def propagate_batch(
+        self,
+        sources: List[str],
+        anomalies: np.ndarray,
+        days_ahead: int = 10
+    ) -> np.ndarray:
+        """
+        Propage plusieurs scénarios (source, anomalie) en une passe.
+        Retourne (scénarios, jours, nœuds), nœuds dans l'ordre de self.nodes.
+        """
+        operator = self.compile()
+        source_index = np.array([operator.index[s] for s in sources], dtype=np.intp)
+        anomalies = np.broadcast_to(np.asarray(anomalies, dtype=float), source_index.shape)
         
-        # Arêtes (connexions + délai de propagation en jours)
-        self.edges = [
-            ("fouta_djallon", "manantali", 3),
-            ("fouta_djallon", "bakel", 8),
-            ("manantali", "matam", 5),
-            ("manantali", "kaedi", 7),
-            ("bakel", "matam", 1),
-            ("matam", "kaedi", 3),
-            ("kaedi", "diama", 8),
-            ("diama", "delta", 2),
-        ]
+        # Système linéaire: une réponse impulsionnelle par source distincte, mise à l'échelle
+        unique_sources, inverse = np.unique(source_index, return_inverse=True)
+        impulses = np.zeros((len(unique_sources), len(operator.node_ids)))
+        impulses[np.arange(len(unique_sources)), unique_sources] = 1.0
+        responses = operator.run(impulses, days_ahead).transpose(1, 2, 0)  # (jours, nœuds, sources) contigu
+        series = responses[:, :, inverse]
+        series *= anomalies
+        return series.transpose(2, 0, 1)
     
     def propagate(
         self,
@@ -318,136 +519,593 @@ class GraphNeuralNetwork:
         Propage une anomalie de débit à travers le réseau.
         Retourne prévision par nœud.
         """
-        propagation = {node: [0] * days_ahead for node in self.nodes}
-        propagation[source][0] = discharge_anomaly
+        series = self.propagate_batch([source], [discharge_anomaly], days_ahead)[0]
+        return {node: series[:, i].tolist() for i, node in enumerate(self.compile().node_ids)}
+
+
+class RoutingState:
+    """
+    Propagation avec état: anomalies propagées par nœud sur l'horizon.
+    Une nouvelle observation ne recalcule que le sous-graphe aval du nœud
+    (ordre topologique précalculé); le réseau doit être acyclique.
+    """
+    
+    def __init__(self, operator: PropagationOperator, days_ahead: int = 30):
+        self.operator = operator
+        self.days_ahead = days_ahead
+        n = len(operator.node_ids)
+        src, dst, delay = operator.edge_src, operator.edge_dst, operator.edge_delay
+        weight = PropagationOperator.attenuation(delay, days_ahead)
+        
+        # Arêtes sortantes / entrantes par nœud
+        self._successors: List[List[int]] = [[] for _ in range(n)]
+        self._incoming: List[List[Tuple[int, int, float]]] = [[] for _ in range(n)]
+        for s, d, l, w in zip(src.tolist(), dst.tolist(), delay.tolist(), weight.tolist()):
+            self._successors[s].append(d)
+            self._incoming[d].append((s, l, w))
+        
+        # Ordre topologique (Kahn)
+        in_degree = np.bincount(dst, minlength=n)
+        order = [i for i in range(n) if in_degree[i] == 0]
+        for node in order:
+            for succ in self._successors[node]:
+                in_degree[succ] -= 1
+                if in_degree[succ] == 0:
+                    order.append(succ)
+        if len(order) < n:
+            raise ValueError("Réseau cyclique: propagation incrémentale impossible")
+        self._topo_position = np.empty(n, dtype=np.intp)
+        self._topo_position[order] = np.arange(n)
+        self._downstream: Dict[int, np.ndarray] = {}
+        
+        # État (jours, nœuds), précédé de max_lag - 1 jours passés pour `advance`
+        self._pad = operator.max_lag - 1
+        self._state = np.zeros((self._pad + days_ahead, n))
+        self._injections: Dict[Tuple[int, int], float] = {}
+    
+    @property
+    def state(self) -> np.ndarray:
+        """Anomalies propagées (jours, nœuds), jour 0 = aujourd'hui"""
+        return self._state[self._pad:]
+    
+    def downstream(self, node: int) -> np.ndarray:
+        """Nœud + descendants, en ordre topologique (mémorisé)"""
+        cached = self._downstream.get(node)
+        if cached is None:
+            seen = {node}
+            stack = [node]
+            while stack:
+                for succ in self._successors[stack.pop()]:
+                    if succ not in seen:
+                        seen.add(succ)
+                        stack.append(succ)
+            cached = np.array(sorted(seen, key=self._topo_position.__getitem__), dtype=np.intp)
+            self._downstream[node] = cached
+        return cached
+    
+    def update(self, node_id: str, discharge_anomaly: float, day: int = 0) -> Dict[str, np.ndarray]:
+        """
+        Enregistre l'anomalie observée au nœud (remplace la précédente pour ce jour).
+        Retourne la variation de série (jours,) par nœud affecté.
+        """
+        node = self.operator.index[node_id]
+        if not 0 <= day < self.days_ahead:
+            raise ValueError(f"Jour hors horizon: {day}")
+        change = discharge_anomaly - self._injections.get((node, day), 0.0)
+        self._injections[(node, day)] = discharge_anomaly
+        if change == 0.0:
+            return {}
+        
+        # Variations sur le sous-graphe aval uniquement, nœud par nœud (vectorisé sur les jours)
+        nodes = self.downstream(node)
+        local = {n: i for i, n in enumerate(nodes.tolist())}
+        delta = np.zeros((len(nodes), self.days_ahead))
+        delta[0, day] = change
+        for i, target in enumerate(nodes.tolist()):
+            row = delta[i]
+            for src, lag, weight in self._incoming[target]:
+                j = local.get(src)
+                if j is not None and lag < self.days_ahead:
+                    row[lag:] += weight * delta[j, :-lag]
+        
+        self._state[self._pad:, nodes] += delta.T
+        affected = np.flatnonzero(np.abs(delta).max(axis=1) > 0)
+        return {self.operator.node_ids[nodes[i]]: delta[i] for i in affected}
+    
+    def advance(self, days: int = 1):
+        """Décale l'horizon de `days` jours (les nouveaux jours sont propagés sur tout le réseau)"""
+        if days <= 0:
+            return
+        operator = self.operator.weighted(self.days_ahead)
+        lag = self.operator.max_lag
+        n = len(self.operator.node_ids)
+        
+        extended = np.zeros((self._state.shape[0] + days, n))
+        extended[:self._state.shape[0]] = self._state
+        for d in range(self._state.shape[0], extended.shape[0]):
+            extended[d] = operator @ extended[d - lag:d].reshape(-1)
+        self._state = extended[days:]
+        
+        # Les injections passées sont intégrées à l'état
+        self._injections = {
+            (node, day - days): value for (node, day), value in self._injections.items() if day >= days
+        }
+
+
+# Cascade (amont -> aval): Manantali (Bafing) -> Félou -> Diama (embouchure)
+DAM_CASCADE = ["manantali", "felou", "diama"]
+
+SECONDS_PER_DAY = 86400.0
+HYDRO_EFFICIENCY = 0.9
+WATER_DENSITY_G = 1000.0 * 9.81
+
+# Prélèvements d'irrigation entre Félou et Diama (vallée moyenne), m³/s
+IRRIGATION_DEMAND_M3_S = 150.0
+# Débit environnemental / anti-sel à Diama, m³/s
+ENVIRONMENTAL_FLOW_M3_S = 300.0
+SALINITY_FLOW_M3_S = 500.0
+# Débit de débordement en aval de Félou (Bakel), m³/s
+FLOOD_DISCHARGE_M3_S = 2500.0
+# Part des apports propres (affluents) dans l'apport actuel de chaque barrage aval
+LOCAL_INFLOW_SHARE = {"manantali": 1.0, "felou": 0.35, "diama": 0.15}
+
+
+class ReservoirCascade:
+    """
+    Bilan de masse journalier de la cascade, vectorisé sur K politiques candidates.
+    Lâchers (K, 3, T) en m³/s, barrages dans l'ordre DAM_CASCADE.
+    """
+    
+    def __init__(
+        self,
+        dams: Dict[str, Dict],
+        natural_inflows: np.ndarray,
+        initial_fill: np.ndarray
+    ):
+        self.dams = [dams[name] for name in DAM_CASCADE]
+        self.natural_inflows = np.asarray(natural_inflows, dtype=float)  # (3, T) apports propres
+        self.initial_fill = np.asarray(initial_fill, dtype=float)        # (3,) fraction de capacité
+        self.horizon = self.natural_inflows.shape[1]
+        self.release_max = np.array([d["release_max_m3_s"] for d in self.dams])
+        self.max_energy_gwh = sum(d["power_mw"] for d in self.dams) * 24 * self.horizon / 1000.0
+    
+    def simulate(self, releases: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Simule K politiques en parallèle. Les lâchers sont corrigés par les contraintes
+        (réserve morte, déversement au-delà de la capacité).
+        Retourne objectifs et indicateurs (K,) + lâchers effectifs (K, 3, T).
+        """
+        releases = np.clip(np.asarray(releases, dtype=float), 0.0, self.release_max[None, :, None])
+        K, _, T = releases.shape
+        actual = np.empty_like(releases)
+        storage = np.broadcast_to(self.initial_fill * [d["capacity_m3"] for d in self.dams], (K, 3)).copy()
+        
+        energy = np.zeros(K)
+        irrigation = np.zeros(K)
+        spill = np.zeros(K)
+        shortage_days = np.zeros(K)
+        flood_excess = np.zeros(K)
+        
+        for t in range(T):
+            upstream = np.zeros(K)
+            for i, dam in enumerate(self.dams):
+                inflow = self.natural_inflows[i, t] + upstream
+                if DAM_CASCADE[i] == "diama":
+                    # Prélèvements d'irrigation sur le bief Félou -> Diama
+                    diverted = np.minimum(upstream, IRRIGATION_DEMAND_M3_S)
+                    irrigation += diverted * SECONDS_PER_DAY
+                    inflow = inflow - diverted
+                
+                release = releases[:, i, t]
+                capacity = dam["capacity_m3"]
+                previous = storage[:, i]
+                level = previous + (inflow - release) * SECONDS_PER_DAY
+                
+                # Réserve morte: lâcher réduit à l'eau disponible
+                short = np.maximum(dam["min_fill"] * capacity - level, 0.0)
+                shortage_days += short > 0
+                # Au-delà de la capacité: déversement non contrôlé
+                over = np.maximum(level - short - capacity, 0.0)
+                spill += over
+                release = release + (over - short) / SECONDS_PER_DAY
+                level = level + short - over
+                storage[:, i] = level
+                actual[:, i, t] = release
+                
+                if dam["power_mw"] > 0:
+                    fill = 0.5 * (previous + level) / capacity
+                    head = dam["head_min_m"] + (dam["head_max_m"] - dam["head_min_m"]) * fill
+                    turbined = np.minimum(release, dam["turbine_max_m3_s"])
+                    power_mw = np.minimum(HYDRO_EFFICIENCY * WATER_DENSITY_G * turbined * head / 1e6, dam["power_mw"])
+                    energy += power_mw * 24 / 1000.0
+                
+                if DAM_CASCADE[i] == "felou":
+                    flood_excess += np.clip((release - FLOOD_DISCHARGE_M3_S) / FLOOD_DISCHARGE_M3_S, 0.0, 1.0)
+                upstream = release
+        
+        diama = actual[:, DAM_CASCADE.index("diama"), :]
+        capacity = np.array([d["capacity_m3"] for d in self.dams])
+        final_fill = storage / capacity
+        total_inflow = self.natural_inflows.sum() * SECONDS_PER_DAY
         
-        # Diffuse itérativement
-        for day in range(1, days_ahead):
-            for src, dst, delay in self.edges:
-                if delay <= day and propagation[src][day - delay] != 0:
-                    # Atténuation avec distance
-                    attenuation = 1.0 - (delay / (days_ahead * 2.0))
-                    propagation[dst][day] += propagation[src][day - delay] * attenuation * 0.7
+        # Environnement: débit écologique à Diama, variations brusques pénalisées
+        eflow = np.minimum(diama / ENVIRONMENTAL_FLOW_M3_S, 1.0).mean(axis=1)
+        variation = np.abs(np.diff(diama, axis=1)).mean(axis=1) / np.maximum(diama.mean(axis=1), 1.0) if T > 1 else np.zeros(K)
+        environment = 100 * (0.8 * eflow + 0.2 * (1 - np.clip(variation, 0.0, 1.0)))
+        
+        # Sécurité: débordement aval, déversements, pénuries, remplissage au-delà de la courbe de crue
+        rule = np.array([d["flood_rule_fill"] for d in self.dams])
+        buffer = np.clip((final_fill - rule) / (1 - rule), 0.0, 1.0).mean(axis=1)
+        safety = 100 * np.clip(
+            1 - (2 * flood_excess / T + spill / total_inflow + shortage_days / (3 * T) + 0.5 * buffer),
+            0.0, 1.0
+        )
         
-        return propagation
+        return {
+            "energy_gwh": energy,
+            "irrigation_m3": irrigation,
+            "environment_score": environment,
+            "safety_score": safety,
+            "energy_score": 100 * energy / self.max_energy_gwh,
+            "irrigation_score": 100 * irrigation / (IRRIGATION_DEMAND_M3_S * SECONDS_PER_DAY * T),
+            "salinity_control": diama.min(axis=1) > SALINITY_FLOW_M3_S,
+            "final_fill": final_fill,
+            "releases": actual,
+        }
+
+
+def pareto_mask(objectives: np.ndarray) -> np.ndarray:
+    """
+    Points non dominés (maximisation sur chaque colonne).
+    Élimination successive: le point de plus grande somme restant n'est dominé par aucun autre;
+    on retire ce qu'il domine. Coût O(n x taille du front). Les doublons ne sont gardés qu'une fois.
+    """
+    order = np.argsort(-objectives.sum(axis=1), kind="stable")
+    points = objectives[order]
+    remaining = np.arange(len(points))
+    kept = []
+    while remaining.size:
+        best = remaining[0]
+        kept.append(best)
+        remaining = remaining[~(points[remaining] <= points[best]).all(axis=1)]
+    mask = np.zeros(len(points), dtype=bool)
+    mask[order[kept]] = True
+    return mask
 
 
 class ReinforcementLearningOptimizer:
     """
     Optimise politique de gestion des 3 barrages.
     Maximise: énergie, irrigation, environnement, sécurité.
+    Recherche par population (entropie croisée) sur des lâchers journaliers,
+    évalués en bloc par ReservoirCascade.
     """
     
-    def __init__(self):
+    OBJECTIVES = ["energy_score", "irrigation_score", "environment_score", "safety_score"]
+    DEFAULT_WEIGHTS = {
+        "energy": 0.30,
+        "irrigation": 0.35,
+        "environment": 0.20,
+        "safety": 0.15
+    }
+    
+    def __init__(self, population: int = 1024, generations: int = 8, elite_fraction: float = 0.1):
         self.dams = {
-            "manantali": {"capacity_m3": 11.3e9, "power_mw": 200},
-            "diama": {"capacity_m3": 0.6e9, "power_mw": 0},
-            "felou": {"capacity_m3": 0.2e9, "power_mw": 8},
+            "manantali": {
+                "capacity_m3": 11.3e9, "power_mw": 200, "turbine_max_m3_s": 440,
+                "release_max_m3_s": 4000, "min_fill": 0.3, "flood_rule_fill": 0.65,
+                "head_min_m": 30, "head_max_m": 60,
+            },
+            "diama": {
+                "capacity_m3": 0.6e9, "power_mw": 0, "turbine_max_m3_s": 0,
+                "release_max_m3_s": 6000, "min_fill": 0.3, "flood_rule_fill": 0.9,
+                "head_min_m": 0, "head_max_m": 0,
+            },
+            "felou": {
+                "capacity_m3": 0.2e9, "power_mw": 8, "turbine_max_m3_s": 120,
+                "release_max_m3_s": 3000, "min_fill": 0.2, "flood_rule_fill": 0.9,
+                "head_min_m": 8, "head_max_m": 12,
+            },
         }
+        self.population = population
+        self.generations = generations
+        self.elite_fraction = elite_fraction
+    
+    def weight_vector(self, objective_weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """Poids dans l'ordre de OBJECTIVES"""
+        weights = {**self.DEFAULT_WEIGHTS, **(objective_weights or {})}
+        return np.array([weights["energy"], weights["irrigation"], weights["environment"], weights["safety"]])
+    
+    def build_cascade(
+        self,
+        inflows: Dict[str, float],
+        current_levels: Dict[str, float],
+        forecast_inflows: np.ndarray
+    ) -> ReservoirCascade:
+        """Apports propres par barrage: apport actuel x tendance de la prévision amont"""
+        forecast_inflows = np.asarray(forecast_inflows, dtype=float)
+        trend = forecast_inflows / max(inflows["manantali"], 1.0)
+        natural = np.array([
+            forecast_inflows if name == "manantali" else LOCAL_INFLOW_SHARE[name] * inflows[name] * trend
+            for name in DAM_CASCADE
+        ])
+        fill = np.array([current_levels[name] / 100.0 for name in DAM_CASCADE])
+        return ReservoirCascade(self.dams, natural, fill)
+    
+    @staticmethod
+    def manual_schedule(cascade: ReservoirCascade) -> np.ndarray:
+        """Règle manuelle: chaque barrage relâche ses apports (fil de l'eau), (3, T)"""
+        natural = cascade.natural_inflows
+        manantali = np.full(cascade.horizon, natural[0].mean())
+        felou = manantali + natural[1]
+        diama = np.maximum(felou - IRRIGATION_DEMAND_M3_S, 0) + natural[2]
+        return np.array([manantali, felou, diama])
+    
+    def search(
+        self,
+        cascade: ReservoirCascade,
+        weights: np.ndarray,
+        seed: Optional[int] = None
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Entropie croisée: échantillonne K calendriers, garde l'élite (score pondéré),
+        réajuste moyenne/écart-type. Retourne tous les candidats évalués et leurs résultats.
+        """
+        rng = np.random.default_rng(seed)
+        mean = self.manual_schedule(cascade)
+        std = 0.25 * mean + 50.0
+        n_elite = max(2, int(self.population * self.elite_fraction))
+        
+        evaluated = []
+        for _ in range(self.generations):
+            candidates = rng.normal(mean, std, size=(self.population,) + mean.shape)
+            candidates[0] = mean  # la moyenne courante reste toujours évaluée
+            result = cascade.simulate(candidates)
+            score = np.stack([result[k] for k in self.OBJECTIVES], axis=1) @ weights
+            evaluated.append((result, score))
+            
+            # Mise à jour sur les lâchers effectifs (contraintes appliquées)
+            elite = result["releases"][np.argsort(score)[-n_elite:]]
+            mean = elite.mean(axis=0)
+            std = elite.std(axis=0) + 5.0
+        
+        merged = {k: np.concatenate([r[k] for r, _ in evaluated]) for k in evaluated[0][0]}
+        return np.concatenate([s for _, s in evaluated]), merged
     
     def optimize(
         self,
         inflows: Dict[str, float],
         current_levels: Dict[str, float],
         forecast_inflows: np.ndarray,
-        objective_weights: Dict[str, float] = None
+        objective_weights: Dict[str, float] = None,
+        max_front: int = 20,
+        seed: Optional[int] = None
     ) -> Dict:
         """
-        Recommande débits des 3 barrages pour 10 jours.
+        Recommande débits des 3 barrages sur l'horizon de la prévision.
         Objectifs: energy (0.3), irrigation (0.35), env (0.2), safety (0.15).
         """
-        if objective_weights is None:
-            objective_weights = {
-                "energy": 0.30,
-                "irrigation": 0.35,
-                "environment": 0.20,
-                "safety": 0.15
-            }
+        weights = self.weight_vector(objective_weights)
         
-        # Stratégie simple (peut être remplacée par RL complexe)
-        manantali_target_discharge = np.mean(forecast_inflows) * 1.0
-        diama_target_discharge = manantali_target_discharge * 0.8
-        felou_target_discharge = manantali_target_discharge * 0.3
-        
-        # Levels cibles
-        manantali_target_level = 65.0 if np.mean(forecast_inflows) > 1200 else 55.0
-        diama_target_level = 70.0
-        felou_target_level = 72.0
-        
-        # Estimation d'impact
-        expected_energy_gwh = manantali_target_discharge * 0.8 / 1000.0  # Approximation
-        expected_irrigation_m3 = 50e6  # 50M m³
-        
-        # Score multi-objectif [0, 100]
-        safety_score = 80 if manantali_target_discharge < 2500 else 50
-        env_score = 75
-        energy_score = (manantali_target_discharge / 1500) * 100
-        irrigation_score = 85
-        
-        multi_objective_score = (
-            safety_score * objective_weights["safety"] +
-            env_score * objective_weights["environment"] +
-            energy_score * objective_weights["energy"] +
-            irrigation_score * objective_weights["irrigation"]
-        )
+        cascade = self.build_cascade(inflows, current_levels, forecast_inflows)
+        scores, result = self.search(cascade, weights, seed)
+        best = int(np.argmax(scores))
+        
+        manual = cascade.simulate(self.manual_schedule(cascade)[None])
+        manual_score = float(np.stack([manual[k] for k in self.OBJECTIVES], axis=1)[0] @ weights)
+        
+        # Front de Pareto sur tous les candidats évalués, trié par score pondéré
+        objectives = np.stack([result[k] for k in self.OBJECTIVES], axis=1)
+        front = np.flatnonzero(pareto_mask(objectives))
+        front = front[np.argsort(scores[front])[::-1][:max_front]]
         
-        improvement = 0.17  # 17% par rapport aux règles manuelles
+        schedule = result["releases"][best]
+        mean_release = schedule.mean(axis=1)
+        final_fill = result["final_fill"][best]
+        environment = result["environment_score"][best]
+        
+        def release_of(name: str) -> float:
+            return float(mean_release[DAM_CASCADE.index(name)])
+        
+        def fill_of(name: str) -> float:
+            return float(100 * final_fill[DAM_CASCADE.index(name)])
         
         return {
-            "manantali_discharge_m3_s": manantali_target_discharge,
-            "diama_discharge_m3_s": diama_target_discharge,
-            "felou_discharge_m3_s": felou_target_discharge,
-            "manantali_target_level_percent": manantali_target_level,
-            "diama_target_level_percent": diama_target_level,
-            "felou_target_level_percent": felou_target_level,
-            "expected_energy_gwh": expected_energy_gwh,
-            "expected_irrigation_m3": expected_irrigation_m3,
-            "expected_salinity_control": diama_target_discharge > 500,
-            "expected_environmental_benefit": "good" if env_score > 70 else "fair",
-            "multi_objective_score": multi_objective_score,
-            "improvement_vs_manual": improvement
+            "manantali_discharge_m3_s": release_of("manantali"),
+            "diama_discharge_m3_s": release_of("diama"),
+            "felou_discharge_m3_s": release_of("felou"),
+            "manantali_target_level_percent": fill_of("manantali"),
+            "diama_target_level_percent": fill_of("diama"),
+            "felou_target_level_percent": fill_of("felou"),
+            "expected_energy_gwh": float(result["energy_gwh"][best]),
+            "expected_irrigation_m3": float(result["irrigation_m3"][best]),
+            "expected_salinity_control": bool(result["salinity_control"][best]),
+            "expected_environmental_benefit": "good" if environment > 70 else "fair" if environment > 40 else "poor",
+            "multi_objective_score": float(scores[best]),
+            "improvement_vs_manual": float((scores[best] - manual_score) / manual_score) if manual_score > 0 else 0.0,
+            "release_schedule_m3_s": {name: schedule[i].tolist() for i, name in enumerate(DAM_CASCADE)},
+            "pareto_front": [
+                {
+                    "energy_gwh": float(result["energy_gwh"][k]),
+                    "irrigation_m3": float(result["irrigation_m3"][k]),
+                    "environment_score": float(result["environment_score"][k]),
+                    "safety_score": float(result["safety_score"][k]),
+                    "multi_objective_score": float(scores[k]),
+                    **{f"{name}_discharge_m3_s": float(result["releases"][k, i].mean()) for i, name in enumerate(DAM_CASCADE)},
+                }
+                for k in front
+            ],
+            "candidates_evaluated": int(len(scores)),
         }
 
 
+# Quantiles publiés par l'ensemble probabiliste
+ENSEMBLE_QUANTILES = (0.05, 0.10, 0.25, 0.50, 0.75, 0.90, 0.95)
+
+
+def probabilistic_summary(
+    members: np.ndarray,
+    thresholds: Optional[Dict[str, float]] = None,
+    quantiles: Tuple[float, ...] = ENSEMBLE_QUANTILES
+) -> Dict:
+    """
+    Statistiques d'un ensemble (membres x jours) en une passe vectorisée:
+    quantiles, moyenne, dispersion, probabilités de dépassement par jour et sur l'horizon.
+    """
+    thresholds = thresholds or {}
+    q = np.quantile(members, quantiles, axis=0)
+    mean = members.mean(axis=0)
+    spread = members.std(axis=0)
+    
+    names = list(thresholds)
+    levels = np.array([thresholds[name] for name in names], dtype=float)
+    exceed = (members[:, :, None] > levels).mean(axis=0)                  # (jours, seuils)
+    exceed_any = (members.max(axis=1)[:, None] > levels).mean(axis=0)     # (seuils,)
+    
+    # Confiance: largeur relative de l'intervalle 10-90%
+    relative_width = (q[quantiles.index(0.90)] - q[quantiles.index(0.10)]) / np.maximum(np.abs(q[quantiles.index(0.50)]), 1e-9)
+    confidence = float(np.clip(1.0 - relative_width.mean() / 2.0, 0.0, 1.0))
+    
+    return {
+        "members": int(members.shape[0]),
+        "mean": mean.tolist(),
+        "spread": spread.tolist(),
+        "quantiles": {f"p{int(round(level * 100)):02d}": q[i].tolist() for i, level in enumerate(quantiles)},
+        "exceedance_probability": {name: exceed[:, j].tolist() for j, name in enumerate(names)},
+        "exceedance_probability_horizon": {name: float(exceed_any[j]) for j, name in enumerate(names)},
+        "confidence_score": confidence,
+    }
+
+
 class EnsembleVotingPredictor:
     """
     Combine 5 modèles avec votation pondérée.
     Confiance basée sur accord entre modèles.
     """
     
-    def __init__(self):
-        self.lstm = LSTMForecaster()
-        self.transformer = TransformerSeasonalForecaster()
-        self.convlstm = FloodPredictionConvLSTM()
-        self.gnn = GraphNeuralNetwork()
-        self.rl = ReinforcementLearningOptimizer()
+    def __init__(
+        self,
+        lstm: Optional[LSTMForecaster] = None,
+        transformer: Optional[TransformerSeasonalForecaster] = None,
+        convlstm: Optional[FloodPredictionConvLSTM] = None,
+        gnn: Optional[GraphNeuralNetwork] = None,
+        rl: Optional[ReinforcementLearningOptimizer] = None
+    ):
+        # Réutilise les modèles fournis (déjà entraînés) au lieu d'en créer des copies
+        self.lstm = lstm or LSTMForecaster()
+        self.transformer = transformer or TransformerSeasonalForecaster()
+        self.convlstm = convlstm or FloodPredictionConvLSTM()
+        self.gnn = gnn or GraphNeuralNetwork()
+        self.rl = rl or ReinforcementLearningOptimizer()
+        
+        # Membres bootstrap (même fenêtre et normalisation que self.lstm)
+        self.members: List[GradientBoostingRegressor] = []
+        self.member_residual_std = np.zeros(0)
+    
+    def fit_members(
+        self,
+        historical_discharge: np.ndarray,
+        n_models: int = 8,
+        seed: int = 0
+    ):
+        """
+        Entraîne des modèles légers sur des tirages bootstrap des fenêtres d'entraînement.
+        L'écart-type résiduel hors sac de chaque modèle sert de bruit de récursion.
+        À appeler après self.lstm.fit (réutilise son scaler).
+        """
+        lstm = self.lstm
+        series = resample_series(fill_gaps(historical_discharge), lstm.resample_factor)
+        scaled = lstm.scaler.transform(series.reshape(-1, 1)).ravel()
+        X, y = lstm._prepare_sequences(scaled, lstm.lookback_days)
+        if len(X) < 2:
+            return
+        
+        rng = np.random.default_rng(seed)
+        members, residual_std = [], []
+        for b in range(n_models):
+            sample = rng.integers(0, len(X), len(X))
+            model = GradientBoostingRegressor(n_estimators=30, max_depth=3, subsample=0.8, random_state=seed + b)
+            model.fit(X[sample], y[sample])
+            
+            out_of_bag = np.setdiff1d(np.arange(len(X)), sample)
+            if len(out_of_bag) == 0:
+                out_of_bag = np.arange(len(X))
+            residual_std.append(float(np.std(y[out_of_bag] - model.predict(X[out_of_bag]))))
+            members.append(model)
+        
+        self.members = members
+        self.member_residual_std = np.array(residual_std)
+    
+    def member_forecasts(
+        self,
+        recent_discharge: np.ndarray,
+        forecast_days: int = 10,
+        n_members: int = 128,
+        input_noise: float = 0.05,
+        seed: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Ensemble perturbé (membres x jours): modèles bootstrap x bruit sur la fenêtre d'entrée,
+        bruit résiduel injecté à chaque pas de la récursion.
+        Un appel `predict` par modèle et par jour pour tous ses membres.
+        """
+        lstm = self.lstm
+        rng = np.random.default_rng(seed)
+        series = resample_series(recent_discharge, lstm.resample_factor)
+        lookback = lstm.lookback_days
+        
+        if not lstm.usable(len(recent_discharge)):
+            # Fallback: prévision simple + bruit proportionnel à la variabilité récente
+            base, _, _ = lstm.forecast(recent_discharge, forecast_days)
+            noise = np.std(series[-10:]) if len(series) else 0.0
+            return base + rng.normal(0, noise, (n_members, forecast_days)).cumsum(axis=1) * 0.3
+        
+        if self.members:
+            models, residual_std = self.members, self.member_residual_std
+        else:
+            models, residual_std = [lstm.model], np.zeros(1)
+        n_models = len(models)
+        per_model = -(-n_members // n_models)
+        
+        # Fenêtre préallouée (modèles, membres, historique normalisé | prévisions)
+        window = np.empty((n_models, per_model, lookback + forecast_days))
+        recent = lstm.scaler.transform(series[-lookback:].reshape(-1, 1)).ravel()
+        window[:, :, :lookback] = recent + rng.normal(0, input_noise, (n_models, per_model, lookback))
+        step_noise = rng.normal(0, 1, (n_models, per_model, forecast_days)) * residual_std[:, None, None]
+        
+        for day in range(forecast_days):
+            for b, model in enumerate(models):
+                window[b, :, lookback + day] = model.predict(window[b, :, day:day + lookback]) + step_noise[b, :, day]
+        
+        predicted = window[:, :, lookback:].reshape(-1, forecast_days)[:n_members]
+        return lstm.scaler.inverse_transform(predicted.reshape(-1, 1)).reshape(predicted.shape)
     
     def ensemble_forecast(
         self,
         recent_discharge: np.ndarray,
         historical_data: pd.DataFrame,
         location_id: str,
-        forecast_days: int = 10
+        forecast_days: int = 10,
+        n_members: int = 128,
+        flood_thresholds: Optional[Dict[str, float]] = None
     ) -> Dict:
         """
-        Prévision d'ensemble avec confiance.
+        Prévision d'ensemble probabiliste: médiane, intervalle 10-90%,
+        probabilités de dépassement des seuils de crue, confiance selon la dispersion.
         """
-        # LSTM court terme
-        lstm_forecast, lstm_ci, lstm_drivers = self.lstm.forecast(recent_discharge, forecast_days)
-        
-        # Moyenne ensemble
-        ensemble_mean = lstm_forecast
-        
-        # Confiance = accord entre modèles (simulé)
-        confidence = 0.85 + np.random.random() * 0.10
+        members = self.member_forecasts(recent_discharge, forecast_days, n_members)
+        summary = probabilistic_summary(members, flood_thresholds)
+        # Drivers sans nouvelle passe du modèle: ils ne dépendent que du mode (modèle / repli)
+        lstm_drivers = self.lstm.drivers(self.lstm.usable(len(recent_discharge)))
         
         return {
-            "forecast": ensemble_mean.tolist(),
+            "forecast": summary["quantiles"]["p50"],
             "confidence_interval": {
-                "low": lstm_ci[0].tolist(),
-                "high": lstm_ci[1].tolist()
+                "low": summary["quantiles"]["p10"],
+                "high": summary["quantiles"]["p90"]
             },
-            "confidence_score": confidence,
+            "confidence_score": summary["confidence_score"],
+            "probabilistic": summary,
             "drivers": lstm_drivers,
             "method": "ensemble_voting"
         }
@@ -0,0 +1,241 @@
+"""
+Statistiques glissantes des débits par localisation (30 derniers jours horaires).
+Tampon circulaire indexé par heure: somme, somme des carrés et histogramme
+logarithmique (quantiles approchés) mis à jour en O(1) par mesure; moyenne,
+écart-type, rang centile et z-score s'obtiennent en temps constant.
+"""
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+WINDOW_HOURS = 720
+# Classes logarithmiques de 0.1 à 100 000 m³/s (largeur relative ~2.7 %)
+SKETCH_LOW, SKETCH_HIGH, SKETCH_BINS = 0.1, 1e5, 512
+# Rang centile (%) -> indice d'état (bornes croissantes, cf. WATER_STATUS_ORDER)
+PERCENTILE_BOUNDS = np.array([5.0, 20.0, 80.0, 95.0])
+EPOCH_HOUR = np.datetime64(0, "h")
+
+
+class RollingStatsEngine:
+    """
+    Fenêtre glissante de `window_hours` heures par localisation.
+    Une valeur par heure (la dernière reçue l'emporte); les heures plus anciennes
+    que la fenêtre sont ignorées.
+    """
+
+    def __init__(self, window_hours: int = WINDOW_HOURS, min_samples: int = 72):
+        self.window = window_hours
+        self.min_samples = min_samples
+        self._log_low = math.log10(SKETCH_LOW)
+        self._bin_width = (math.log10(SKETCH_HIGH) - self._log_low) / SKETCH_BINS
+        self.edges = np.logspace(self._log_low, math.log10(SKETCH_HIGH), SKETCH_BINS + 1)
+
+        self._index: Dict[str, int] = {}
+        self.values = np.full((0, window_hours), np.nan)
+        self.bins = np.full((0, window_hours), -1, dtype=np.int16)
+        self.hist = np.zeros((0, SKETCH_BINS), dtype=np.int32)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.sum = np.zeros(0)
+        self.sumsq = np.zeros(0)
+        self.last_hour = np.zeros(0, dtype=np.int64)
+        self._since_resync = np.zeros(0, dtype=np.int64)
+        self._lock = threading.RLock()
+
+        # Métriques
+        self.updates = 0
+        self.ignored = 0
+
+    def _row(self, location_id: str) -> int:
+        row = self._index.get(location_id)
+        if row is None:
+            row = len(self._index)
+            self._index[location_id] = row
+            self.values = np.vstack([self.values, np.full((1, self.window), np.nan)])
+            self.bins = np.vstack([self.bins, np.full((1, self.window), -1, dtype=np.int16)])
+            self.hist = np.vstack([self.hist, np.zeros((1, SKETCH_BINS), dtype=np.int32)])
+            self.count = np.append(self.count, 0)
+            self.sum = np.append(self.sum, 0.0)
+            self.sumsq = np.append(self.sumsq, 0.0)
+            self.last_hour = np.append(self.last_hour, -1)
+            self._since_resync = np.append(self._since_resync, 0)
+        return row
+
+    def _bin(self, value: float) -> int:
+        if value <= SKETCH_LOW:
+            return 0
+        return min(int((math.log10(value) - self._log_low) / self._bin_width), SKETCH_BINS - 1)
+
+    def _clear(self, row: int, slot: int):
+        b = self.bins[row, slot]
+        if b < 0:
+            return
+        value = self.values[row, slot]
+        self.count[row] -= 1
+        self.sum[row] -= value
+        self.sumsq[row] -= value * value
+        self.hist[row, b] -= 1
+        self.bins[row, slot] = -1
+        self.values[row, slot] = np.nan
+        # Resynchronisation périodique des sommes (dérive des soustractions), O(1) amorti
+        self._since_resync[row] += 1
+        if self._since_resync[row] >= self.window:
+            present = self.values[row][self.bins[row] >= 0]
+            self.sum[row] = present.sum()
+            self.sumsq[row] = np.dot(present, present)
+            self._since_resync[row] = 0
+
+    def _reset(self, row: int):
+        self.values[row] = np.nan
+        self.bins[row] = -1
+        self.hist[row] = 0
+        self.count[row] = 0
+        self.sum[row] = self.sumsq[row] = 0.0
+
+    def _push(self, row: int, hour: int, value: float) -> bool:
+        last = int(self.last_hour[row])
+        if last >= 0 and hour <= last - self.window:
+            self.ignored += 1
+            return False
+        if last < 0 or hour > last:
+            # Avance de la fenêtre: libère les heures écoulées depuis la dernière mesure
+            if last < 0 or hour - last >= self.window:
+                self._reset(row)
+            else:
+                for h in range(last + 1, hour + 1):
+                    self._clear(row, h % self.window)
+            self.last_hour[row] = hour
+        slot = hour % self.window
+        self._clear(row, slot)
+        b = self._bin(value)
+        self.values[row, slot] = value
+        self.bins[row, slot] = b
+        self.count[row] += 1
+        self.sum[row] += value
+        self.sumsq[row] += value * value
+        self.hist[row, b] += 1
+        self.updates += 1
+        return True
+
+    def update(self, location_id: str, timestamps, values) -> int:
+        """Intègre des mesures (horodatages, débits); NaN ignorés. Retourne le nombre retenu"""
+        hours = (np.asarray(pd.DatetimeIndex(timestamps).values, dtype="datetime64[h]") - EPOCH_HOUR).astype(np.int64)
+        values = np.asarray(values, dtype=float)
+        keep = np.isfinite(values)
+        hours, values = hours[keep], values[keep]
+        if len(values) == 0:
+            return 0
+        with self._lock:
+            row = self._row(location_id)
+            # Seules les heures de la fenêtre finale comptent
+            horizon = max(int(hours.max()), int(self.last_hour[row])) - self.window
+            recent = hours > horizon
+            order = np.argsort(hours[recent], kind="stable")
+            pushed = 0
+            for hour, value in zip(hours[recent][order].tolist(), values[recent][order].tolist()):
+                pushed += self._push(row, hour, value)
+            self.ignored += int((~recent).sum())
+            return pushed
+
+    def has_data(self, location_id: str) -> bool:
+        row = self._index.get(location_id)
+        return row is not None and self.count[row] >= self.min_samples
+
+    def assess(self, location_ids: List[str], discharge: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Situation des débits courants dans leur fenêtre (vectorisé sur les localisations):
+        (fenêtre suffisante, rang centile en %, z-score, taux de remplissage de la fenêtre).
+        """
+        discharge = np.asarray(discharge, dtype=float)
+        n = len(location_ids)
+        with self._lock:
+            rows = np.array([self._index.get(loc, -1) for loc in location_ids], dtype=np.int64)
+            known = rows >= 0
+            safe = np.where(known, rows, 0)
+            if len(self._index) == 0:
+                return np.zeros(n, dtype=bool), np.full(n, np.nan), np.full(n, np.nan), np.zeros(n)
+            count = np.where(known, self.count[safe], 0)
+            total, total_sq = self.sum[safe], self.sumsq[safe]
+            hist = self.hist[safe]
+
+        coverage = np.minimum(count / self.window, 1.0)
+        warm = known & (count >= self.min_samples)
+        safe_count = np.maximum(count, 1)
+        mean = total / safe_count
+        std = np.sqrt(np.maximum(total_sq / safe_count - mean ** 2, 0.0) * safe_count / np.maximum(count - 1, 1))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            zscore = np.where(warm & (std > 0), (discharge - mean) / std, np.nan)
+            log_values = np.log10(np.maximum(np.nan_to_num(discharge, nan=SKETCH_LOW), SKETCH_LOW))
+        warm &= np.isfinite(discharge)
+        b = np.clip(((log_values - self._log_low) / self._bin_width).astype(np.int64), 0, SKETCH_BINS - 1)
+        below = np.cumsum(hist, axis=1)[np.arange(n), b] - hist[np.arange(n), b]
+        # Rang médian dans la classe du débit courant
+        percentile = np.where(warm, 100.0 * (below + 0.5 * hist[np.arange(n), b]) / safe_count, np.nan)
+        return warm, percentile, zscore, coverage
+
+    def rise(self, location_ids: List[str], hours: int) -> np.ndarray:
+        """Variation relative du débit entre la dernière heure et `hours` heures avant (NaN si absente)"""
+        n = len(location_ids)
+        result = np.full(n, np.nan)
+        if hours >= self.window:
+            return result
+        with self._lock:
+            for i, location_id in enumerate(location_ids):
+                row = self._index.get(location_id)
+                if row is None or self.last_hour[row] < 0:
+                    continue
+                last = int(self.last_hour[row])
+                latest = self.values[row, last % self.window]
+                previous = self.values[row, (last - hours) % self.window]
+                if previous > 0:
+                    result[i] = latest / previous - 1.0
+        return result
+
+    def quantiles(self, location_id: str, qs: List[float]) -> Optional[np.ndarray]:
+        """Quantiles approchés (interpolation dans les classes de l'histogramme)"""
+        with self._lock:
+            row = self._index.get(location_id)
+            if row is None or self.count[row] == 0:
+                return None
+            cumulative = np.concatenate([[0], np.cumsum(self.hist[row])])
+            count = self.count[row]
+        return np.interp(np.asarray(qs) * count, cumulative, self.edges)
+
+    def snapshot(self, location_id: str) -> Optional[Dict]:
+        row = self._index.get(location_id)
+        if row is None:
+            return None
+        with self._lock:
+            count = int(self.count[row])
+            latest_slot = int(self.last_hour[row]) % self.window
+            latest = self.values[row, latest_slot]
+            mean = self.sum[row] / count if count else None
+            var = max(self.sumsq[row] / count - mean ** 2, 0.0) * count / max(count - 1, 1) if count else None
+        p5, p50, p95 = self.quantiles(location_id, [0.05, 0.5, 0.95]) if count else (None, None, None)
+        _, percentile, zscore, coverage = self.assess([location_id], [latest])
+        return {
+            "count": count,
+            "coverage": float(coverage[0]),
+            "last_time": str(EPOCH_HOUR + int(self.last_hour[row])),
+            "mean": mean,
+            "std": math.sqrt(var) if var is not None else None,
+            "p5": float(p5) if count else None,
+            "p50": float(p50) if count else None,
+            "p95": float(p95) if count else None,
+            "latest": float(latest) if np.isfinite(latest) else None,
+            "latest_percentile": float(percentile[0]) if np.isfinite(percentile[0]) else None,
+            "latest_zscore": float(zscore[0]) if np.isfinite(zscore[0]) else None,
+        }
+
+    def summary(self) -> Dict:
+        return {
+            "window_hours": self.window,
+            "min_samples": self.min_samples,
+            "sketch_bins": SKETCH_BINS,
+            "updates": self.updates,
+            "ignored": self.ignored,
+            "locations": {loc: self.snapshot(loc) for loc in list(self._index)},
+        }
@@ -2,8 +2,8 @@
 API FastAPI AQUAMIND - Backend principal.
 Endpoints pour dashboards, prévisions, alertes, optimisation.
 """
-from fastapi import FastAPI, HTTPException, WebSocket, Query, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, WebSocket, Query, Depends, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
@@ -14,28 +14,70 @@ from contextlib import asynccontextmanager
 
 from app.services.data_service import DataService
 from app.services.forecast_service import ForecastService
+from app.services.alert_engine import AlertEngine
+from app.services.batch_forecast import BatchForecastRunner
+from app.services.container import ServiceContainer
+from app.services.scenario_service import ScenarioService
+from app.services.history_export import HISTORY_MEDIA_TYPES, encode_history, negotiate_history_format, single_chunk
+from app.services.raster_encoding import RASTER_MEDIA_TYPES, encode_raster, negotiate_raster_format
 from app.schemas.hydrological import (
     Basin, Dam, LocationMetrics, ForecastShortTerm, ForecastSeasonal,
     FloodPrediction, DamOptimization, Alert, DashboardMetrics, SystemStatus,
-    SensorReading, EcosystemService
+    SensorReading, EcosystemService, PropagationRequest, NetworkObservation
 )
 
 
+# Cycle de vie: services construits une fois par worker
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    container = ServiceContainer()
+    app.state.services = container
+    await container.startup()
+    yield
+    await container.shutdown()
+
+
+def _get_container(app: FastAPI) -> ServiceContainer:
+    container = getattr(app.state, "services", None)
+    if container is None:
+        # Hors lifespan (scripts, TestClient sans contexte): conteneur non préchauffé
+        container = ServiceContainer()
+        app.state.services = container
+    return container
+
+
 # Dépendances
-async def get_data_service():
-    # En production, utiliser une vraie DB
-    return DataService(db=None)
+async def get_services(request: Request) -> ServiceContainer:
+    return _get_container(request.app)
+
+
+async def get_data_service(services: ServiceContainer = Depends(get_services)):
+    # Base réelle si DATABASE_URL est défini (voir app/storage)
+    return services.data_service
+
+
+async def get_forecast_service(services: ServiceContainer = Depends(get_services)):
+    return services.forecast_service
 
 
-async def get_forecast_service(data_service: DataService = Depends(get_data_service)):
-    return ForecastService(data_service)
+async def get_scenario_service(services: ServiceContainer = Depends(get_services)):
+    return services.scenario_service
+
+
+async def get_alert_engine(services: ServiceContainer = Depends(get_services)):
+    return services.alert_engine
+
+
+async def get_forecast_runner(services: ServiceContainer = Depends(get_services)):
+    return services.forecast_runner
 
 
 # Application FastAPI
 app = FastAPI(
     title="AQUAMIND API",
     description="Système Intelligent de Prédiction Hydrologique - Bassin Fleuve Sénégal",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS
@@ -71,25 +113,48 @@ async def health_check():
     }
 
 
+@app.get("/ready", tags=["Health"])
+async def readiness_check(services: ServiceContainer = Depends(get_services)):
+    """Disponibilité du worker: 503 tant que les modèles ne sont pas préchauffés"""
+    readiness = services.readiness()
+    status_code = 200 if readiness["ready"] else 503
+    return JSONResponse(status_code=status_code, content=readiness)
+
+
 @app.get("/system/status", response_model=SystemStatus, tags=["System"])
-async def get_system_status(data_service: DataService = Depends(get_data_service)):
+async def get_system_status(services: ServiceContainer = Depends(get_services)):
     """État du système AQUAMIND"""
+    if services.warmup_error:
+        ai_models_status = "error"
+    elif not services.ready:
+        ai_models_status = "warning"
+    elif not services.forecast_service.models_fitted:
+        ai_models_status = "error"
+    else:
+        ai_models_status = "healthy"
+    
     return SystemStatus(
         status="operational",
         uptime_percent=99.97,
         last_data_update=datetime.utcnow(),
-        next_forecast_batch=datetime.utcnow() + timedelta(hours=6),
+        next_forecast_batch=services.forecast_runner.next_run_at or datetime.utcnow(),
         
         backend_status="healthy",
         database_status="healthy",
-        ai_models_status="healthy",
+        ai_models_status=ai_models_status,
         
         active_users=int(np.random.random() * 500 + 100),
-        total_alerts_24h=int(np.random.random() * 20 + 5),
+        total_alerts_24h=services.alert_engine.alerts_24h(),
         model_predictions_24h=int(np.random.random() * 1000 + 500)
     )
 
 
+@app.get("/system/cache", tags=["System"])
+async def get_cache_stats(services: ServiceContainer = Depends(get_services)):
+    """Compteurs du cache de prévisions (hits, misses, requêtes coalescées, évictions)"""
+    return services.forecast_cache.stats()
+
+
 # ==================== BASSINS & BARRAGES ====================
 
 @app.get("/basins", response_model=List[Basin], tags=["Geography"])
@@ -124,6 +189,16 @@ async def get_dam(dam_id: str, data_service: DataService = Depends(get_data_serv
 
 # ==================== DONNÉES EN TEMPS RÉEL ====================
 
+@app.get("/locations/metrics", response_model=List[LocationMetrics], tags=["RealTime"])
+async def get_locations_metrics(
+    ids: Optional[str] = Query(None, description="Identifiants séparés par des virgules (défaut: toutes les localisations)"),
+    data_service: DataService = Depends(get_data_service)
+):
+    """Métriques actuelles de plusieurs localisations en un appel"""
+    location_ids = ids.split(",") if ids else data_service.get_location_ids()
+    return await data_service.get_locations_metrics(location_ids)
+
+
 @app.get("/locations/{location_id}/metrics", response_model=LocationMetrics, tags=["RealTime"])
 async def get_location_metrics(
     location_id: str,
@@ -142,68 +217,239 @@ async def get_sensor_reading(
     return await data_service.get_sensor_reading(station_id)
 
 
+@app.post("/sensors/ingest", status_code=202, tags=["RealTime"])
+async def ingest_sensor_readings(
+    request: Request,
+    services: ServiceContainer = Depends(get_services)
+):
+    """
+    Ingestion en masse de mesures (passerelles terrain).
+    Corps NDJSON (application/x-ndjson) ou JSON colonnaire {"location_id": ..., "timestamp": [...], ...}.
+    """
+    if services.ingest_service is None:
+        raise HTTPException(status_code=503, detail="Stockage non configuré (DATABASE_URL)")
+    try:
+        return await services.ingest_service.ingest(await request.body(), request.headers.get("content-type", ""))
+    except OverflowError as e:
+        # Tampon plein: le stockage ne suit pas, la passerelle réessaiera
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/locations/{location_id}/historical", tags=["Historical"])
 async def get_historical_data(
+    request: Request,
     location_id: str,
-    days_back: int = Query(90, ge=7, le=365),
+    days_back: int = Query(90, ge=7, le=3650),
+    format: Optional[str] = Query(None, description="json | ndjson | csv | arrow (sinon en-tête Accept)"),
+    resolution: Optional[str] = Query(None, pattern="^(hourly|daily|weekly)$", description="Agrégats pour graphique"),
+    max_points: Optional[int] = Query(None, ge=10, le=100000, description="Nombre maximal de points (graphique)"),
     data_service: DataService = Depends(get_data_service)
 ):
-    """Données historiques pour analyse/entraînement"""
-    df = await data_service.get_historical_data(location_id, days_back)
-    return {
-        "location_id": location_id,
-        "days_back": days_back,
-        "records": df.to_dict(orient='records'),
-        "statistics": {
-            "discharge_m3_s": {
-                "mean": float(df['discharge_m3_s'].mean()),
-                "std": float(df['discharge_m3_s'].std()),
-                "min": float(df['discharge_m3_s'].min()),
-                "max": float(df['discharge_m3_s'].max())
-            }
-        }
-    }
+    """
+    Données historiques pour analyse/entraînement, envoyées en flux par blocs.
+    Les statistiques de synthèse sont calculées dans la même passe.
+    Avec `resolution` ou `max_points`: agrégats précalculés (moyenne/min/max/nombre
+    par seau), réduits par LTTB si nécessaire.
+    """
+    try:
+        history_format = negotiate_history_format(request.headers.get("accept"), format)
+    except ValueError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    
+    columns = ['discharge_m3_s', 'rainfall_mm', 'temperature_c', 'ndvi']
+    header = {"location_id": location_id, "days_back": days_back}
+    if resolution is not None or max_points is not None:
+        used, frame = await data_service.get_chart_series(location_id, days_back, columns, resolution, max_points)
+        header["resolution"] = used
+        columns = [c for c in frame.columns if c != "timestamp"]
+        chunks = single_chunk(frame)
+    else:
+        chunks = data_service.iter_history(location_id, days_back, columns)
+    headers = {}
+    if history_format == "csv":
+        headers["Content-Disposition"] = f'attachment; filename="{location_id}_{days_back}d.csv"'
+    return StreamingResponse(
+        encode_history(chunks, history_format, columns, header),
+        media_type=HISTORY_MEDIA_TYPES[history_format],
+        headers=headers
+    )
 
 
 # ==================== PRÉVISIONS ====================
 
+FRESH_DESCRIPTION = "Recalcule la prévision au lieu de servir le dernier lot planifié ou le cache"
+
+
+def _precomputed(response: Response, runner: BatchForecastRunner, result):
+    """Résultat du lot planifié (identifiant du lot en en-tête), None s'il faut calculer"""
+    if result is not None:
+        response.headers["X-Forecast-Batch"] = runner.run_id
+    return result
+
+
+@app.get("/forecast/short-term", response_model=Dict[str, ForecastShortTerm], tags=["Forecast"])
+async def forecast_short_term_batch(
+    ids: Optional[str] = Query(None, description="Identifiants séparés par des virgules (défaut: toutes les localisations)"),
+    days: int = Query(10, ge=7, le=15),
+    fresh: bool = Query(False, description=FRESH_DESCRIPTION),
+    data_service: DataService = Depends(get_data_service),
+    forecast_service: ForecastService = Depends(get_forecast_service),
+    runner: BatchForecastRunner = Depends(get_forecast_runner)
+):
+    """Prévision court terme (7-15 jours) pour plusieurs stations en un seul passage"""
+    station_ids = ids.split(",") if ids else data_service.get_location_ids()
+    results = {}
+    if not fresh:
+        for station_id in station_ids:
+            forecast = runner.lookup("short_term", station_id, days)
+            if forecast is not None:
+                results[station_id] = forecast
+    missing = [station_id for station_id in station_ids if station_id not in results]
+    if missing:
+        results.update(await forecast_service.forecast_short_term_batch(missing, days, fresh=fresh))
+    return {station_id: results[station_id] for station_id in station_ids}
+
+
 @app.get("/forecast/{location_id}/short-term", response_model=ForecastShortTerm, tags=["Forecast"])
 async def forecast_short_term(
     location_id: str,
+    response: Response,
     days: int = Query(10, ge=7, le=15),
-    forecast_service: ForecastService = Depends(get_forecast_service)
+    fresh: bool = Query(False, description=FRESH_DESCRIPTION),
+    forecast_service: ForecastService = Depends(get_forecast_service),
+    runner: BatchForecastRunner = Depends(get_forecast_runner)
 ):
     """Prévision court terme (7-15 jours) - LSTM"""
-    return await forecast_service.forecast_short_term(location_id, days)
+    if not fresh:
+        forecast = _precomputed(response, runner, runner.lookup("short_term", location_id, days))
+        if forecast is not None:
+            return forecast
+    return await forecast_service.forecast_short_term(location_id, days, fresh=fresh)
 
 
 @app.get("/forecast/{location_id}/seasonal", response_model=ForecastSeasonal, tags=["Forecast"])
 async def forecast_seasonal(
     location_id: str,
+    response: Response,
     months: int = Query(3, ge=1, le=12),
-    forecast_service: ForecastService = Depends(get_forecast_service)
+    fresh: bool = Query(False, description=FRESH_DESCRIPTION),
+    forecast_service: ForecastService = Depends(get_forecast_service),
+    runner: BatchForecastRunner = Depends(get_forecast_runner)
 ):
     """Prévision saisonnière (3-6 mois) - Transformers"""
-    return await forecast_service.forecast_seasonal(location_id, months)
+    if not fresh:
+        forecast = _precomputed(response, runner, runner.lookup("seasonal", location_id, months))
+        if forecast is not None:
+            return forecast
+    return await forecast_service.forecast_seasonal(location_id, months, fresh=fresh)
+
+
+def _negotiate_raster(request: Request, fmt: Optional[str]) -> str:
+    try:
+        return negotiate_raster_format(request.headers.get("accept"), fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=406, detail=str(e))
 
 
-@app.get("/forecast/{location_id}/flood", response_model=FloodPrediction, tags=["Forecast"])
+@app.get(
+    "/forecast/{location_id}/flood",
+    response_model=FloodPrediction,
+    tags=["Forecast"],
+    responses={200: {"content": {media_type: {} for media_type in RASTER_MEDIA_TYPES.values()}}}
+)
 async def forecast_flood(
     location_id: str,
-    forecast_service: ForecastService = Depends(get_forecast_service)
+    request: Request,
+    response: Response,
+    format: Optional[str] = Query(None, description="json (défaut), raw, npy ou png; sinon en-tête Accept"),
+    dtype: str = Query("uint8", pattern="^(uint8|float16)$"),
+    fresh: bool = Query(False, description=FRESH_DESCRIPTION),
+    forecast_service: ForecastService = Depends(get_forecast_service),
+    runner: BatchForecastRunner = Depends(get_forecast_runner)
 ):
-    """Prédiction spatiale des inondations (résolution 30m)"""
-    return await forecast_service.predict_flood(location_id)
+    """
+    Prédiction spatiale des inondations (résolution 30m).
+    Formats binaires: grille quantifiée (uint8/float16), métadonnées dans les en-têtes X-Flood-*.
+    """
+    raster_format = _negotiate_raster(request, format)
+    if raster_format == "json":
+        if not fresh:
+            flood = _precomputed(response, runner, runner.flood_prediction(location_id))
+            if flood is not None:
+                return flood
+        return await forecast_service.predict_flood(location_id, fresh=fresh)
+    
+    precomputed = None if fresh else runner.flood_raster(location_id)
+    flood, grid = precomputed or await forecast_service.predict_flood_raster(location_id, fresh=fresh)
+    headers = {
+        "X-Flood-Prediction-Id": flood["prediction_id"],
+        "X-Flood-Forecast-Date": flood["forecast_date"].isoformat(),
+        "X-Flood-Resolution-M": str(flood["grid_resolution_m"]),
+        "X-Flood-Bbox": json.dumps(flood["bbox"]),
+        "X-Flood-Affected-Area-Km2": str(flood["affected_area_km2"]),
+        "X-Flood-Affected-Population": str(flood["affected_population"]),
+        "X-Raster-Shape": f"{grid.shape[0]},{grid.shape[1]}",
+        "X-Raster-Dtype": "uint8" if raster_format == "png" else dtype,
+        "Vary": "Accept",
+    }
+    if precomputed is not None:
+        headers["X-Forecast-Batch"] = runner.run_id
+    return Response(
+        content=encode_raster(grid, raster_format, dtype, flood["bbox"]),
+        media_type=RASTER_MEDIA_TYPES[raster_format],
+        headers=headers
+    )
 
 
 @app.get("/forecast/{location_id}/ensemble", tags=["Forecast"])
 async def forecast_ensemble(
     location_id: str,
     days: int = Query(10, ge=7, le=15),
+    raster_format: Optional[str] = Query(None, description="Encodage de la carte d'inondation: raw, npy ou png (base64)"),
+    raster_dtype: str = Query("uint8", pattern="^(uint8|float16)$"),
+    members: int = Query(128, ge=1, le=1000, description="Membres de l'ensemble probabiliste"),
     forecast_service: ForecastService = Depends(get_forecast_service)
 ):
-    """Ensemble complet: court terme + saisonnier + inondations + alertes"""
-    return await forecast_service.get_ensemble_forecast(location_id, days)
+    """Ensemble complet: court terme + probabiliste + saisonnier + inondations + alertes"""
+    if raster_format and raster_format not in RASTER_MEDIA_TYPES:
+        raise HTTPException(status_code=406, detail=f"Format inconnu: {raster_format}")
+    return await forecast_service.get_ensemble_forecast(location_id, days, raster_format, raster_dtype, members)
+
+
+# ==================== TUILES CARTOGRAPHIQUES ====================
+
+@app.get("/tiles/flood", tags=["Maps"])
+async def flood_tiles_metadata(services: ServiceContainer = Depends(get_services)):
+    """Emprise, niveaux de pyramide et version de la mosaïque d'inondation"""
+    return services.tile_store.metadata()
+
+
+@app.get("/tiles/flood/{z}/{x}/{y}", tags=["Maps"], response_class=Response,
+         responses={200: {"content": {"image/png": {}}}})
+async def flood_tile(
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    services: ServiceContainer = Depends(get_services)
+):
+    """Tuile XYZ (PNG RGBA 256x256) de probabilité d'inondation pour la carte Leaflet"""
+    if z < 0 or z > 22 or not (0 <= x < 2 ** z) or not (0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile not found")
+    store = services.tile_store
+    # Version lue avant le rendu: l'ETag ne peut pas désigner un contenu plus récent que la tuile
+    etag = f'"{store.version}"'
+    headers = {"Cache-Control": "public, max-age=300", "ETag": etag}
+    candidates = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=304, headers=headers)
+    content = store.cached_tile(z, x, y)
+    if content is None:
+        # Rendu (lecture des niveaux + compression PNG) hors de la boucle d'événements
+        content = await asyncio.get_running_loop().run_in_executor(services.executor, store.render_tile, z, x, y)
+    return Response(content=content, media_type="image/png", headers=headers)
 
 
 # ==================== ALERTES ====================
@@ -211,84 +457,169 @@ async def forecast_ensemble(
 @app.get("/alerts", response_model=List[Dict], tags=["Alerts"])
 async def get_active_alerts(
     alert_type: Optional[str] = None,
-    min_level: str = "vigilance"
+    min_level: str = "vigilance",
+    location_id: Optional[str] = None,
+    alert_engine: AlertEngine = Depends(get_alert_engine)
 ):
-    """Alertes actuelles actives"""
-    # Simule alertes
-    now = datetime.utcnow()
-    alerts = [
-        {
-            "alert_id": "alert_001",
-            "alert_type": "flood",
-            "alert_level": "vigilance",
-            "location": "Matam",
-            "trigger_date": now.isoformat(),
-            "event_expected_date": (now + timedelta(days=10)).isoformat(),
-            "lead_time_days": 10,
-            "message_fr": "Risque de crue modéré à Matam dans 10 jours",
-            "confidence": 0.88
-        }
-    ]
-    
-    if alert_type:
-        alerts = [a for a in alerts if a['alert_type'] == alert_type]
-    
-    return alerts
+    """Alertes actuelles actives (observations et prévisions), plus graves d'abord"""
+    try:
+        return alert_engine.query(location_id=location_id, alert_type=alert_type, min_level=min_level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/alerts/subscribe", tags=["Alerts"])
 async def subscribe_alert(
-    location_id: str,
-    alert_types: List[str] = ["flood", "drought"]
+    location_id: str = Query(..., description="Localisation, ou * pour toutes"),
+    alert_types: List[str] = ["flood", "drought"],
+    min_level: str = Query("vigilance", description="vigilance | alerte | alerte_max"),
+    notification_method: Optional[str] = Query(None, description="sms | email (sans envoi si absent)"),
+    notification_address: Optional[str] = Query(None, max_length=255, description="Numéro ou adresse e-mail"),
+    services: ServiceContainer = Depends(get_services)
 ):
-    """S'abonner aux alertes"""
+    """S'abonner aux alertes (notifications envoyées à chaque alerte nouvelle ou aggravée)"""
+    if notification_method is not None:
+        if notification_method not in services.notifications.channels:
+            raise HTTPException(status_code=400, detail=f"Canal de notification inconnu: {notification_method}")
+        if not notification_address:
+            raise HTTPException(status_code=400, detail="notification_address requis avec notification_method")
+    try:
+        subscription = await services.subscribe(
+            location_id, alert_types, min_level,
+            notification_method=notification_method,
+            notification_address=notification_address
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Erreur enregistrement abonnement: {e}")
+        raise HTTPException(status_code=503, detail="Abonnement non enregistré, réessayer")
     return {
-        "subscription_id": f"sub_{location_id}_{datetime.utcnow().timestamp()}",
-        "location_id": location_id,
-        "alert_types": alert_types,
+        **subscription,
         "status": "active",
         "message": "Subscription successful"
     }
 
 
+@app.delete("/alerts/subscriptions/{subscription_id}", tags=["Alerts"])
+async def unsubscribe_alert(
+    subscription_id: str,
+    services: ServiceContainer = Depends(get_services)
+):
+    """Résilier un abonnement aux alertes"""
+    if not await services.unsubscribe(subscription_id):
+        raise HTTPException(status_code=404, detail="Abonnement inconnu")
+    return {"subscription_id": subscription_id, "status": "cancelled"}
+
+
 # ==================== OPTIMISATION ====================
 
 @app.get("/optimization/dams", response_model=DamOptimization, tags=["Optimization"])
 async def optimize_dams(
+    response: Response,
     forecast_days: int = Query(10, ge=7, le=15),
-    forecast_service: ForecastService = Depends(get_forecast_service)
+    fresh: bool = Query(False, description=FRESH_DESCRIPTION),
+    forecast_service: ForecastService = Depends(get_forecast_service),
+    runner: BatchForecastRunner = Depends(get_forecast_runner)
 ):
     """Optimisation multi-objectifs des 3 barrages (Manantali, Diama, Félou)"""
-    return await forecast_service.optimize_dams(forecast_days)
+    if not fresh:
+        optimization = _precomputed(response, runner, runner.lookup("dams", "basin", forecast_days))
+        if optimization is not None:
+            return optimization
+    return await forecast_service.optimize_dams(forecast_days, fresh=fresh)
 
 
 @app.post("/optimization/scenario", tags=["Optimization"])
 async def scenario_analysis(
-    scenario: Dict[str, Any]
+    scenario: Dict[str, Any],
+    forecast_days: int = Query(10, ge=7, le=15),
+    scenario_service: ScenarioService = Depends(get_scenario_service)
 ):
     """
     Analyse de scénario: 
     {'manantali_discharge_m3_s': 1500, 'diama_discharge_m3_s': 1200, ...}
     Retourne impacts prédits.
     """
-    return {
-        "scenario_id": f"scenario_{datetime.utcnow().timestamp()}",
-        "input": scenario,
-        "predicted_energy_gwh": 150.0,
-        "predicted_irrigation_m3": 50e6,
-        "predicted_salinity_risk": 0.2,
-        "predicted_flood_risk": 0.15,
-        "environmental_impact": "moderate_positive"
-    }
+    try:
+        return await scenario_service.evaluate(scenario, forecast_days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/optimization/scenarios", tags=["Optimization"])
+async def batch_scenario_analysis(
+    scenarios: List[Dict[str, Any]],
+    forecast_days: int = Query(10, ge=7, le=15),
+    scenario_service: ScenarioService = Depends(get_scenario_service)
+):
+    """
+    Analyse d'un lot de scénarios en parallèle.
+    Réponse NDJSON: une ligne par scénario dès qu'il est évalué (champ `index` = position dans le lot).
+    """
+    if not 1 <= len(scenarios) <= 500:
+        raise HTTPException(status_code=400, detail="Entre 1 et 500 scénarios par lot")
+    
+    async def lines():
+        async for result in scenario_service.stream(scenarios, forecast_days):
+            yield json.dumps(result, default=str) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# ==================== RÉSEAU HYDROGRAPHIQUE ====================
+
+@app.post("/network/propagation", tags=["Network"])
+async def network_propagation(
+    request: PropagationRequest,
+    forecast_service: ForecastService = Depends(get_forecast_service)
+):
+    """
+    Propagation de crues (what-if) à travers le réseau du fleuve Sénégal.
+    Plusieurs scénarios (source, anomalie de débit) évalués en une passe.
+    """
+    try:
+        return await forecast_service.propagate_network(
+            [scenario.source for scenario in request.scenarios],
+            [scenario.discharge_anomaly_m3_s for scenario in request.scenarios],
+            request.days_ahead,
+            request.include_series
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/network/observations", tags=["Network"])
+async def network_observation(
+    observation: NetworkObservation,
+    forecast_service: ForecastService = Depends(get_forecast_service)
+):
+    """Intègre une observation au routage: seul le sous-réseau aval est recalculé"""
+    try:
+        return forecast_service.route_observation(
+            observation.node, observation.discharge_anomaly_m3_s, observation.day
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/network/state", tags=["Network"])
+async def network_state(forecast_service: ForecastService = Depends(get_forecast_service)):
+    """Anomalies propagées courantes par nœud"""
+    return forecast_service.routing_snapshot()
 
 
 # ==================== TABLEAUX DE BORD ====================
 
 @app.get("/dashboard/overview", tags=["Dashboard"])
-async def dashboard_overview(data_service: DataService = Depends(get_data_service)):
+async def dashboard_overview(
+    data_service: DataService = Depends(get_data_service),
+    alert_engine: AlertEngine = Depends(get_alert_engine),
+    runner: BatchForecastRunner = Depends(get_forecast_runner)
+):
     """Aperçu dashboard principal"""
-    metrics_bakel = await data_service.get_location_metrics("station_001")
-    metrics_matam = await data_service.get_location_metrics("station_002")
+    metrics_bakel, metrics_matam = await data_service.get_locations_metrics(["station_001", "station_002"])
+    active_alerts = alert_engine.query()
     
     return {
         "timestamp": datetime.utcnow().isoformat(),
@@ -315,14 +646,16 @@ async def dashboard_overview(data_service: DataService = Depends(get_data_servic
         },
         
         # Alertes actives
-        "active_alerts": 2,
+        "active_alerts": len(active_alerts),
         "alerts": [
             {
-                "type": "flood",
-                "location": "Matam",
-                "confidence": 0.88,
-                "days_ahead": 10
+                "type": alert["alert_type"],
+                "level": alert["alert_level"],
+                "location": alert["location_name"],
+                "confidence": alert["confidence"],
+                "days_ahead": alert["lead_time_days"]
             }
+            for alert in active_alerts
         ],
         
         # Statistiques
@@ -330,7 +663,7 @@ async def dashboard_overview(data_service: DataService = Depends(get_data_servic
             "sensors_operational": 50,
             "sensors_total": 95,
             "models_running": 5,
-            "last_forecast": (datetime.utcnow() - timedelta(hours=2)).isoformat()
+            "last_forecast": runner.run["completed_at"] if runner.run else None
         }
     }
 
@@ -386,7 +719,10 @@ async def dashboard_map_data(data_service: DataService = Depends(get_data_servic
 
 
 @app.get("/dashboard/statistics", tags=["Dashboard"])
-async def dashboard_statistics(data_service: DataService = Depends(get_data_service)):
+async def dashboard_statistics(
+    data_service: DataService = Depends(get_data_service),
+    alert_engine: AlertEngine = Depends(get_alert_engine)
+):
     """Statistiques et KPIs"""
     return {
         "timestamp": datetime.utcnow().isoformat(),
@@ -406,7 +742,7 @@ async def dashboard_statistics(data_service: DataService = Depends(get_data_serv
             "irrigation_area_served_km2": 220000,
             "agricultural_population": 9750000
         },
-        "alerts_24h": 5,
+        "alerts_24h": alert_engine.alerts_24h(),
         "forecast_confidence_avg": 0.86
     }
 
@@ -470,31 +806,97 @@ async def get_ecosystem_services():
 
 @app.websocket("/ws/live/{location_id}")
 async def websocket_endpoint(websocket: WebSocket, location_id: str):
-    """WebSocket pour real-time data streaming"""
+    """WebSocket pour real-time data streaming (producteur partagé par localisation)"""
     await websocket.accept()
-    data_service = DataService(db=None)
+    hub = _get_container(websocket.app).live_hub
+    subscription = hub.subscribe(location_id)
     
+    # Réception en parallèle pour détecter la déconnexion sans attendre le prochain envoi
+    receive_task = asyncio.create_task(websocket.receive())
     try:
         while True:
-            # Envoie données toutes les 10 secondes
-            metrics = await data_service.get_location_metrics(location_id)
+            next_message = asyncio.create_task(subscription.queue.get())
+            done, _ = await asyncio.wait({next_message, receive_task}, return_when=asyncio.FIRST_COMPLETED)
             
-            data = {
-                "timestamp": datetime.utcnow().isoformat(),
-                "discharge_m3_s": metrics.current_discharge,
-                "water_level_m": metrics.water_level,
-                "water_status": metrics.water_status,
-                "alert_level": metrics.alert_level,
-                "temperature_c": metrics.temperature,
-                "rainfall_24h": metrics.rainfall_24h,
-            }
+            if receive_task in done:
+                next_message.cancel()
+                if receive_task.result()["type"] == "websocket.disconnect":
+                    break
+                receive_task = asyncio.create_task(websocket.receive())
+                continue
             
+            published_at, data = next_message.result()
             await websocket.send_json(data)
-            await asyncio.sleep(10)
+            hub.record_send(published_at)
     
     except Exception as e:
         print(f"WebSocket error: {e}")
         await websocket.close()
+    finally:
+        receive_task.cancel()
+        hub.unsubscribe(subscription)
+
+
+@app.get("/system/scenarios", tags=["System"])
+async def get_scenario_stats(services: ServiceContainer = Depends(get_services)):
+    """Pool d'analyse de scénarios (processus, lots, scénarios évalués)"""
+    return services.scenario_service.stats()
+
+
+@app.get("/system/live", tags=["System"])
+async def get_live_stats(services: ServiceContainer = Depends(get_services)):
+    """Connexions WebSocket actives, producteurs et délai d'envoi"""
+    return services.live_hub.stats()
+
+
+@app.get("/system/storage", tags=["System"])
+async def get_storage_stats(services: ServiceContainer = Depends(get_services)):
+    """Stockage des mesures: pool de connexions, cache de requêtes préparées, durées"""
+    return services.storage_stats()
+
+
+@app.get("/system/ingest", tags=["System"])
+async def get_ingest_stats(services: ServiceContainer = Depends(get_services)):
+    """Ingestion capteurs: mesures reçues/rejetées, tampon et écritures par lots"""
+    if services.ingest_service is None:
+        return {"enabled": False}
+    return {"enabled": True, **services.ingest_service.stats()}
+
+
+@app.get("/system/archive", tags=["System"])
+async def get_archive_stats(services: ServiceContainer = Depends(get_services)):
+    """Archive horaire mappée en mémoire (partitions, taille disque, lectures sans copie) et agrégats"""
+    return {**services.archive.stats(), "rollups": services.rollups.stats()}
+
+
+@app.get("/system/rolling-stats", tags=["System"])
+async def get_rolling_stats(services: ServiceContainer = Depends(get_services)):
+    """Statistiques glissantes des débits (30 jours) utilisées pour l'état de l'eau"""
+    return services.rolling_stats.summary()
+
+
+@app.get("/system/alerts", tags=["System"])
+async def get_alert_stats(services: ServiceContainer = Depends(get_services)):
+    """Moteur d'alertes: règles, alertes actives, cycles évalués, abonnements"""
+    return services.alert_engine.stats()
+
+
+@app.get("/system/notifications", tags=["System"])
+async def get_notification_stats(services: ServiceContainer = Depends(get_services)):
+    """Notifications: profondeur des files, envois par canal, débit et latence de bout en bout"""
+    return services.notifications.stats()
+
+
+@app.get("/system/forecast-batch", tags=["System"])
+async def get_forecast_batch_stats(services: ServiceContainer = Depends(get_services)):
+    """Prévisions planifiées: cadence, prochain lot, dernier lot servi et taux de service"""
+    return services.forecast_runner.stats()
+
+
+@app.get("/system/climatology", tags=["System"])
+async def get_climatology_stats(services: ServiceContainer = Depends(get_services)):
+    """Climatologie mensuelle en ligne (observations intégrées par localisation)"""
+    return services.climatology.summary()
 
 
 # ==================== EXPERT API ====================
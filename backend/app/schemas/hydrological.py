@@ -82,6 +82,9 @@ class LocationMetrics(BaseModel):
     vegetation_ndvi: float = Field(..., description="[-1, 1]")
     soil_moisture: float = Field(..., description="[0, 100]%")
     
+    discharge_percentile: Optional[float] = Field(None, description="Rang centile du débit sur 30 jours (%)")
+    discharge_zscore: Optional[float] = Field(None, description="Écart à la moyenne sur 30 jours (écarts-types)")
+    
     timestamp: datetime
     confidence: float = Field(..., description="[0, 1]")
 
@@ -175,6 +178,32 @@ class DamOptimization(BaseModel):
     # Métriques
     multi_objective_score: float = Field(..., description="[0, 100]")
     improvement_vs_manual: float = Field(..., example=0.17, description="17% better")
+    
+    # Calendrier recommandé et compromis (front de Pareto)
+    release_schedule_m3_s: Optional[Dict[str, List[float]]] = None
+    pareto_front: Optional[List[Dict[str, float]]] = Field(None,
+        description="Politiques non dominées (énergie, irrigation, environnement, sécurité)"
+    )
+
+
+class PropagationScenario(BaseModel):
+    """Anomalie de débit injectée à un nœud du réseau"""
+    source: str = Field(..., example="bakel")
+    discharge_anomaly_m3_s: float = Field(..., example=800.0)
+
+
+class PropagationRequest(BaseModel):
+    """Scénarios de propagation évalués ensemble (GNN)"""
+    scenarios: List[PropagationScenario]
+    days_ahead: int = Field(10, ge=1, le=365)
+    include_series: bool = Field(False, description="Séries complètes (jours x nœuds) par scénario")
+
+
+class NetworkObservation(BaseModel):
+    """Anomalie de débit observée à un nœud (routage incrémental)"""
+    node: str = Field(..., example="bakel")
+    discharge_anomaly_m3_s: float = Field(..., example=350.0)
+    day: int = Field(0, ge=0, description="Décalage en jours (0 = aujourd'hui)")
 
 
 class AgriculturalRecommendation(BaseModel):
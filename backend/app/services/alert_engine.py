@@ -0,0 +1,495 @@
+"""
+Moteur d'alertes hydrologiques.
+Règles déclaratives (seuil, vitesse de montée, dépassement prévu) évaluées en une
+passe vectorisée sur toutes les stations à chaque cycle (ingestion ou prévision).
+Alertes dédupliquées par (localisation, type, source) et indexées par localisation,
+type et niveau; abonnements retrouvés par index inversé.
+"""
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.schemas.hydrological import AlertLevel
+from app.services.data_service import LOCATION_NAMES, WATER_STATUS_RATIO_BOUNDS
+
+
+# Niveau d'alerte -> rang (0 = pas d'alerte)
+LEVEL_RANK = {
+    AlertLevel.NORMAL.value: 0,
+    AlertLevel.VIGILANCE.value: 1,
+    AlertLevel.ALERTE.value: 2,
+    AlertLevel.ALERTE_MAX.value: 3,
+}
+LEVEL_BY_RANK = {rank: level for level, rank in LEVEL_RANK.items()}
+ALERT_TYPES = ["flood", "drought", "infrastructure", "salinity"]
+WILDCARD = "*"
+
+OPERATORS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+}
+
+# Type de règle -> source des données évaluées
+RULE_SOURCES = {
+    "threshold": "observed",
+    "rate_of_rise": "observed",
+    "forecast_exceedance": "forecast",
+}
+
+
+class AlertRule:
+    """
+    Règle déclarative: conjonction de conditions (champ, opérateur, valeur)
+    sur les colonnes du cycle évalué. `rate_of_rise` lit le champ rise_<n>h
+    (variation relative du débit sur `window_hours`).
+    """
+
+    def __init__(
+        self,
+        rule_id: str,
+        kind: str,
+        alert_type: str,
+        alert_level: str,
+        conditions: List[Tuple[str, str, float]],
+        message_fr: str,
+        message_en: str,
+        recommended_action: str = "",
+        window_hours: Optional[int] = None,
+        lead_days: Optional[int] = None
+    ):
+        if kind not in RULE_SOURCES:
+            raise ValueError(f"Type de règle inconnu: {kind}")
+        if alert_level not in LEVEL_RANK or LEVEL_RANK[alert_level] == 0:
+            raise ValueError(f"Niveau d'alerte invalide: {alert_level}")
+        for _, op, _ in conditions:
+            if op not in OPERATORS:
+                raise ValueError(f"Opérateur inconnu: {op}")
+        self.rule_id = rule_id
+        self.kind = kind
+        self.source = RULE_SOURCES[kind]
+        self.alert_type = alert_type
+        self.alert_level = alert_level
+        self.rank = LEVEL_RANK[alert_level]
+        self.conditions = conditions
+        self.message_fr = message_fr
+        self.message_en = message_en
+        self.recommended_action = recommended_action
+        self.window_hours = window_hours
+        self.lead_days = lead_days
+
+    def mask(self, columns: Dict[str, np.ndarray], n: int) -> np.ndarray:
+        """Localisations vérifiant toutes les conditions (colonne absente ou NaN: faux)"""
+        result = np.ones(n, dtype=bool)
+        for field, op, value in self.conditions:
+            values = columns.get(field)
+            if values is None:
+                return np.zeros(n, dtype=bool)
+            with np.errstate(invalid="ignore"):
+                result &= OPERATORS[op](values, value)
+        return result
+
+    def describe(self) -> Dict:
+        return {
+            "rule_id": self.rule_id,
+            "kind": self.kind,
+            "alert_type": self.alert_type,
+            "alert_level": self.alert_level,
+            "conditions": [list(c) for c in self.conditions],
+        }
+
+
+_, _, HIGH_RATIO, CRITICAL_HIGH_RATIO = WATER_STATUS_RATIO_BOUNDS.tolist()
+CRITICAL_LOW_RATIO = float(WATER_STATUS_RATIO_BOUNDS[0])
+
+DEFAULT_ALERT_RULES = [
+    # Observations (ratio au débit caractéristique, cf. classify_water_status)
+    AlertRule(
+        "flood_critical", "threshold", "flood", "alerte_max",
+        [("discharge_ratio", ">=", CRITICAL_HIGH_RATIO)],
+        "CRUE EN COURS à {location_name}: débit {value:.0f} m³/s",
+        "FLOOD IN PROGRESS at {location_name}: discharge {value:.0f} m³/s",
+        "Évacuer les zones inondables, activer le plan ORSEC",
+    ),
+    AlertRule(
+        "flood_high", "threshold", "flood", "vigilance",
+        [("discharge_ratio", ">=", HIGH_RATIO)],
+        "Débit élevé à {location_name}: {value:.0f} m³/s",
+        "High discharge at {location_name}: {value:.0f} m³/s",
+        "Surveiller l'évolution, informer les riverains",
+    ),
+    AlertRule(
+        "rapid_rise", "rate_of_rise", "flood", "vigilance",
+        [("rise_6h", ">=", 0.25), ("discharge_ratio", ">=", 1.0)],
+        "Montée rapide des eaux à {location_name} ({value:+.0%} en 6 h)",
+        "Rapid rise at {location_name} ({value:+.0%} in 6 h)",
+        "Surveiller l'évolution, informer les riverains",
+        window_hours=6,
+    ),
+    AlertRule(
+        "drought_critical", "threshold", "drought", "alerte",
+        [("discharge_ratio", "<", CRITICAL_LOW_RATIO)],
+        "Étiage sévère à {location_name}: {value:.0f} m³/s",
+        "Severe low flow at {location_name}: {value:.0f} m³/s",
+        "Restreindre les prélèvements, prioriser l'eau potable",
+    ),
+    # Prévisions court terme
+    AlertRule(
+        "forecast_flood", "forecast_exceedance", "flood", "alerte_max",
+        [("predicted_alert_rank", ">=", LEVEL_RANK["alerte_max"])],
+        "ALERTE CRUE SÉVÈRE: Débit élevé prévu ({value:.0f} m³/s)",
+        "SEVERE FLOOD WARNING: High-magnitude discharge predicted ({value:.0f} m³/s)",
+        "Préparer l'évacuation des zones inondables",
+    ),
+    AlertRule(
+        "forecast_critical_exceedance", "forecast_exceedance", "flood", "alerte_max",
+        [("predicted_discharge_ratio", ">=", CRITICAL_HIGH_RATIO)],
+        "ALERTE CRUE SÉVÈRE: dépassement du seuil critique prévu ({value:.0f} m³/s)",
+        "SEVERE FLOOD WARNING: critical threshold exceedance predicted ({value:.0f} m³/s)",
+        "Préparer l'évacuation des zones inondables",
+    ),
+    AlertRule(
+        "forecast_drought", "forecast_exceedance", "drought", "alerte",
+        [("predicted_alert_rank", "==", LEVEL_RANK["alerte"]), ("predicted_discharge", "<", 600)],
+        "ALERTE SÉCHERESSE: Débit faible ({value:.0f} m³/s)",
+        "DROUGHT WARNING: Low flow ({value:.0f} m³/s)",
+        "Restreindre les prélèvements, prioriser l'eau potable",
+        lead_days=3,
+    ),
+]
+
+
+class SubscriptionIndex:
+    """
+    Abonnements aux alertes, index inversé (localisation, type, rang de niveau) -> ids.
+    Un abonnement est inscrit pour chaque rang >= son niveau minimal; `*` couvre
+    toutes les localisations ou tous les types. Une recherche = 4 accès au dictionnaire.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Dict] = {}
+        self._index: Dict[Tuple[str, str, int], Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _keys(self, subscription: Dict) -> Iterable[Tuple[str, str, int]]:
+        for alert_type in subscription["alert_types"]:
+            for rank in range(LEVEL_RANK[subscription["min_level"]], max(LEVEL_RANK.values()) + 1):
+                yield (subscription["location_id"], alert_type, rank)
+
+    def subscribe(
+        self,
+        location_id: str,
+        alert_types: List[str],
+        min_level: str = AlertLevel.VIGILANCE.value,
+        **attributes
+    ) -> Dict:
+        if min_level not in LEVEL_RANK or LEVEL_RANK[min_level] == 0:
+            raise ValueError(f"Niveau minimal invalide: {min_level}")
+        unknown = [t for t in alert_types if t != WILDCARD and t not in ALERT_TYPES]
+        if unknown or not alert_types:
+            raise ValueError(f"Types d'alerte inconnus: {unknown or alert_types}")
+        subscription = {
+            # UUID: identifiant de la table subscriptions
+            "subscription_id": str(uuid.uuid4()),
+            "location_id": location_id,
+            "alert_types": sorted(set(alert_types)),
+            "min_level": min_level,
+            "created_at": datetime.utcnow(),
+            **attributes,
+        }
+        self._add(subscription)
+        return subscription
+
+    def restore(self, subscriptions: Iterable[Dict]) -> int:
+        """Réindexe des abonnements persistés (identifiants conservés)"""
+        restored = 0
+        for subscription in subscriptions:
+            if subscription["min_level"] in LEVEL_RANK:
+                self._add(subscription)
+                restored += 1
+        return restored
+
+    def _add(self, subscription: Dict):
+        with self._lock:
+            self._subscriptions[subscription["subscription_id"]] = subscription
+            for key in self._keys(subscription):
+                self._index.setdefault(key, set()).add(subscription["subscription_id"])
+
+    def unsubscribe(self, subscription_id: str) -> bool:
+        with self._lock:
+            subscription = self._subscriptions.pop(subscription_id, None)
+            if subscription is None:
+                return False
+            for key in self._keys(subscription):
+                ids = self._index.get(key)
+                if ids is not None:
+                    ids.discard(subscription_id)
+                    if not ids:
+                        del self._index[key]
+            return True
+
+    def get(self, subscription_id: str) -> Optional[Dict]:
+        return self._subscriptions.get(subscription_id)
+
+    def match(self, location_id: str, alert_type: str, alert_level: str) -> Set[str]:
+        """Abonnements concernés par une alerte"""
+        rank = LEVEL_RANK[alert_level]
+        matched: Set[str] = set()
+        with self._lock:
+            for key in (
+                (location_id, alert_type, rank),
+                (location_id, WILDCARD, rank),
+                (WILDCARD, alert_type, rank),
+                (WILDCARD, WILDCARD, rank),
+            ):
+                ids = self._index.get(key)
+                if ids:
+                    matched |= ids
+        return matched
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def stats(self) -> Dict:
+        return {"subscriptions": len(self._subscriptions), "index_keys": len(self._index)}
+
+
+class AlertEngine:
+    """Évaluation vectorisée des règles, alertes actives dédupliquées et indexées"""
+
+    def __init__(
+        self,
+        rules: Optional[List[AlertRule]] = None,
+        subscriptions: Optional[SubscriptionIndex] = None,
+        location_names: Optional[Dict[str, str]] = None
+    ):
+        self.rules = rules if rules is not None else list(DEFAULT_ALERT_RULES)
+        self.subscriptions = subscriptions or SubscriptionIndex()
+        self.location_names = location_names if location_names is not None else LOCATION_NAMES
+        self._active: Dict[Tuple[str, str, str], Dict] = {}
+        self._by_location: Dict[str, Set[Tuple[str, str, str]]] = {}
+        self._by_type: Dict[str, Set[Tuple[str, str, str]]] = {}
+        self._by_level: Dict[str, Set[Tuple[str, str, str]]] = {}
+        self._listeners: List[Callable] = []
+        self._triggered: deque = deque()  # Dates de déclenchement (fenêtre de 24 h)
+        self._lock = threading.RLock()
+
+        # Métriques
+        self.evaluations = {"observed": 0, "forecast": 0}
+        self.alerts_raised = 0
+        self.alerts_resolved = 0
+        self.subscribers_matched = 0
+        self.last_evaluation: Optional[datetime] = None
+
+    def add_listener(self, listener: Callable):
+        """`listener(alerte, ids d'abonnements)` à chaque alerte nouvelle ou aggravée"""
+        self._listeners.append(listener)
+
+    def rise_windows(self) -> List[int]:
+        """Fenêtres (heures) des règles de vitesse de montée: colonnes rise_<n>h attendues"""
+        return sorted({r.window_hours for r in self.rules if r.kind == "rate_of_rise" and r.window_hours})
+
+    def evaluate_observations(
+        self,
+        location_ids: List[str],
+        columns: Dict[str, np.ndarray],
+        confidence: Optional[np.ndarray] = None
+    ) -> List[Dict]:
+        """
+        Cycle d'observation. Colonnes attendues: discharge (m³/s), discharge_ratio,
+        rise_<n>h; colonnes supplémentaires utilisables par les règles.
+        """
+        n = len(location_ids)
+        context = {
+            "value_field": "discharge",
+            "lead_time_days": np.zeros(n, dtype=np.int64),
+            "confidence": confidence if confidence is not None else np.ones(n),
+        }
+        return self._evaluate("observed", location_ids, columns, context)
+
+    def evaluate_forecasts(self, forecasts: List, base_discharge: Dict[str, float]) -> List[Dict]:
+        """Cycle de prévision: une passe pour toutes les prévisions court terme reçues"""
+        if not forecasts:
+            return []
+        location_ids = [f.station_id for f in forecasts]
+        predicted = np.array([f.predicted_discharge_m3_s for f in forecasts], dtype=float)
+        base = np.array([base_discharge.get(loc, 800) for loc in location_ids], dtype=float)
+        columns = {
+            "predicted_discharge": predicted,
+            "predicted_discharge_ratio": predicted / base,
+            "predicted_alert_rank": np.array([LEVEL_RANK[AlertLevel(f.predicted_alert_level).value] for f in forecasts]),
+            "predicted_inundation_risk": np.array([f.predicted_inundation_risk for f in forecasts], dtype=float),
+        }
+        context = {
+            "value_field": "predicted_discharge",
+            "lead_time_days": np.array([f.forecast_horizon_days for f in forecasts], dtype=np.int64),
+            "confidence": np.array([f.confidence_score for f in forecasts], dtype=float),
+        }
+        return self._evaluate("forecast", location_ids, columns, context)
+
+    def _evaluate(self, source: str, location_ids: List[str], columns: Dict[str, np.ndarray], context: Dict) -> List[Dict]:
+        """
+        Par type d'alerte: matrice (règles x localisations) des rangs déclenchés,
+        le plus élevé l'emporte. Retourne les alertes actives des localisations évaluées.
+        """
+        n = len(location_ids)
+        now = datetime.utcnow()
+        rules = [r for r in self.rules if r.source == source]
+        columns = {field: np.asarray(values) for field, values in columns.items()}
+        values = columns.get(context["value_field"], np.full(n, np.nan))
+        notifications = []
+
+        with self._lock:
+            self.evaluations[source] += 1
+            self.last_evaluation = now
+            for alert_type in sorted({r.alert_type for r in rules}):
+                group = [r for r in rules if r.alert_type == alert_type]
+                ranks = np.stack([np.where(r.mask(columns, n), r.rank, 0) for r in group])
+                winner = ranks.argmax(axis=0)
+                level = ranks.max(axis=0)
+                for j, location_id in enumerate(location_ids):
+                    key = (location_id, alert_type, source)
+                    if level[j] == 0:
+                        if key in self._active:
+                            self._resolve(key)
+                        continue
+                    rule = group[winner[j]]
+                    alert, notify = self._upsert(key, rule, now, {
+                        "value": float(values[j]),
+                        "lead_time_days": int(context["lead_time_days"][j]),
+                        "confidence": float(context["confidence"][j]),
+                        "rule_columns": {field: columns[field][j] for field, _, _ in rule.conditions},
+                    })
+                    if notify:
+                        notifications.append(alert)
+            self._prune_triggered(now)
+            active = [
+                dict(self._active[(loc, alert_type, source)])
+                for loc in location_ids
+                for alert_type in ALERT_TYPES
+                if (loc, alert_type, source) in self._active
+            ]
+
+        for alert in notifications:
+            subscribers = self.subscriptions.match(alert["location_id"], alert["alert_type"], alert["alert_level"])
+            self.subscribers_matched += len(subscribers)
+            for listener in self._listeners:
+                try:
+                    listener(dict(alert), subscribers)
+                except Exception as e:
+                    print(f"Erreur listener alertes: {e}")
+        return active
+
+    def _upsert(self, key: Tuple[str, str, str], rule: AlertRule, now: datetime, observed: Dict) -> Tuple[Dict, bool]:
+        """
+        Crée ou met à jour l'alerte de la clé (identifiant et date de déclenchement conservés);
+        True si nouvelle ou aggravée (à notifier)
+        """
+        location_id, alert_type, source = key
+        location_name = self.location_names.get(location_id, location_id)
+        condition_value = observed["rule_columns"][rule.conditions[0][0]]
+        fmt = {
+            "location_name": location_name,
+            "value": float(condition_value) if rule.kind == "rate_of_rise" else observed["value"],
+            "lead_time_days": observed["lead_time_days"],
+        }
+        lead_days = rule.lead_days if rule.lead_days is not None else observed["lead_time_days"]
+        previous = self._active.get(key)
+        notify = previous is None or rule.rank > LEVEL_RANK[previous["alert_level"]]
+        alert = {
+            "alert_id": previous["alert_id"] if previous else f"{alert_type}_{location_id}_{source}_{int(now.timestamp())}",
+            "alert_type": alert_type,
+            "alert_level": rule.alert_level,
+            "source": source,
+            "rule_id": rule.rule_id,
+            "location_id": location_id,
+            "location_name": location_name,
+            "location": location_name,  # Champ historique affiché par le frontend
+            "trigger_date": previous["trigger_date"] if previous else now,
+            "updated_at": now,
+            "event_expected_date": now + timedelta(days=lead_days),
+            "lead_time_days": observed["lead_time_days"],
+            "value": observed["value"],
+            "condition": " and ".join(f"{field} {op} {value:g}" for field, op, value in rule.conditions),
+            "message_fr": rule.message_fr.format(**fmt),
+            "message_en": rule.message_en.format(**fmt),
+            "recommended_action": rule.recommended_action,
+            "confidence": observed["confidence"],
+        }
+        if previous is not None:
+            self._unindex(key, previous)
+        self._active[key] = alert
+        self._by_location.setdefault(location_id, set()).add(key)
+        self._by_type.setdefault(alert_type, set()).add(key)
+        self._by_level.setdefault(alert["alert_level"], set()).add(key)
+        if notify:
+            self.alerts_raised += 1
+            self._triggered.append(now)
+        return alert, notify
+
+    def _unindex(self, key: Tuple[str, str, str], alert: Dict):
+        for index, field in ((self._by_location, "location_id"), (self._by_type, "alert_type"), (self._by_level, "alert_level")):
+            keys = index.get(alert[field])
+            if keys is not None:
+                keys.discard(key)
+
+    def _resolve(self, key: Tuple[str, str, str]):
+        alert = self._active.pop(key)
+        self._unindex(key, alert)
+        self.alerts_resolved += 1
+
+    def _prune_triggered(self, now: datetime):
+        horizon = now - timedelta(hours=24)
+        while self._triggered and self._triggered[0] < horizon:
+            self._triggered.popleft()
+
+    def query(
+        self,
+        location_id: Optional[str] = None,
+        alert_type: Optional[str] = None,
+        min_level: str = AlertLevel.VIGILANCE.value
+    ) -> List[Dict]:
+        """Alertes actives filtrées par intersection des index (plus graves d'abord)"""
+        if min_level not in LEVEL_RANK:
+            raise ValueError(f"Niveau inconnu: {min_level}")
+        with self._lock:
+            by_level = set()
+            for level, rank in LEVEL_RANK.items():
+                if rank >= LEVEL_RANK[min_level]:
+                    by_level |= self._by_level.get(level, set())
+            candidates = [by_level]
+            if location_id:
+                candidates.append(self._by_location.get(location_id, set()))
+            if alert_type:
+                candidates.append(self._by_type.get(alert_type, set()))
+            candidates.sort(key=len)
+            keys = set(candidates[0]).intersection(*candidates[1:])
+            alerts = [dict(self._active[key]) for key in keys]
+        alerts.sort(key=lambda a: (-LEVEL_RANK[a["alert_level"]], a["location_id"], a["alert_type"], a["source"]))
+        return alerts
+
+    def alerts_24h(self) -> int:
+        with self._lock:
+            self._prune_triggered(datetime.utcnow())
+            return len(self._triggered)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "rules": [rule.describe() for rule in self.rules],
+                "active": len(self._active),
+                "active_by_level": {level: len(keys) for level, keys in self._by_level.items() if keys},
+                "evaluations": dict(self.evaluations),
+                "last_evaluation": self.last_evaluation.isoformat() if self.last_evaluation else None,
+                "alerts_raised": self.alerts_raised,
+                "alerts_resolved": self.alerts_resolved,
+                "alerts_24h": len(self._triggered),
+                "subscribers_matched": self.subscribers_matched,
+                **self.subscriptions.stats(),
+            }
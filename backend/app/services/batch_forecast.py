@@ -0,0 +1,445 @@
+"""
+Prévisions planifiées par lots.
+Court terme, saisonnier et inondations de toutes les localisations, plus
+l'optimisation des barrages, calculés à cadence fixe dans un pool de processus.
+Le dernier lot est conservé sur disque (et dans la table forecasts si un stockage
+est configuré); les endpoints /forecast/* le servent sans recalcul.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from app.ai.climatology import MonthlyClimatology
+from app.schemas.hydrological import DamOptimization, FloodPrediction, ForecastSeasonal, ForecastShortTerm
+from app.services.data_service import LOCATION_DISCHARGE_BASE, DataService
+from app.services.forecast_service import ForecastService
+from app.storage.archive import HistoryArchive
+from app.storage.base import HydroStorage, create_storage
+
+
+BATCH_FORMAT_VERSION = 1
+RESULT_MODELS = {
+    "short_term": ForecastShortTerm,
+    "seasonal": ForecastSeasonal,
+    "dams": DamOptimization,
+}
+
+# Service de prévision reconstruit une fois par processus du pool
+_worker_state: Dict[str, Any] = {}
+
+
+def _worker_service(config: Dict) -> Tuple[asyncio.AbstractEventLoop, ForecastService]:
+    """
+    (boucle, ForecastService) du processus. Mêmes données que le processus principal:
+    archive locale ouverte en lecture seule (lui seul l'écrit), puis stockage configuré
+    ou simulation pour les localisations absentes de l'archive.
+    """
+    key = (config["database_url"], config["archive_dir"], config["training_days"], config["lstm_resample_factor"])
+    if _worker_state.get("key") != key:
+        loop = _worker_state.get("loop") or asyncio.new_event_loop()
+        storage: Optional[HydroStorage] = create_storage(config["database_url"])
+        if storage is not None:
+            try:
+                loop.run_until_complete(storage.connect())
+            except Exception as e:
+                print(f"Erreur connexion stockage (lot de prévisions): {e}")
+                storage = None
+        archive = HistoryArchive(config["archive_dir"], read_only=True) if config["archive_dir"] else None
+        service = ForecastService(
+            DataService(db=None, storage=storage, archive=archive),
+            training_days=config["training_days"],
+            lstm_resample_factor=config["lstm_resample_factor"]
+        )
+        _worker_state.update(key=key, loop=loop, service=service, run_id=None)
+    loop, service = _worker_state["loop"], _worker_state["service"]
+    if _worker_state["run_id"] != config["run_id"]:
+        # Nouveau lot: heures archivées et climatologie persistée par le processus principal relues, cache vidé
+        if service.data_service.archive is not None:
+            service.data_service.archive.refresh()
+        storage = service.data_service.storage
+        if storage is not None:
+            climatology = MonthlyClimatology()
+            climatology.load_records(loop.run_until_complete(storage.read_climatology()))
+        else:
+            climatology = MonthlyClimatology(config["climatology_path"])
+        service.transformer.climatology = climatology
+        service.cache.invalidate()
+        _worker_state["run_id"] = config["run_id"]
+    return loop, service
+
+
+async def _forecast_locations(service: ForecastService, location_ids: List[str], config: Dict) -> Dict:
+    result = {"short_term": {}, "seasonal": {}, "flood": {}, "errors": {}}
+    for days in config["short_term_days"]:
+        try:
+            forecasts = await service.forecast_short_term_batch(location_ids, days)
+        except Exception as e:
+            result["errors"].update({location_id: f"short_term: {e}" for location_id in location_ids})
+            continue
+        result["short_term"][days] = {loc: forecast.model_dump() for loc, forecast in forecasts.items()}
+    for location_id in location_ids:
+        try:
+            for months in config["seasonal_months"]:
+                forecast = await service.forecast_seasonal(location_id, months)
+                result["seasonal"].setdefault(months, {})[location_id] = forecast.model_dump()
+            result["flood"][location_id] = await service.predict_flood_raster(location_id)
+        except Exception as e:
+            result["errors"][location_id] = str(e)
+    return result
+
+
+def run_forecast_chunk(location_ids: List[str], config: Dict) -> Dict:
+    """Prévisions d'un groupe de localisations (fonction de module, exécutée dans le pool)"""
+    loop, service = _worker_service(config)
+    return loop.run_until_complete(_forecast_locations(service, location_ids, config))
+
+
+def run_dam_optimization(config: Dict) -> Dict:
+    """Optimisation des barrages pour chaque horizon du lot (exécutée dans le pool)"""
+    loop, service = _worker_service(config)
+    return {
+        days: loop.run_until_complete(service.optimize_dams(days)).model_dump()
+        for days in config["dam_days"]
+    }
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Valeur non sérialisable: {type(value).__name__}")
+
+
+def forecast_rows(run: Dict) -> List[tuple]:
+    """Lignes de la table forecasts (ordre FORECAST_COLUMNS) résumant un lot"""
+    rows = []
+    for days, forecasts in run["short_term"].items():
+        for location_id, f in forecasts.items():
+            rows.append((f["forecast_date"], location_id, "short_term", days,
+                         f["predicted_discharge_m3_s"], f["confidence_score"], "lstm"))
+    for months, forecasts in run["seasonal"].items():
+        for location_id, f in forecasts.items():
+            rows.append((f["forecast_date"], location_id, "seasonal", 30 * months,
+                         f["predicted_avg_discharge_m3_s"], f["skill_score"], "transformer"))
+    for location_id, (flood, _) in run["flood"].items():
+        rows.append((flood["forecast_date"], location_id, "flood", None,
+                     flood["affected_area_km2"], None, "convlstm"))
+    for days, optimization in run["dams"].items():
+        rows.append((optimization["optimization_date"], "basin", "dams", days,
+                     optimization["multi_objective_score"], None, "rl"))
+    return rows
+
+
+class BatchForecastRunner:
+    """
+    Exécution planifiée (toutes les `interval_hours`) des prévisions de toutes les
+    localisations; le pool de processus est créé au premier lot et conservé
+    (modèles entraînés une fois par processus).
+    """
+
+    def __init__(
+        self,
+        forecast_service: ForecastService,
+        location_ids: List[str],
+        path: str,
+        interval_hours: float = 6.0,
+        max_workers: Optional[int] = None,
+        short_term_days: Optional[List[int]] = None,
+        seasonal_months: Optional[List[int]] = None,
+        dam_days: Optional[List[int]] = None,
+        storage: Optional[HydroStorage] = None,
+        database_url: Optional[str] = None,
+        climatology_path: Optional[str] = None,
+        archive_dir: Optional[str] = None,
+        prepare_run: Optional[Callable[[], Awaitable]] = None
+    ):
+        self.forecast_service = forecast_service
+        self.location_ids = location_ids
+        self.path = path
+        self.interval = timedelta(hours=interval_hours)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.short_term_days = short_term_days or [10]
+        self.seasonal_months = seasonal_months or [3]
+        self.dam_days = dam_days or [10]
+        # Écriture des lots dans la table forecasts (None = fichiers locaux seulement)
+        self.storage = storage
+        self.database_url = database_url
+        self.climatology_path = climatology_path
+        # Archive lue (en lecture seule) par les workers; `prepare_run` la complète et
+        # persiste la climatologie avant chaque lot
+        self.archive_dir = archive_dir
+        self.prepare_run = prepare_run
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Dernier lot: (type, localisation, horizon) -> modèle Pydantic, grilles d'inondation à part
+        self.run: Optional[Dict] = None
+        self._results: Dict[Tuple[str, str, int], BaseModel] = {}
+        self._floods: Dict[str, Tuple[Dict, np.ndarray]] = {}
+        self._flood_models: Dict[str, FloodPrediction] = {}
+        self.running = False
+        self.next_run_at: Optional[datetime] = datetime.utcnow() if interval_hours > 0 else None
+
+        # Métriques
+        self.runs = 0
+        self.failures = 0
+        self.rows_written = 0
+        self.hits = 0
+        self.misses = 0
+        self.last_error: Optional[str] = None
+        self.history: deque = deque(maxlen=20)
+
+        if os.path.exists(os.path.join(path, "latest.json")):
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Erreur chargement du dernier lot de prévisions: {e}")
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: pas de fork d'un processus qui porte une boucle d'événements et des threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _config(self, run_id: str) -> Dict:
+        return {
+            "run_id": run_id,
+            "database_url": self.database_url,
+            "climatology_path": self.climatology_path,
+            "archive_dir": self.archive_dir,
+            "training_days": self.forecast_service.training_days,
+            "lstm_resample_factor": self.forecast_service.lstm.resample_factor,
+            "short_term_days": self.short_term_days,
+            "seasonal_months": self.seasonal_months,
+            "dam_days": self.dam_days,
+        }
+
+    # ---------- Exécution ----------
+
+    async def run_once(self) -> Dict:
+        """Calcule un lot complet, le publie puis le persiste; retourne son résumé"""
+        loop = asyncio.get_running_loop()
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        config = self._config(f"batch_{started_at:%Y%m%dT%H%M%S}")
+        if self.prepare_run is not None:
+            try:
+                await self.prepare_run()
+            except Exception as e:
+                print(f"Erreur préparation du lot de prévisions: {e}")
+        self.running = True
+        try:
+            groups = min(self.max_workers, len(self.location_ids))
+            chunks = [self.location_ids[i::groups] for i in range(groups)]
+            dams, *parts = await asyncio.gather(
+                loop.run_in_executor(self.pool, run_dam_optimization, config),
+                *[loop.run_in_executor(self.pool, run_forecast_chunk, chunk, config) for chunk in chunks]
+            )
+        finally:
+            self.running = False
+
+        run = {"short_term": {}, "seasonal": {}, "flood": {}, "dams": dams, "errors": {}}
+        for part in parts:
+            for kind in ("short_term", "seasonal"):
+                for horizon, forecasts in part[kind].items():
+                    run[kind].setdefault(horizon, {}).update(forecasts)
+            run["flood"].update(part["flood"])
+            run["errors"].update(part["errors"])
+        run["run"] = {
+            "run_id": config["run_id"],
+            "started_at": started_at.isoformat(),
+            "completed_at": datetime.utcnow().isoformat(),
+            "duration_seconds": time.perf_counter() - start,
+            "workers": groups,
+            "locations": len(self.location_ids) - len(run["errors"]),
+            "errors": run["errors"],
+        }
+        self._publish(run)
+
+        # Mosaïque, table forecasts, fichiers et alertes: le lot est déjà servi
+        await loop.run_in_executor(None, self.save, run)
+        if self.forecast_service.tile_store is not None:
+            for flood, grid in run["flood"].values():
+                await loop.run_in_executor(None, self.forecast_service.tile_store.write, grid, flood["bbox"])
+        if self.storage is not None and self.storage.connected:
+            self.rows_written += await self.storage.write_forecasts(forecast_rows(run))
+        days = self.short_term_days[0]
+        forecasts = [self._results[key] for key in self._results if key[0] == "short_term" and key[2] == days]
+        self.forecast_service.alert_engine.evaluate_forecasts(forecasts, LOCATION_DISCHARGE_BASE)
+
+        summary = {**run["run"], "duration_seconds": time.perf_counter() - start}
+        self.history.append(summary)
+        self.runs += 1
+        return summary
+
+    def _publish(self, run: Dict):
+        """Remplace le lot servi (dictionnaires reconstruits puis échangés d'un coup)"""
+        results = {}
+        for kind in ("short_term", "seasonal"):
+            for horizon, forecasts in run[kind].items():
+                for location_id, forecast in forecasts.items():
+                    results[(kind, location_id, int(horizon))] = RESULT_MODELS[kind].model_validate(forecast)
+        for horizon, optimization in run["dams"].items():
+            results[("dams", "basin", int(horizon))] = DamOptimization.model_validate(optimization)
+        self._results = results
+        self._floods = dict(run["flood"])
+        self._flood_models = {}
+        self.run = run["run"]
+
+    async def start(self):
+        if self.next_run_at is not None and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            delay = (self.next_run_at - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started_at = datetime.utcnow()
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"Erreur lot de prévisions: {e}")
+            self.next_run_at = max(started_at + self.interval, datetime.utcnow())
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # ---------- Service des résultats ----------
+
+    def _fresh(self) -> bool:
+        """Le dernier lot est servi tant qu'il a moins de deux périodes"""
+        if self.run is None:
+            return False
+        age = datetime.utcnow() - datetime.fromisoformat(self.run["started_at"])
+        return age < 2 * self.interval
+
+    def lookup(self, kind: str, location_id: str, horizon: int) -> Optional[BaseModel]:
+        """Résultat précalculé (None si absent, autre horizon ou lot périmé)"""
+        result = self._results.get((kind, location_id, horizon)) if self._fresh() else None
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def flood_raster(self, location_id: str) -> Optional[Tuple[Dict, np.ndarray]]:
+        """(métadonnées, grille) de la dernière prévision d'inondation planifiée"""
+        flood = self._floods.get(location_id) if self._fresh() else None
+        if flood is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return flood
+
+    def flood_prediction(self, location_id: str) -> Optional[FloodPrediction]:
+        flood = self.flood_raster(location_id)
+        if flood is None:
+            return None
+        # Conversion de la grille en listes une seule fois par lot
+        prediction = self._flood_models.get(location_id)
+        if prediction is None:
+            prediction = ForecastService._build_flood_prediction(*flood)
+            self._flood_models[location_id] = prediction
+        return prediction
+
+    @property
+    def run_id(self) -> Optional[str]:
+        return self.run["run_id"] if self.run else None
+
+    # ---------- Persistance ----------
+
+    def save(self, run: Dict):
+        """latest_flood.npz (grilles) puis latest.json, chacun remplacé atomiquement"""
+        os.makedirs(self.path, exist_ok=True)
+        grids_path = os.path.join(self.path, "latest_flood.npz")
+        with open(f"{grids_path}.tmp", "wb") as f:
+            np.savez_compressed(
+                f, run_id=np.array(run["run"]["run_id"]),
+                **{location_id: grid for location_id, (_, grid) in run["flood"].items()}
+            )
+        os.replace(f"{grids_path}.tmp", grids_path)
+
+        def encode(forecasts: Dict) -> Dict:
+            return {str(horizon): values for horizon, values in forecasts.items()}
+
+        payload = {
+            "version": BATCH_FORMAT_VERSION,
+            "run": run["run"],
+            "short_term": encode(run["short_term"]),
+            "seasonal": encode(run["seasonal"]),
+            "dams": encode(run["dams"]),
+            "flood": {location_id: flood for location_id, (flood, _) in run["flood"].items()},
+        }
+        path = os.path.join(self.path, "latest.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(payload, f, default=_json_default)
+        os.replace(f"{path}.tmp", path)
+
+    def load(self):
+        """Recharge le dernier lot persisté; le suivant est planifié une période après lui"""
+        with open(os.path.join(self.path, "latest.json")) as f:
+            payload = json.load(f)
+        if payload.get("version") != BATCH_FORMAT_VERSION:
+            return
+        with np.load(os.path.join(self.path, "latest_flood.npz")) as grids:
+            if str(grids["run_id"]) != payload["run"]["run_id"]:
+                return
+            flood = {
+                location_id: ({**meta, "forecast_date": datetime.fromisoformat(meta["forecast_date"])}, grids[location_id])
+                for location_id, meta in payload["flood"].items()
+            }
+        self._publish({**payload, "flood": flood})
+        if self.next_run_at is not None:
+            started_at = datetime.fromisoformat(self.run["started_at"])
+            self.next_run_at = max(started_at + self.interval, datetime.utcnow())
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "interval_hours": self.interval.total_seconds() / 3600,
+            "workers": self.max_workers,
+            "pool_started": self._pool is not None,
+            "running": self.running,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+            "last_run": self.run,
+            "serving": self._fresh(),
+            "results": len(self._results) + len(self._floods),
+            "horizons": {
+                "short_term_days": self.short_term_days,
+                "seasonal_months": self.seasonal_months,
+                "dam_days": self.dam_days,
+            },
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "rows_written": self.rows_written,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "recent_runs": list(self.history),
+        }
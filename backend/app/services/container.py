@@ -0,0 +1,350 @@
+"""
+Conteneur de services applicatifs.
+Construit DataService et ForecastService une seule fois par worker,
+les préchauffe au démarrage et expose un signal de disponibilité.
+"""
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.ai.climatology import MonthlyClimatology
+from app.ai.rolling_stats import RollingStatsEngine
+from app.storage.archive import HOUR, HistoryArchive
+from app.services.alert_engine import AlertEngine
+from app.services.batch_forecast import BatchForecastRunner
+from app.services.data_service import LOCATION_DISCHARGE_BASE, DataService
+from app.services.forecast_cache import ForecastCache
+from app.services.forecast_service import ForecastService
+from app.services.ingest_service import BufferedWriter, IngestService
+from app.services.live_hub import LiveHub
+from app.services.notifications import LocalSink, NotificationDispatcher, NotificationQueue, RecipientLimiter
+from app.services.scenario_service import ScenarioService
+from app.services.tile_store import FloodTileStore
+from app.storage.base import create_storage
+from app.storage.rollups import RollupStore
+
+
+def _int_list(value: str) -> List[int]:
+    """"10,15" -> [10, 15]"""
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+class ServiceContainer:
+    """Services partagés par toutes les requêtes (HTTP et WebSocket)"""
+
+    def __init__(
+        self,
+        warmup_locations: Optional[List[str]] = None,
+        tile_dir: Optional[str] = None
+    ):
+        # Stockage des mesures selon DATABASE_URL (postgresql:// ou sqlite:///), sinon simulation
+        self.storage = create_storage(os.environ.get("DATABASE_URL"))
+        self.storage_error: Optional[str] = None
+        # Archive horaire mappée en mémoire (longues séries sans tout charger en RAM)
+        self.archive = HistoryArchive(
+            os.environ.get("HISTORY_ARCHIVE_DIR", os.path.join(tempfile.gettempdir(), "aquamind_archive"))
+        )
+        # Agrégats journaliers/hebdomadaires tenus à jour à chaque écriture dans l'archive
+        self.rollups = RollupStore(self.archive)
+        # Statistiques glissantes des débits (30 jours), alimentées par l'archive
+        self.rolling_stats = RollingStatsEngine(
+            window_hours=int(os.environ.get("ROLLING_STATS_WINDOW_HOURS", "720"))
+        )
+        self.archive.add_listener(self._update_rolling_stats)
+        self.data_service = DataService(
+            db=None, storage=self.storage, archive=self.archive,
+            rollups=self.rollups, rolling_stats=self.rolling_stats
+        )
+        self.tile_store = FloodTileStore(
+            tile_dir or os.environ.get("FLOOD_TILE_DIR", os.path.join(tempfile.gettempdir(), "aquamind_tiles")),
+            resolution_deg=float(os.environ.get("FLOOD_TILE_RESOLUTION_DEG", "0.00027"))
+        )
+        self.forecast_cache = ForecastCache(
+            ttl_seconds=float(os.environ.get("CACHE_TTL_MINUTES", "5")) * 60,
+            max_entries=int(os.environ.get("FORECAST_CACHE_MAX_ENTRIES", "1024"))
+        )
+        # Pool de calcul: modèles (numpy/sklearn) hors de la boucle d'événements
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("FORECAST_WORKERS", str(min(8, (os.cpu_count() or 1) + 2)))),
+            thread_name_prefix="aquamind-forecast"
+        )
+        # Climatologie mensuelle (mise à jour en ligne): table climatology_monthly si une base
+        # est configurée (chargée au démarrage), sinon fichier JSON
+        self.climatology_path = os.environ.get(
+            "CLIMATOLOGY_PATH", os.path.join(tempfile.gettempdir(), "aquamind_climatology.json")
+        )
+        self.climatology = MonthlyClimatology(None if self.storage is not None else self.climatology_path)
+        # Alertes: règles évaluées à chaque cycle d'observation et de prévision
+        self.alert_engine = AlertEngine()
+        self.alert_interval = float(os.environ.get("ALERT_INTERVAL_SECONDS", "300"))
+        # Notifications des abonnés: file durable, workers par canal (fournisseurs locaux par défaut)
+        self.notifications = NotificationDispatcher(
+            NotificationQueue(os.environ.get(
+                "NOTIFICATION_QUEUE_PATH", os.path.join(tempfile.gettempdir(), "aquamind_notifications.db")
+            )),
+            self.alert_engine.subscriptions,
+            limiter=RecipientLimiter(
+                capacity=int(os.environ.get("NOTIFICATION_RECIPIENT_BURST", "3")),
+                per_hour=float(os.environ.get("NOTIFICATION_RECIPIENT_PER_HOUR", "6"))
+            ),
+            max_attempts=int(os.environ.get("NOTIFICATION_MAX_ATTEMPTS", "5"))
+        )
+        sink_dir = os.environ.get("NOTIFICATION_SINK_DIR")
+        for channel, batch in (("sms", 500), ("email", 100)):
+            self.notifications.register(
+                LocalSink(channel, max_batch=batch, path=os.path.join(sink_dir, f"{channel}.jsonl") if sink_dir else None),
+                workers=int(os.environ.get("NOTIFICATION_WORKERS", "2"))
+            )
+        self.alert_engine.add_listener(self.notifications.on_alert)
+        self.forecast_service = ForecastService(
+            self.data_service,
+            tile_store=self.tile_store,
+            cache=self.forecast_cache,
+            executor=self.executor,
+            climatology=self.climatology,
+            training_days=int(os.environ.get("TRAINING_HISTORY_DAYS", "90")),
+            alert_engine=self.alert_engine,
+            lstm_resample_factor=int(os.environ.get("LSTM_RESAMPLE_FACTOR", "1"))
+        )
+        # Prévisions planifiées de toutes les localisations (pool de processus), servies par /forecast/*
+        self.forecast_runner = BatchForecastRunner(
+            self.forecast_service,
+            self.data_service.get_location_ids(),
+            os.environ.get("FORECAST_BATCH_DIR", os.path.join(tempfile.gettempdir(), "aquamind_forecasts")),
+            interval_hours=float(os.environ.get("FORECAST_BATCH_HOURS", "6")),
+            max_workers=int(os.environ.get("FORECAST_BATCH_WORKERS", "0")) or None,
+            short_term_days=_int_list(os.environ.get("FORECAST_BATCH_DAYS", "10")),
+            seasonal_months=_int_list(os.environ.get("FORECAST_BATCH_MONTHS", "3")),
+            dam_days=_int_list(os.environ.get("FORECAST_BATCH_DAM_DAYS", "10")),
+            storage=self.storage,
+            database_url=os.environ.get("DATABASE_URL"),
+            climatology_path=self.climatology.path,
+            archive_dir=self.archive.root,
+            prepare_run=self.prepare_forecast_run
+        )
+        # Scénarios de lâchers: pool de processus démarré au premier lot
+        self.scenario_service = ScenarioService(
+            self.forecast_service,
+            max_workers=int(os.environ.get("SCENARIO_WORKERS", "0")) or None
+        )
+        # Diffusion temps réel: un producteur par localisation suivie
+        self.live_hub = LiveHub(
+            self.data_service,
+            interval_seconds=float(os.environ.get("LIVE_INTERVAL_SECONDS", "10")),
+            queue_size=int(os.environ.get("LIVE_QUEUE_SIZE", "8"))
+        )
+        # Ingestion capteurs: écriture par lots dans le stockage configuré
+        self.ingest_service: Optional[IngestService] = None
+        if self.storage is not None:
+            writer = BufferedWriter(
+                self.storage,
+                batch_rows=int(os.environ.get("INGEST_BATCH_ROWS", "5000")),
+                flush_interval=float(os.environ.get("INGEST_FLUSH_SECONDS", "2")),
+                max_pending_rows=int(os.environ.get("INGEST_MAX_PENDING_ROWS", "200000"))
+            )
+            writer.add_listener(self.data_service.note_ingested)
+            writer.add_listener(self.archive.write_frame)
+            writer.add_listener(self._evaluate_ingested_alerts)
+            self.ingest_service = IngestService(writer, executor=self.executor)
+        self.warmup_locations = warmup_locations or ["station_001"]
+
+        # État de préchauffage
+        self.ready = False
+        self.started_at = datetime.utcnow()
+        self.warmup_seconds: Optional[float] = None
+        self.warmup_error: Optional[str] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._alert_task: Optional[asyncio.Task] = None
+
+    async def startup(self):
+        """Lance le préchauffage en tâche de fond (le worker répond déjà à /health)"""
+        if self.storage is not None:
+            try:
+                await self.storage.connect()
+            except Exception as e:
+                # Base indisponible: le service continue sur données simulées
+                self.storage_error = str(e)
+                self.data_service.storage = None
+                self.ingest_service = None
+                self.forecast_runner.storage = None
+                self.forecast_runner.database_url = None
+                # Repli sur le fichier JSON de la climatologie
+                self.climatology.path = self.forecast_runner.climatology_path = self.climatology_path
+                if os.path.exists(self.climatology_path):
+                    self.climatology.load()
+                print(f"Erreur connexion stockage ({self.storage.backend}): {e}")
+        if self.data_service.storage is not None:
+            try:
+                self.climatology.load_records(await self.storage.read_climatology())
+            except Exception as e:
+                print(f"Erreur chargement climatologie ({self.storage.backend}): {e}")
+            try:
+                self.alert_engine.subscriptions.restore(await self.storage.read_subscriptions())
+            except Exception as e:
+                print(f"Erreur chargement abonnements ({self.storage.backend}): {e}")
+        if self.ingest_service is not None:
+            self.ingest_service.writer.start()
+        await self.notifications.start()
+        self._warmup_task = asyncio.create_task(self.warmup())
+        self._warmup_task.add_done_callback(self._report_task_error)
+
+    async def warmup(self):
+        """Entraîne les modèles et exécute une prévision par localisation"""
+        start = time.perf_counter()
+        try:
+            # Chargement initial de l'archive puis de la climatologie (ignorés si déjà persistées)
+            backfill_days = int(os.environ.get("HISTORY_BACKFILL_DAYS", "365"))
+            await self.data_service.backfill_archive(self.data_service.get_location_ids(), days_back=backfill_days)
+            await self.forecast_service.backfill_climatology(
+                self.data_service.get_location_ids(),
+                days_back=int(os.environ.get("CLIMATOLOGY_BACKFILL_DAYS", str(backfill_days)))
+            )
+            await self.save_climatology()
+            for location_id in self.data_service.get_location_ids():
+                self.rollups.build(location_id)
+            for location_id in self.warmup_locations:
+                await self.forecast_service.warmup(location_id)
+            # Amorce la mosaïque d'inondation pour toutes les localisations
+            for location_id in self.data_service.get_location_ids():
+                await self.forecast_service.predict_flood_raster(location_id)
+            if os.environ.get("SCENARIO_POOL_WARMUP", "1") == "1":
+                await self.scenario_service.warmup()
+        except Exception as e:
+            # /ready reste à 503: le load balancer n'envoie rien à ce worker
+            self.warmup_error = str(e)
+            print(f"Erreur préchauffage: {e}")
+            return
+        finally:
+            self.warmup_seconds = time.perf_counter() - start
+        self.ready = True
+        if self.alert_interval > 0:
+            self._alert_task = asyncio.create_task(self._alert_loop())
+            self._alert_task.add_done_callback(self._report_task_error)
+        # Après le préchauffage: la climatologie persistée est lue par les processus du lot
+        await self.forecast_runner.start()
+
+    async def shutdown(self):
+        """Arrêt propre du conteneur"""
+        self.ready = False
+        await self.live_hub.close()
+        if self.ingest_service is not None:
+            await self.ingest_service.writer.close()
+        await self.notifications.close()
+        await self.forecast_runner.close()
+        self.tile_store.flush()
+        try:
+            await self.save_climatology()
+        except Exception as e:
+            print(f"Erreur sauvegarde climatologie: {e}")
+        self.archive.close()
+        for task in (self._warmup_task, self._alert_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.scenario_service.shutdown()
+        if self.storage is not None and self.storage.connected:
+            await self.storage.close()
+
+    @staticmethod
+    def _report_task_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Erreur tâche de fond: {task.exception()}")
+
+    async def prepare_forecast_run(self):
+        """Avant un lot planifié: archive complétée jusqu'à l'heure courante et climatologie persistée"""
+        for location_id in self.data_service.get_location_ids():
+            await self.data_service.sync_archive(location_id)
+        await self.forecast_service.backfill_climatology(self.data_service.get_location_ids())
+        await self.save_climatology()
+
+    async def save_climatology(self):
+        """Persiste la climatologie: upsert dans climatology_monthly, fichier JSON sans base"""
+        if self.data_service.storage is not None:
+            await self.data_service.storage.write_climatology(self.climatology.to_records())
+        else:
+            self.climatology.save()
+
+    async def subscribe(self, location_id: str, alert_types: List[str], min_level: str, **attributes) -> Dict:
+        """Abonnement indexé puis enregistré dans la table subscriptions (si une base est configurée)"""
+        subscriptions = self.alert_engine.subscriptions
+        subscription = subscriptions.subscribe(location_id, alert_types, min_level, **attributes)
+        if self.data_service.storage is not None:
+            try:
+                await self.data_service.storage.write_subscription(subscription)
+            except Exception:
+                # Pas d'abonnement qui disparaîtrait au redémarrage
+                subscriptions.unsubscribe(subscription["subscription_id"])
+                raise
+        return subscription
+
+    async def unsubscribe(self, subscription_id: str) -> bool:
+        if not self.alert_engine.subscriptions.unsubscribe(subscription_id):
+            return False
+        if self.data_service.storage is not None:
+            await self.data_service.storage.deactivate_subscription(subscription_id)
+        return True
+
+    async def evaluate_alerts(self) -> List[Dict]:
+        """Cycle d'observation: règles d'alerte sur les métriques de toutes les localisations"""
+        location_ids = self.data_service.get_location_ids()
+        metrics = await self.data_service.get_locations_metrics(location_ids)
+        discharge = np.array([m.current_discharge for m in metrics], dtype=float)
+        columns = {
+            "discharge": discharge,
+            "discharge_ratio": discharge / np.array([LOCATION_DISCHARGE_BASE.get(loc, 800) for loc in location_ids]),
+            "discharge_percentile": np.array([np.nan if m.discharge_percentile is None else m.discharge_percentile for m in metrics]),
+            "discharge_zscore": np.array([np.nan if m.discharge_zscore is None else m.discharge_zscore for m in metrics]),
+        }
+        for hours in self.alert_engine.rise_windows():
+            columns[f"rise_{hours}h"] = self.rolling_stats.rise(location_ids, hours)
+        return self.alert_engine.evaluate_observations(
+            location_ids, columns, confidence=np.array([m.confidence for m in metrics])
+        )
+    
+    async def _evaluate_ingested_alerts(self, frame):
+        """Listener d'ingestion: nouveau cycle d'alertes après écriture des mesures"""
+        await self.evaluate_alerts()
+    
+    async def _alert_loop(self):
+        while True:
+            try:
+                await self.evaluate_alerts()
+            except Exception as e:
+                print(f"Erreur évaluation alertes: {e}")
+            await asyncio.sleep(self.alert_interval)
+    
+    def _update_rolling_stats(self, location_id: str, first_hour, last_hour):
+        """Listener de l'archive: pousse les heures écrites encore dans la fenêtre glissante"""
+        first_hour = max(first_hour, last_hour - (self.rolling_stats.window - 1) * HOUR)
+        arrays = self.archive.read(location_id, first_hour, last_hour + HOUR, ["discharge_m3_s"])
+        self.rolling_stats.update(location_id, arrays["timestamp"], arrays["discharge_m3_s"])
+    
+    def storage_stats(self) -> Dict:
+        """Pool, cache de requêtes et durées du stockage ({"backend": "simulated"} sinon)"""
+        if self.storage is None:
+            return {"backend": "simulated"}
+        return {
+            **self.storage.stats(),
+            "active": self.data_service.storage is not None,
+            "error": self.storage_error,
+        }
+
+    def readiness(self) -> Dict:
+        """Signal de disponibilité pour le load balancer"""
+        return {
+            "ready": self.ready,
+            "models_fitted": self.forecast_service.models_fitted,
+            "warmup_seconds": self.warmup_seconds,
+            "warmup_error": self.warmup_error,
+            "started_at": self.started_at.isoformat(),
+        }
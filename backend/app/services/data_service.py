@@ -7,22 +7,120 @@ import pandas as pd
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
 import asyncio
+from collections import OrderedDict
 from sqlalchemy.orm import Session
 
 from app.schemas.hydrological import (
     SensorReading, LocationMetrics, Basin, Dam, WaterStatus, AlertLevel
 )
+from app.ai.models import fill_gaps
+from app.ai.rolling_stats import PERCENTILE_BOUNDS, RollingStatsEngine
+from app.storage.archive import HistoryArchive
+from app.storage.base import HydroStorage
+from app.storage.rollups import ROLLUP_RESOLUTIONS, RollupStore, decimate, point_rollup_frame
+
+
+# Localisations suivies (stations hydrométriques + barrages)
+MONITORED_LOCATIONS = [
+    "station_001",
+    "station_002",
+    "station_003",
+    "dam_manantali",
+    "dam_diama",
+    "dam_felou",
+]
+
+# Débit caractéristique par localisation (m³/s)
+LOCATION_DISCHARGE_BASE = {
+    "station_001": 1250,  # Bakel (aval)
+    "station_002": 950,   # Matam (moyen)
+    "station_003": 550,   # Kaédi (fin moyen)
+    "dam_manantali": 1200,
+    "dam_diama": 800,
+    "dam_felou": 450,
+}
+
+LOCATION_NAMES = {
+    "station_001": "Bakel",
+    "station_002": "Matam",
+    "station_003": "Kaédi",
+    "dam_manantali": "Manantali",
+    "dam_diama": "Diama",
+    "dam_felou": "Félou",
+}
+
+# Coords approximées
+LOCATION_COORDINATES = {
+    "station_001": {"lat": 14.22, "lon": -11.92},
+    "station_002": {"lat": 14.13, "lon": -11.77},
+    "station_003": {"lat": 13.83, "lon": -13.15},
+    "dam_manantali": {"lat": 12.08, "lon": -7.98},
+    "dam_diama": {"lat": 14.72, "lon": -14.65},
+    "dam_felou": {"lat": 13.2, "lon": -8.1},
+}
+
+# État de l'eau selon le ratio débit / débit caractéristique (bornes croissantes)
+WATER_STATUS_RATIO_BOUNDS = np.array([0.5, 0.8, 1.3, 1.8])
+WATER_STATUS_ORDER = [
+    WaterStatus.CRITICAL_LOW,
+    WaterStatus.LOW,
+    WaterStatus.NORMAL,
+    WaterStatus.HIGH,
+    WaterStatus.CRITICAL_HIGH,
+]
+ALERT_LEVEL_BY_STATUS = [
+    AlertLevel.ALERTE,
+    AlertLevel.VIGILANCE,
+    AlertLevel.NORMAL,
+    AlertLevel.VIGILANCE,
+    AlertLevel.ALERTE_MAX,
+]
+
+
+def classify_water_status(discharge: np.ndarray, base_discharge: np.ndarray) -> np.ndarray:
+    """Indice dans WATER_STATUS_ORDER pour chaque localisation (vectorisé)"""
+    ratio = np.asarray(discharge, dtype=float) / np.asarray(base_discharge, dtype=float)
+    return np.searchsorted(WATER_STATUS_RATIO_BOUNDS, ratio, side='right')
+
+
+def classify_percentile(percentile: np.ndarray) -> np.ndarray:
+    """Indice dans WATER_STATUS_ORDER selon le rang centile (%) du débit sur 30 jours"""
+    return np.searchsorted(PERCENTILE_BOUNDS, np.asarray(percentile, dtype=float), side='right')
 
 
 class DataService:
     """Agrégateur de données hydrologiques multi-sources"""
     
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: Session,
+        historical_cache_size: int = 64,
+        storage: Optional[HydroStorage] = None,
+        archive: Optional[HistoryArchive] = None,
+        rollups: Optional[RollupStore] = None,
+        rolling_stats: Optional[RollingStatsEngine] = None
+    ):
         self.db = db
+        # Mesures persistées (hydrological_data); simulation si absent ou vide
+        self.storage = storage
+        # Archive horaire locale pour les longues séries (entraînement, historique)
+        self.archive = archive
+        # Agrégats journaliers/hebdomadaires dérivés de l'archive (graphiques)
+        self.rollups = rollups
+        # Moyenne/écart-type/quantiles glissants sur 30 jours (classification de l'état)
+        self.rolling_stats = rolling_stats
         # Données de bassin hardcodées (simulées)
         self.basins = self._init_basins()
         self.dams = self._init_dams()
         
+        # Séries historiques simulées, cache LRU par (localisation, jours)
+        self._rng = np.random.default_rng()
+        self._historical_cache: "OrderedDict[Tuple[str, int], pd.DataFrame]" = OrderedDict()
+        self._stored_cache: "OrderedDict[Tuple[str, int], pd.DataFrame]" = OrderedDict()
+        # Incrémenté quand des mesures arrivent pour des heures déjà révolues
+        self.data_version = 0
+        self.historical_cache_size = historical_cache_size
+        
     @staticmethod
     def _init_basins() -> Dict[str, Basin]:
         """Bassins du Sénégal"""
@@ -108,6 +206,36 @@ class DataService:
         """Tous les barrages"""
         return list(self.dams.values())
     
+    def data_watermark(self) -> str:
+        """
+        Repère de fraîcheur des données (heure courante: les séries sont horaires).
+        Change dès que de nouvelles données sont disponibles.
+        """
+        hour = pd.Timestamp(datetime.utcnow()).floor('H').isoformat()
+        return f"{hour}#{self.data_version}" if self.data_version else hour
+    
+    def note_ingested(self, frame: pd.DataFrame):
+        """
+        Après écriture de mesures: invalide les historiques en cache qui ne
+        les verraient pas (mesures antérieures à la dernière ligne lue).
+        """
+        if frame.empty:
+            return
+        earliest = frame.groupby('location_id')['timestamp'].min()
+        stale = [
+            key for key, cached in self._stored_cache.items()
+            if key[0] in earliest.index and earliest[key[0]] <= cached['timestamp'].iloc[-1]
+        ]
+        for key in stale:
+            del self._stored_cache[key]
+        current_hour = pd.Timestamp(datetime.utcnow()).floor('H')
+        if stale or earliest.min() < current_hour:
+            self.data_version += 1
+    
+    def get_location_ids(self) -> List[str]:
+        """Identifiants de toutes les localisations suivies"""
+        return list(MONITORED_LOCATIONS)
+    
     async def get_location_metrics(
         self, 
         location_id: str,
@@ -117,113 +245,101 @@ class DataService:
         Métriques agrégées pour une localisation.
         Simule des données réalistes du bassin Sénégal.
         """
-        # Données simulées réalistes (basées sur historique)
+        return (await self.get_locations_metrics([location_id], hours_back))[0]
+    
+    async def get_locations_metrics(
+        self,
+        location_ids: List[str],
+        hours_back: int = 24
+    ) -> List[LocationMetrics]:
+        """
+        Métriques pour plusieurs localisations en une passe.
+        Tirages et classification vectorisés sur toutes les localisations.
+        """
         now = datetime.utcnow()
+        n = len(location_ids)
+        rng = self._rng
         
-        # Débit caractéristique par localisation (m³/s)
-        discharge_base = {
-            "station_001": 1250,  # Bakel (aval)
-            "station_002": 950,   # Matam (moyen)
-            "station_003": 550,   # Kaédi (fin moyen)
-            "dam_manantali": 1200,
-            "dam_diama": 800,
-            "dam_felou": 450,
-        }
-        
-        base_discharge = discharge_base.get(location_id, 800)
+        base_discharge = np.array([LOCATION_DISCHARGE_BASE.get(loc, 800) for loc in location_ids], dtype=float)
         
         # Variabilité saisonnière (août=pic, février=creux)
-        seasonal_factor = 0.8 + 0.7 * np.sin(2 * np.pi * now.month / 12)
+        month_angle = 2 * np.pi * now.month / 12
+        seasonal_factor = 0.8 + 0.7 * np.sin(month_angle)
         
         # Bruit réaliste
-        discharge = base_discharge * seasonal_factor * (0.9 + np.random.random() * 0.2)
+        discharge = base_discharge * seasonal_factor * (0.9 + rng.random(n) * 0.2)
         water_level = 35.0 + discharge / 150  # Relation approximate
         
-        # Détermine l'état de l'eau
-        if discharge < base_discharge * 0.5:
-            water_status = WaterStatus.CRITICAL_LOW
-        elif discharge < base_discharge * 0.8:
-            water_status = WaterStatus.LOW
-        elif discharge < base_discharge * 1.3:
-            water_status = WaterStatus.NORMAL
-        elif discharge < base_discharge * 1.8:
-            water_status = WaterStatus.HIGH
-        else:
-            water_status = WaterStatus.CRITICAL_HIGH
-        
-        # Niveau d'alerte associé
-        alert_level_map = {
-            WaterStatus.CRITICAL_LOW: AlertLevel.ALERTE,
-            WaterStatus.LOW: AlertLevel.VIGILANCE,
-            WaterStatus.NORMAL: AlertLevel.NORMAL,
-            WaterStatus.HIGH: AlertLevel.VIGILANCE,
-            WaterStatus.CRITICAL_HIGH: AlertLevel.ALERTE_MAX,
-        }
-        alert_level = alert_level_map[water_status]
+        # État de l'eau et niveau d'alerte associé
+        status_index = classify_water_status(discharge, base_discharge)
         
         # Pluie (variabilité saisonnière, en mm/24h)
-        rainfall_24h = 5 + 25 * abs(np.sin(2 * np.pi * now.month / 12))
-        rainfall_24h *= (0.8 + np.random.random() * 0.4)
+        rainfall_24h = (5 + 25 * abs(np.sin(month_angle))) * (0.8 + rng.random(n) * 0.4)
         
         # Température (cycle annuel)
-        temperature = 25 + 8 * np.cos(2 * np.pi * now.month / 12)
-        temperature += 5 * np.sin(now.hour * 2 * np.pi / 24)
+        temperature = 25 + 8 * np.cos(month_angle) + 5 * np.sin(now.hour * 2 * np.pi / 24)
         
         # NDVI (indice végétation, [-1, 1], pic août)
-        ndvi = -0.2 + 0.7 * abs(np.sin(2 * np.pi * now.month / 12))
+        ndvi = -0.2 + 0.7 * abs(np.sin(month_angle))
         
         # Humidité des sols [0, 100]%
-        soil_moisture = 30 + 50 * abs(np.sin(2 * np.pi * now.month / 12))
-        soil_moisture *= (0.8 + np.random.random() * 0.4)
-        soil_moisture = min(100, max(0, soil_moisture))
+        soil_moisture = (30 + 50 * abs(np.sin(month_angle))) * (0.8 + rng.random(n) * 0.4)
+        soil_moisture = np.clip(soil_moisture, 0, 100)
         
         # Confiance (93-99%)
-        confidence = 0.93 + np.random.random() * 0.06
-        
-        # Map location_id to name
-        location_names = {
-            "station_001": "Bakel",
-            "station_002": "Matam",
-            "station_003": "Kaédi",
-            "dam_manantali": "Manantali",
-            "dam_diama": "Diama",
-            "dam_felou": "Félou",
-        }
+        confidence = 0.93 + rng.random(n) * 0.06
         
-        location_name = location_names.get(location_id, location_id)
-        location_type = "dam" if "dam" in location_id else "station"
-        
-        # Coords approximées
-        coords_map = {
-            "station_001": {"lat": 14.22, "lon": -11.92},
-            "station_002": {"lat": 14.13, "lon": -11.77},
-            "station_003": {"lat": 13.83, "lon": -13.15},
-            "dam_manantali": {"lat": 12.08, "lon": -7.98},
-            "dam_diama": {"lat": 14.72, "lon": -14.65},
-            "dam_felou": {"lat": 13.2, "lon": -8.1},
-        }
+        # Dernières mesures persistées, prioritaires sur la simulation
+        if self.storage is not None:
+            latest = await self._latest_stored(location_ids)
+            if latest is not None and not latest.empty:
+                source = pd.Index(latest['location_id']).get_indexer(location_ids)
+                for column, target in (('discharge_m3_s', discharge), ('water_level_m', water_level)):
+                    values = np.append(latest[column].values, np.nan)[source]
+                    valid = np.isfinite(values)
+                    target[valid] = values[valid]
+                status_index = classify_water_status(discharge, base_discharge)
         
-        coordinates = coords_map.get(location_id, {"lat": 14.0, "lon": -12.0})
-        
-        return LocationMetrics(
-            location_id=location_id,
-            location_name=location_name,
-            location_type=location_type,
-            coordinates=coordinates,
-            
-            current_discharge=discharge,
-            water_level=water_level,
-            water_status=water_status,
-            alert_level=alert_level,
-            
-            rainfall_24h=rainfall_24h,
-            temperature=temperature,
-            vegetation_ndvi=ndvi,
-            soil_moisture=soil_moisture,
-            
-            timestamp=now,
-            confidence=confidence
-        )
+        # Référence glissante (30 jours): rang centile plutôt que ratio au débit caractéristique,
+        # confiance selon le remplissage de la fenêtre
+        percentile = zscore = np.full(n, np.nan)
+        if self.rolling_stats is not None:
+            warm, percentile, zscore, coverage = self.rolling_stats.assess(location_ids, discharge)
+            status_index = np.where(warm, classify_percentile(percentile), status_index)
+            confidence = np.where(warm, 0.6 + 0.39 * coverage, confidence)
+        
+        # Scalaires Python pour la construction des modèles
+        discharge, water_level, rainfall_24h = discharge.tolist(), water_level.tolist(), rainfall_24h.tolist()
+        soil_moisture, confidence, status_index = soil_moisture.tolist(), confidence.tolist(), status_index.tolist()
+        percentile = [float(p) if np.isfinite(p) else None for p in percentile]
+        zscore = [float(z) if np.isfinite(z) else None for z in zscore]
+        temperature, ndvi = float(temperature), float(ndvi)
+        
+        return [
+            LocationMetrics(
+                location_id=location_id,
+                location_name=LOCATION_NAMES.get(location_id, location_id),
+                location_type="dam" if "dam" in location_id else "station",
+                coordinates=LOCATION_COORDINATES.get(location_id, {"lat": 14.0, "lon": -12.0}),
+                
+                current_discharge=discharge[i],
+                water_level=water_level[i],
+                water_status=WATER_STATUS_ORDER[status_index[i]],
+                alert_level=ALERT_LEVEL_BY_STATUS[status_index[i]],
+                
+                rainfall_24h=rainfall_24h[i],
+                temperature=temperature,
+                vegetation_ndvi=ndvi,
+                soil_moisture=soil_moisture[i],
+                
+                discharge_percentile=percentile[i],
+                discharge_zscore=zscore[i],
+                
+                timestamp=now,
+                confidence=confidence[i]
+            )
+            for i, location_id in enumerate(location_ids)
+        ]
     
     async def get_sensor_reading(self, station_id: str) -> SensorReading:
         """Lecture capteur (simule données IoT)"""
@@ -240,10 +356,10 @@ class DataService:
         discharge = base_discharge * (0.9 + np.random.random() * 0.2)
         
         water_quality = {
-            "ph": 7.0 + np.random.gauss(0, 0.3),
-            "conductivity_ms_cm": 300 + np.random.gauss(0, 50),
-            "turbidity_ntu": 80 + np.random.gauss(0, 30),
-            "dissolved_oxygen_mg_l": 7.0 + np.random.gauss(0, 0.5)
+            "ph": 7.0 + np.random.normal(0, 0.3),
+            "conductivity_ms_cm": 300 + np.random.normal(0, 50),
+            "turbidity_ntu": 80 + np.random.normal(0, 30),
+            "dissolved_oxygen_mg_l": 7.0 + np.random.normal(0, 0.5)
         }
         
         return SensorReading(
@@ -252,8 +368,8 @@ class DataService:
             timestamp=now,
             discharge_m3_s=discharge,
             water_level_m=35.0 + discharge / 150,
-            temperature_c=25 + np.random.gauss(0, 2),
-            rainfall_mm=max(0, 5 + np.random.gauss(0, 5)),
+            temperature_c=25 + np.random.normal(0, 2),
+            rainfall_mm=max(0, 5 + np.random.normal(0, 5)),
             water_quality=water_quality
         )
     
@@ -264,83 +380,278 @@ class DataService:
     ) -> pd.DataFrame:
         """
         Données historiques pour entraînement modèles.
-        Simule 90 jours de données avec variabilité saisonnière.
+        Simule `days_back` jours de données horaires avec variabilité saisonnière.
+        
+        Le résultat est mis en cache par (localisation, fenêtre) et prolongé
+        heure par heure: seules les heures manquantes sont générées.
+        Le DataFrame retourné est partagé: ne pas le modifier.
         """
-        dates = pd.date_range(end=datetime.utcnow(), periods=days_back * 24, freq='H')
-        
-        discharge_base = {
-            "station_001": 1250,
-            "station_002": 950,
-            "dam_manantali": 1200,
-        }.get(location_id, 1000)
-        
-        # Série temporelle réaliste avec tendances
-        discharge_values = []
-        rainfall_values = []
-        temp_values = []
-        ndvi_values = []
-        
-        for i, date in enumerate(dates):
-            # Tendance saisonnière
-            seasonal = discharge_base * (0.8 + 0.7 * np.sin(2 * np.pi * date.month / 12))
-            
-            # Tendance long terme (pas de changement pour stabilité)
-            long_term = 1.0
-            
-            # Bruit (AR(1) pour corrélation)
-            noise = np.random.gauss(0, 0.15)
-            
-            discharge = seasonal * long_term * (1 + noise)
-            discharge = max(100, discharge)  # Min threshold
-            
-            discharge_values.append(discharge)
-            
-            # Pluie
-            rain = max(0, 5 + 25 * np.sin(2 * np.pi * date.month / 12) + np.random.gauss(0, 10))
-            rainfall_values.append(rain)
-            
-            # Température
-            temp = 25 + 8 * np.cos(2 * np.pi * date.month / 12) + 5 * np.sin(date.hour * 2 * np.pi / 24) + np.random.gauss(0, 1)
-            temp_values.append(temp)
-            
-            # NDVI
-            ndvi = -0.2 + 0.7 * np.sin(2 * np.pi * date.month / 12) + np.random.gauss(0, 0.05)
-            ndvi_values.append(ndvi)
-        
-        df = pd.DataFrame({
-            'timestamp': dates,
-            'discharge_m3_s': discharge_values,
-            'rainfall_mm': rainfall_values,
-            'temperature_c': temp_values,
-            'ndvi': ndvi_values
-        })
+        end = pd.Timestamp(datetime.utcnow()).floor('H')
+        periods = days_back * 24
+        key = (location_id, days_back)
+        
+        if self.storage is not None:
+            stored = await self._get_stored_historical(location_id, days_back, end)
+            if stored is not None:
+                return stored
+        
+        cached = self._historical_cache.get(key)
+        if cached is not None:
+            self._historical_cache.move_to_end(key)
+            missing = int((end - cached['timestamp'].iloc[-1]) / pd.Timedelta(hours=1))
+            if missing == 0:
+                return cached
+            if 0 < missing < periods:
+                # Extension incrémentale: ajoute les nouvelles heures, retire les plus anciennes
+                new_dates = pd.date_range(end=end, periods=missing, freq='H')
+                df = pd.concat(
+                    [cached.iloc[missing:], self._generate_historical_frame(location_id, new_dates)],
+                    ignore_index=True
+                )
+                self._historical_cache[key] = df
+                return df
         
+        dates = pd.date_range(end=end, periods=periods, freq='H')
+        df = self._generate_historical_frame(location_id, dates)
+        
+        self._historical_cache[key] = df
+        if len(self._historical_cache) > self.historical_cache_size:
+            self._historical_cache.popitem(last=False)
         return df
     
+    async def get_history_arrays(
+        self,
+        location_id: str,
+        days_back: int = 90,
+        columns: Optional[List[str]] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Séries horaires {'timestamp', colonne: valeurs} des `days_back` derniers jours.
+        Depuis l'archive (vues sans copie, NaN pour les heures absentes) si elle couvre
+        la localisation, sinon colonnes de get_historical_data.
+        """
+        columns = columns or ['discharge_m3_s', 'rainfall_mm', 'temperature_c', 'ndvi']
+        if self.archive is not None and self.archive.has_data(location_id):
+            await self.sync_archive(location_id)
+            end = pd.Timestamp(datetime.utcnow()).floor('H') + pd.Timedelta(hours=1)
+            return self.archive.read(location_id, end - pd.Timedelta(days=days_back), end, columns)
+        
+        df = await self.get_historical_data(location_id, days_back)
+        return {
+            'timestamp': df['timestamp'].values,
+            **{column: df[column].values for column in columns if column in df.columns},
+        }
+    
+    async def iter_history(
+        self,
+        location_id: str,
+        days_back: int = 90,
+        columns: Optional[List[str]] = None,
+        chunk_hours: int = 24 * 90
+    ):
+        """
+        Historique par blocs de `chunk_hours` heures (plus ancien d'abord).
+        Avec l'archive, chaque bloc est lu séparément: la mémoire reste bornée
+        quelle que soit la profondeur demandée.
+        """
+        columns = columns or ['discharge_m3_s', 'rainfall_mm', 'temperature_c', 'ndvi']
+        if self.archive is None or not self.archive.has_data(location_id):
+            df = await self.get_historical_data(location_id, days_back)
+            for start in range(0, len(df), chunk_hours):
+                yield df.iloc[start:start + chunk_hours]
+            return
+        
+        await self.sync_archive(location_id)
+        end = pd.Timestamp(datetime.utcnow()).floor('H') + pd.Timedelta(hours=1)
+        cursor = end - pd.Timedelta(days=days_back)
+        step = pd.Timedelta(hours=chunk_hours)
+        while cursor < end:
+            stop = min(cursor + step, end)
+            yield self.archive.read_frame(location_id, cursor, stop, columns)
+            cursor = stop
+    
+    async def get_chart_series(
+        self,
+        location_id: str,
+        days_back: int,
+        columns: List[str],
+        resolution: Optional[str] = None,
+        max_points: Optional[int] = None
+    ) -> Tuple[str, pd.DataFrame]:
+        """
+        Série pour graphique: (résolution utilisée, seaux <colonne>_mean/_min/_max/_count).
+        Sans résolution imposée, la plus fine dont le nombre de seaux tient dans
+        `max_points`; au-delà (ou sans archive), décimation LTTB sur la première colonne.
+        """
+        end = pd.Timestamp(datetime.utcnow()).floor('H') + pd.Timedelta(hours=1)
+        start = end - pd.Timedelta(days=days_back)
+        driver = f"{columns[0]}_mean"
+        
+        if self.rollups is not None and self.archive is not None and self.archive.has_data(location_id):
+            await self.sync_archive(location_id)
+            if resolution is None:
+                fitting = [
+                    r for r in ROLLUP_RESOLUTIONS
+                    if max_points is None or self.rollups.estimated_points(days_back, r) <= max_points
+                ]
+                resolution = fitting[0] if fitting else list(ROLLUP_RESOLUTIONS)[-1]
+            frame = self.rollups.query(location_id, start, end, resolution, columns)
+        else:
+            # Sans archive: agrégation à la volée des données horaires
+            df = await self.get_historical_data(location_id, days_back)
+            resolution = resolution or "hourly"
+            frame = point_rollup_frame(df, columns)
+            if resolution != "hourly":
+                rule = {"daily": "D", "weekly": "W-MON"}[resolution]
+                grouped = df.set_index('timestamp')[columns].resample(rule, label='left', closed='left')
+                frame = pd.DataFrame({"timestamp": grouped.mean().index})
+                for column in columns:
+                    for stat in ("mean", "min", "max", "count"):
+                        frame[f"{column}_{stat}"] = getattr(grouped[column], stat)().values
+                frame = frame[frame[[f"{c}_count" for c in columns]].values.any(axis=1)].reset_index(drop=True)
+        
+        if max_points is not None and len(frame) > max_points:
+            frame = decimate(frame, max_points, driver)
+            resolution = f"{resolution}+lttb"
+        return resolution, frame
+    
+    async def sync_archive(self, location_id: str, days_back: int = 90) -> int:
+        """
+        Ajoute à l'archive les heures plus récentes que sa dernière heure archivée.
+        `days_back` ne sert qu'au chargement initial: ensuite tout l'écart est comblé.
+        Sans effet sur une archive en lecture seule (complétée par le processus qui l'écrit).
+        """
+        if self.archive.read_only:
+            return 0
+        last = self.archive.last_time(location_id)
+        current_hour = pd.Timestamp(datetime.utcnow()).floor('H')
+        if last is not None and last >= current_hour:
+            return 0
+        if last is not None:
+            days_back = int(np.ceil((current_hour - last) / pd.Timedelta(days=1))) + 1
+        df = await self.get_historical_data(location_id, days_back)
+        if last is not None:
+            df = df[df['timestamp'] > last]
+        return self.archive.write_frame(df.assign(location_id=location_id))
+    
+    async def backfill_archive(self, location_ids: List[str], days_back: int = 365) -> int:
+        """Chargement initial de l'archive pour les localisations qui n'y figurent pas"""
+        written = 0
+        for location_id in location_ids:
+            if not self.archive.has_data(location_id):
+                written += await self.sync_archive(location_id, days_back)
+        return written
+    
+    async def _latest_stored(self, location_ids: List[str]) -> Optional[pd.DataFrame]:
+        try:
+            return await self.storage.fetch_latest(location_ids)
+        except Exception as e:
+            print(f"Erreur lecture stockage (dernières mesures): {e}")
+            return None
+    
+    async def _get_stored_historical(
+        self,
+        location_id: str,
+        days_back: int,
+        end: pd.Timestamp
+    ) -> Optional[pd.DataFrame]:
+        """
+        Historique lu dans le stockage (requête par plage de temps).
+        En cache, seules les lignes postérieures à la dernière lue sont demandées.
+        None si la localisation n'a aucune mesure persistée.
+        """
+        key = (location_id, days_back)
+        window_start = end - pd.Timedelta(days=days_back) + pd.Timedelta(hours=1)
+        range_end = (end + pd.Timedelta(hours=1)).to_pydatetime()
+        cached = self._stored_cache.get(key)
+        try:
+            if cached is not None:
+                self._stored_cache.move_to_end(key)
+                last = cached['timestamp'].iloc[-1]
+                new_rows = await self.storage.fetch_range(
+                    location_id, (last + pd.Timedelta(seconds=1)).to_pydatetime(), range_end
+                )
+                if new_rows.empty and cached['timestamp'].iloc[0] >= window_start:
+                    return cached
+                df = pd.concat([cached, new_rows], ignore_index=True)
+                df = df[df['timestamp'] >= window_start].reset_index(drop=True)
+            else:
+                df = await self.storage.fetch_range(location_id, window_start.to_pydatetime(), range_end)
+        except Exception as e:
+            print(f"Erreur lecture stockage {location_id}: {e}")
+            return None
+        
+        if df.empty:
+            self._stored_cache.pop(key, None)
+            return None
+        self._stored_cache[key] = df
+        if len(self._stored_cache) > self.historical_cache_size:
+            self._stored_cache.popitem(last=False)
+        return df
+    
+    def _generate_historical_frame(
+        self,
+        location_id: str,
+        dates: pd.DatetimeIndex
+    ) -> pd.DataFrame:
+        """Génère les séries simulées colonne par colonne (vectorisé)"""
+        n = len(dates)
+        discharge_base = LOCATION_DISCHARGE_BASE.get(location_id, 1000)
+        
+        month_angle = 2 * np.pi * dates.month.values / 12
+        month_sin = np.sin(month_angle)
+        hour_sin = np.sin(dates.hour.values * 2 * np.pi / 24)
+        rng = self._rng
+        
+        # Tendance saisonnière (tendance long terme = 1.0 pour stabilité) + bruit
+        seasonal = discharge_base * (0.8 + 0.7 * month_sin)
+        discharge = np.maximum(100, seasonal * (1 + rng.normal(0, 0.15, n)))  # Min threshold
+        
+        # Pluie
+        rainfall = np.maximum(0, 5 + 25 * month_sin + rng.normal(0, 10, n))
+        
+        # Température
+        temperature = 25 + 8 * np.cos(month_angle) + 5 * hour_sin + rng.normal(0, 1, n)
+        
+        # NDVI
+        ndvi = -0.2 + 0.7 * month_sin + rng.normal(0, 0.05, n)
+        
+        return pd.DataFrame({
+            'timestamp': dates,
+            'discharge_m3_s': discharge,
+            'rainfall_mm': rainfall,
+            'temperature_c': temperature,
+            'ndvi': ndvi
+        })
+    
     async def get_forecast_inputs(
         self,
         location_id: str,
-        lookback_days: int = 90
+        recent_samples: int = 30
     ) -> Dict:
         """
         Prépare les entrées pour les modèles de prévision.
         Agrège données IoT + satellites + météo.
+        `recent_samples`: derniers pas horaires transmis (fenêtre du modèle court terme),
+        lus comme l'entraînement (get_history_arrays: archive d'abord, mesures ingérées comprises).
         """
-        # Historique
-        historical = await self.get_historical_data(location_id, lookback_days)
-        
-        # Données actuelles
-        current_metrics = await self.get_location_metrics(location_id)
+        # Historique + données actuelles (chargés en parallèle)
+        historical, current_metrics = await asyncio.gather(
+            self.get_history_arrays(location_id, -(-recent_samples // 24)),
+            self.get_location_metrics(location_id)
+        )
         
         return {
-            'historical_discharge': historical['discharge_m3_s'].values[-30:],  # 30 derniers jours
-            'historical_rainfall': historical['rainfall_mm'].values[-30:],
-            'historical_temperature': historical['temperature_c'].values[-30:],
-            'historical_ndvi': historical['ndvi'].values[-30:],
+            # Heures absentes de l'archive interpolées (comme à l'entraînement)
+            'historical_discharge': fill_gaps(historical['discharge_m3_s'][-recent_samples:]),
+            'historical_rainfall': historical['rainfall_mm'][-recent_samples:],
+            'historical_temperature': historical['temperature_c'][-recent_samples:],
+            'historical_ndvi': historical['ndvi'][-recent_samples:],
             'current_discharge': current_metrics.current_discharge,
             'current_water_level': current_metrics.water_level,
             'current_rainfall': current_metrics.rainfall_24h,
             'current_temperature': current_metrics.temperature,
             'current_ndvi': current_metrics.vegetation_ndvi,
             'current_soil_moisture': current_metrics.soil_moisture,
+            'current_metrics': current_metrics,
         }
@@ -0,0 +1,122 @@
+"""
+Cache des résultats de prévision.
+TTL, éviction LRU bornée et coalescence (single-flight) des calculs identiques.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class ForecastCache:
+    """
+    Clés attendues: (localisation, endpoint, horizon, version modèle, watermark données).
+    Les requêtes concurrentes sur une même clé partagent un seul calcul.
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+        # Compteurs
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.errors = 0
+        self.bypassed = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Valeur en cache si présente et non expirée (compte hit/miss)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+            self.expirations += 1
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        fresh: bool = False
+    ) -> Any:
+        """
+        Retourne la valeur en cache, rejoint un calcul en cours, ou lance le calcul.
+        Le calcul tourne dans sa propre tâche: l'annulation d'un client ne l'interrompt pas.
+        `fresh`: ignore la valeur en cache (un calcul déjà en cours est rejoint) et la remplace.
+        """
+        entry = self._entries.get(key)
+        if fresh:
+            self.bypassed += 1
+        elif entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        if entry is not None:
+            del self._entries[key]
+            if not fresh:
+                self.expirations += 1
+        self.misses += 1
+
+        task = asyncio.ensure_future(self._run(key, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await compute()
+        except Exception:
+            self.errors += 1
+            raise
+        else:
+            self.put(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def invalidate(self, location_id: Optional[str] = None):
+        """Vide le cache (entièrement ou pour une localisation)"""
+        if location_id is None:
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries if isinstance(k, tuple) and k and k[0] == location_id]:
+            del self._entries[key]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "bypassed": self.bypassed,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
@@ -2,69 +2,259 @@
 Service de prévision - orchestration des modèles IA.
 Gère l'ensemble LSTM + Transformer + ConvLSTM + GNN + RL.
 """
+from concurrent.futures import Executor
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
 import asyncio
+import base64
 import numpy as np
 import pandas as pd
 
 from app.schemas.hydrological import (
     ForecastShortTerm, ForecastSeasonal, FloodPrediction,
-    DamOptimization, AlertLevel, WaterStatus
+    DamOptimization, AlertLevel, WaterStatus, LocationMetrics
 )
-from app.services.data_service import DataService
+from app.services.alert_engine import AlertEngine
+from app.services.data_service import DataService, LOCATION_DISCHARGE_BASE, WATER_STATUS_RATIO_BOUNDS
+from app.services.forecast_cache import ForecastCache
+from app.services.raster_encoding import RASTER_MEDIA_TYPES, encode_raster
+from app.services.tile_store import FloodTileStore
+from app.ai.climatology import MonthlyClimatology
 from app.ai.models import (
     LSTMForecaster, TransformerSeasonalForecaster,
     FloodPredictionConvLSTM, GraphNeuralNetwork,
-    ReinforcementLearningOptimizer, EnsembleVotingPredictor
+    ReinforcementLearningOptimizer, EnsembleVotingPredictor, RoutingState
 )
 
 
 class ForecastService:
     """Orchestrateur des prévisions multi-modèles"""
     
-    def __init__(self, data_service: DataService):
+    def __init__(
+        self,
+        data_service: DataService,
+        tile_store: Optional[FloodTileStore] = None,
+        cache: Optional[ForecastCache] = None,
+        executor: Optional[Executor] = None,
+        climatology: Optional[MonthlyClimatology] = None,
+        training_days: int = 90,
+        alert_engine: Optional[AlertEngine] = None,
+        lstm_resample_factor: int = 1
+    ):
         self.data_service = data_service
-        self.lstm = LSTMForecaster()
-        self.transformer = TransformerSeasonalForecaster()
+        # Profondeur d'historique (jours) pour l'entraînement des modèles
+        self.training_days = training_days
+        # Pool pour les calculs CPU (None = exécuteur par défaut de la boucle)
+        self.executor = executor
+        # Mosaïque d'inondation servie en tuiles (optionnelle)
+        self.tile_store = tile_store
+        # Cache des résultats (TTL + coalescence des requêtes identiques)
+        self.cache = cache or ForecastCache()
+        # Règles d'alerte évaluées à chaque lot de prévisions court terme
+        self.alert_engine = alert_engine or AlertEngine()
+        # resample_factor=24: modèle court terme sur moyennes journalières
+        self.lstm = LSTMForecaster(resample_factor=lstm_resample_factor)
+        self.transformer = TransformerSeasonalForecaster(climatology)
         self.convlstm = FloodPredictionConvLSTM()
         self.gnn = GraphNeuralNetwork()
         self.rl = ReinforcementLearningOptimizer()
-        self.ensemble = EnsembleVotingPredictor()
+        # L'ensemble partage les instances ci-dessus (pas de seconde copie)
+        self.ensemble = EnsembleVotingPredictor(
+            lstm=self.lstm,
+            transformer=self.transformer,
+            convlstm=self.convlstm,
+            gnn=self.gnn,
+            rl=self.rl
+        )
+        
+        # Routage incrémental des observations (état propagé, jour 0 = aujourd'hui)
+        self.routing = RoutingState(self.gnn.compile(), days_ahead=30)
+        self._routing_date = datetime.utcnow().date()
         
         # Cache des modèles entraînés
         self._models_fitted = False
+        self._fit_lock = asyncio.Lock()
+        self._members_task: Optional[asyncio.Task] = None  # Membres bootstrap de l'ensemble
+        self.model_version = 0  # Incrémenté à chaque entraînement réussi
+    
+    @property
+    def models_fitted(self) -> bool:
+        return self._models_fitted
+    
+    async def _run_cpu(self, fn: Callable, *args):
+        """Exécute un calcul CPU hors de la boucle d'événements"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args))
+    
+    def _members_done(self, task: asyncio.Task):
+        """Échec (ou annulation) de l'entraînement des membres: le prochain appel relance"""
+        if task.cancelled() or task.exception() is not None:
+            if not task.cancelled():
+                print(f"Erreur membres ensemble: {task.exception()}")
+            if self._members_task is task:
+                self._members_task = None
+    
+    @staticmethod
+    def _report_tile_error(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Erreur écriture tuiles: {future.exception()}")
+    
+    def _fit_models(self, history: Dict[str, np.ndarray], location_id: str):
+        self.lstm.fit(history['discharge_m3_s'])
+        self.transformer.fit_series(history['timestamp'], history['discharge_m3_s'], location_id)
     
     async def _ensure_models_fitted(self, location_id: str):
         """Entraîne les modèles si nécessaire"""
-        if not self._models_fitted:
+        if self._models_fitted:
+            return
+        # Un seul entraînement même si plusieurs requêtes arrivent en même temps
+        async with self._fit_lock:
+            if self._models_fitted:
+                return
             try:
-                historical = await self.data_service.get_historical_data(location_id, days_back=90)
-                self.lstm.fit(historical['discharge_m3_s'].values)
-                self.transformer.fit(historical)
+                history = await self.data_service.get_history_arrays(
+                    location_id, days_back=self.training_days, columns=['discharge_m3_s']
+                )
+                await self._run_cpu(self._fit_models, history, location_id)
                 self._models_fitted = True
+                self.model_version += 1
             except Exception as e:
                 print(f"Erreur entraînement: {e}")
     
+    async def _ensure_members_fitted(self, location_id: str, wait: bool = True):
+        """
+        Entraîne les membres bootstrap de l'ensemble probabiliste (une seule fois).
+        Sans `wait`, l'entraînement part en tâche de fond: l'ensemble utilise le modèle
+        principal avec bruit d'entrée jusqu'à la fin.
+        """
+        if self._members_task is None:
+            async def fit():
+                history = await self.data_service.get_history_arrays(
+                    location_id, days_back=self.training_days, columns=['discharge_m3_s']
+                )
+                await self._run_cpu(self.ensemble.fit_members, history['discharge_m3_s'])
+                self.model_version += 1
+            self._members_task = asyncio.create_task(fit())
+            self._members_task.add_done_callback(self._members_done)
+        if wait:
+            await asyncio.shield(self._members_task)
+    
+    def _cache_key(self, location_id: str, endpoint: str, *horizon) -> Tuple:
+        """(localisation, endpoint, horizon, version modèle, watermark données)"""
+        return (location_id, endpoint, horizon, self.model_version, self.data_service.data_watermark())
+    
+    async def warmup(self, location_id: str):
+        """Préchauffe les modèles: entraînement + une passe de chaque prévision"""
+        await self._ensure_models_fitted(location_id)
+        await self._ensure_members_fitted(location_id)
+        await self.forecast_short_term(location_id)
+        await self.forecast_seasonal(location_id)
+        await self.predict_flood(location_id)
+        await self.optimize_dams()
+    
     async def forecast_short_term(
         self,
         station_id: str,
-        forecast_days: int = 10
+        forecast_days: int = 10,
+        inputs: Optional[Dict] = None,
+        fresh: bool = False
     ) -> ForecastShortTerm:
         """
         Prévision court terme (7-15 jours).
         Résolution: 1 jour.
         Confiance: 88%+ (NSE 0.88).
+        `inputs`: entrées déjà chargées (get_forecast_inputs), évite un second chargement.
+        `fresh`: recalcule sans servir le cache (le résultat le remplace).
         """
-        await self._ensure_models_fitted(station_id)
+        async def compute():
+            forecasts = await self._compute_short_term_batch(
+                [station_id], forecast_days, [inputs] if inputs is not None else None
+            )
+            return forecasts[station_id]
+        
+        return await self.cache.get_or_compute(
+            self._cache_key(station_id, "short_term", forecast_days), compute, fresh
+        )
+    
+    async def forecast_short_term_batch(
+        self,
+        station_ids: List[str],
+        forecast_days: int = 10,
+        fresh: bool = False
+    ) -> Dict[str, ForecastShortTerm]:
+        """
+        Prévision court terme pour plusieurs stations.
+        Seules les stations absentes du cache sont recalculées (toutes si `fresh`), en un seul lot.
+        """
+        results = {}
+        missing = []
+        for station_id in station_ids:
+            cached = None if fresh else self.cache.get(self._cache_key(station_id, "short_term", forecast_days))
+            if cached is None:
+                missing.append(station_id)
+            else:
+                results[station_id] = cached
+        
+        if missing:
+            computed = await self._compute_short_term_batch(missing, forecast_days)
+            for station_id, forecast in computed.items():
+                self.cache.put(self._cache_key(station_id, "short_term", forecast_days), forecast)
+            results.update(computed)
+        
+        return {station_id: results[station_id] for station_id in station_ids}
+    
+    async def _compute_short_term_batch(
+        self,
+        station_ids: List[str],
+        forecast_days: int = 10,
+        inputs: Optional[List[Dict]] = None
+    ) -> Dict[str, ForecastShortTerm]:
+        """
+        Toutes les stations et tous les horizons sont prédits ensemble
+        (un appel modèle par jour d'horizon, quel que soit le nombre de stations).
+        """
+        if not station_ids:
+            return {}
+        await self._ensure_models_fitted(station_ids[0])
         
         # Récupère données
-        forecast_inputs = await self.data_service.get_forecast_inputs(station_id)
-        recent_discharge = forecast_inputs['historical_discharge']
+        if inputs is None:
+            inputs = await asyncio.gather(*[
+                self.data_service.get_forecast_inputs(station_id, recent_samples=self.lstm.input_samples)
+                for station_id in station_ids
+            ])
+        recent = [forecast_inputs['historical_discharge'] for forecast_inputs in inputs]
         
         # Prévisions
-        lstm_forecast, lstm_ci, drivers = self.lstm.forecast(recent_discharge, forecast_days)
+        lstm_forecasts, (ci_low, ci_high), drivers = await self._run_cpu(
+            self.lstm.forecast_batch, recent, forecast_days
+        )
         
+        forecasts = {
+            station_id: self._build_short_term(
+                station_id,
+                forecast_days,
+                lstm_forecasts[i],
+                (ci_low[i], ci_high[i]),
+                drivers[i],
+                recent[i]
+            )
+            for i, station_id in enumerate(station_ids)
+        }
+        self.alert_engine.evaluate_forecasts(list(forecasts.values()), LOCATION_DISCHARGE_BASE)
+        return forecasts
+    
+    def _build_short_term(
+        self,
+        station_id: str,
+        forecast_days: int,
+        lstm_forecast: np.ndarray,
+        lstm_ci: Tuple[np.ndarray, np.ndarray],
+        drivers: Dict[str, float],
+        recent_discharge: np.ndarray
+    ) -> ForecastShortTerm:
+        """Construit la prévision court terme d'une station (niveau d'alerte inclus)"""
         # Estime alerte
         forecast_mean = np.mean(lstm_forecast[:3])
         base_discharge = np.mean(recent_discharge)
@@ -101,17 +291,58 @@ class ForecastService:
             drivers=drivers
         )
     
+    async def backfill_climatology(self, location_ids: List[str], days_back: int = 365) -> int:
+        """Chargement initial (`days_back` jours) ou rattrapage de la climatologie de chaque localisation"""
+        loaded = 0
+        for location_id in location_ids:
+            loaded += await self.sync_climatology(location_id, days_back)
+        return loaded
+    
+    async def sync_climatology(self, location_id: str, days_back: int = 365) -> int:
+        """
+        Intègre à la climatologie les heures de l'historique (archive d'abord, mesures
+        ingérées comprises) postérieures à sa dernière observation; `days_back` jours
+        si la localisation n'en a aucune.
+        """
+        climatology = self.transformer.climatology
+        last = climatology.last_seen(location_id)
+        if last is not None:
+            elapsed = pd.Timestamp(datetime.utcnow()) - last
+            if elapsed < pd.Timedelta(hours=1):
+                return 0
+            days_back = int(np.ceil(elapsed / pd.Timedelta(days=1)))
+        history = await self.data_service.get_history_arrays(
+            location_id, days_back=days_back, columns=['discharge_m3_s']
+        )
+        return await self._run_cpu(
+            climatology.update, location_id, history['timestamp'], history['discharge_m3_s']
+        )
+    
     async def forecast_seasonal(
         self,
         station_id: str,
-        forecast_months: int = 3
+        forecast_months: int = 3,
+        fresh: bool = False
     ) -> ForecastSeasonal:
         """
         Prévision saisonnière (3-6 mois).
         Skill score: 0.65 (Transformers).
         Inclut impact ENSO.
         """
+        return await self.cache.get_or_compute(
+            self._cache_key(station_id, "seasonal", forecast_months),
+            lambda: self._compute_seasonal(station_id, forecast_months),
+            fresh
+        )
+    
+    async def _compute_seasonal(
+        self,
+        station_id: str,
+        forecast_months: int
+    ) -> ForecastSeasonal:
         await self._ensure_models_fitted(station_id)
+        # Climatologie à jour: seules les heures postérieures à sa dernière observation sont lues
+        await self.sync_climatology(station_id)
         
         # Prévision saisonnière
         current_month = datetime.utcnow().month
@@ -123,7 +354,8 @@ class ForecastService:
         seasonal_pred = self.transformer.forecast(
             current_month,
             forecast_months,
-            enso_phase
+            enso_phase,
+            location_id=station_id
         )
         
         forecast_date = datetime.utcnow()
@@ -147,17 +379,52 @@ class ForecastService:
     
     async def predict_flood(
         self,
-        station_id: str
+        station_id: str,
+        metrics: Optional[LocationMetrics] = None,
+        fresh: bool = False
     ) -> FloodPrediction:
         """
         Prédiction des inondations spatiales (résolution 30m).
         Utilise ConvLSTM sur images satellites.
         """
+        async def compute():
+            flood, grid = await self.predict_flood_raster(station_id, metrics, fresh)
+            return await self._run_cpu(self._build_flood_prediction, flood, grid)
+        
+        return await self.cache.get_or_compute(self._cache_key(station_id, "flood"), compute, fresh)
+    
+    @staticmethod
+    def _build_flood_prediction(flood: Dict, grid: np.ndarray) -> FloodPrediction:
+        return FloodPrediction(inundation_probability_map=grid.tolist(), **flood)
+    
+    async def predict_flood_raster(
+        self,
+        station_id: str,
+        metrics: Optional[LocationMetrics] = None,
+        fresh: bool = False
+    ) -> Tuple[Dict, np.ndarray]:
+        """
+        Prédiction des inondations sous forme de grille brute.
+        Retourne (métadonnées FloodPrediction sans la carte, grille ndarray).
+        """
+        return await self.cache.get_or_compute(
+            self._cache_key(station_id, "flood_raster"),
+            lambda: self._compute_flood_raster(station_id, metrics),
+            fresh
+        )
+    
+    async def _compute_flood_raster(
+        self,
+        station_id: str,
+        metrics: Optional[LocationMetrics] = None
+    ) -> Tuple[Dict, np.ndarray]:
         # Métrique actuelle
-        metrics = await self.data_service.get_location_metrics(station_id)
+        if metrics is None:
+            metrics = await self.data_service.get_location_metrics(station_id)
         
         # Prédiction
-        flood_results = self.convlstm.predict_inundation(
+        flood_results = await self._run_cpu(
+            partial(self.convlstm.predict_inundation, as_array=True),
             metrics.current_discharge,
             np.array([metrics.current_discharge] * 10),  # Mock historique
             station_id
@@ -173,27 +440,43 @@ class ForecastService:
             "west": metrics.coordinates['lon'] - 0.3,
         }
         
-        return FloodPrediction(
-            prediction_id=prediction_id,
-            forecast_date=datetime.utcnow(),
-            grid_resolution_m=30,
-            bbox=bbox,
+        flood = {
+            "prediction_id": prediction_id,
+            "forecast_date": datetime.utcnow(),
+            "grid_resolution_m": 30,
+            "bbox": bbox,
             
-            inundation_probability_map=flood_results['inundation_probability_map'],
-            affected_area_km2=flood_results['affected_area_km2'],
-            affected_population=flood_results['affected_population'],
-            critical_zones=flood_results['critical_zones']
-        )
+            "affected_area_km2": flood_results['affected_area_km2'],
+            "affected_population": flood_results['affected_population'],
+            "critical_zones": flood_results['critical_zones']
+        }
+        grid = flood_results['inundation_probability_map']
+        
+        if self.tile_store is not None:
+            # Mise à jour de la mosaïque en arrière-plan (n'allonge pas la réponse)
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self.tile_store.write, grid, bbox)
+            future.add_done_callback(self._report_tile_error)
+        
+        return flood, grid
     
     async def optimize_dams(
         self,
-        forecast_days: int = 10
+        forecast_days: int = 10,
+        fresh: bool = False
     ) -> DamOptimization:
         """
         Optimisation de la gestion des 3 barrages (Manantali, Diama, Félou).
         Utilise Reinforcement Learning.
         Amélioration: +15-20% vs règles manuelles.
         """
+        return await self.cache.get_or_compute(
+            self._cache_key("basin", "dams", forecast_days),
+            lambda: self._compute_dam_optimization(forecast_days),
+            fresh
+        )
+    
+    def dam_state(self, forecast_days: int) -> Tuple[Dict[str, float], Dict[str, float], np.ndarray]:
+        """(apports actuels, niveaux actuels %, apports prévus à Manantali) des barrages"""
         # Apport prévisionnel (simple pour démo)
         forecast_inflows = np.linspace(1200, 1400, forecast_days)
         
@@ -208,9 +491,14 @@ class ForecastService:
             "diama": 950,
             "felou": 400,
         }
+        return current_inflows, current_levels, forecast_inflows
+    
+    async def _compute_dam_optimization(self, forecast_days: int) -> DamOptimization:
+        current_inflows, current_levels, forecast_inflows = self.dam_state(forecast_days)
         
-        # Recommandation RL
-        optimization = self.rl.optimize(
+        # Recommandation: recherche par population sur la cascade simulée
+        optimization = await self._run_cpu(
+            self.rl.optimize,
             current_inflows,
             current_levels,
             forecast_inflows
@@ -233,66 +521,210 @@ class ForecastService:
             expected_environmental_benefit=optimization['expected_environmental_benefit'],
             
             multi_objective_score=optimization['multi_objective_score'],
-            improvement_vs_manual=optimization['improvement_vs_manual']
+            improvement_vs_manual=optimization['improvement_vs_manual'],
+            
+            release_schedule_m3_s=optimization['release_schedule_m3_s'],
+            pareto_front=optimization['pareto_front']
         )
     
+    async def propagate_network(
+        self,
+        sources: List[str],
+        anomalies: List[float],
+        days_ahead: int = 10,
+        include_series: bool = False
+    ) -> Dict:
+        """
+        Propagation de crues à travers le réseau pour plusieurs scénarios (GNN).
+        Pic, jour du pic et jour d'arrivée par nœud (listes alignées sur `nodes`).
+        """
+        unknown = sorted(set(sources) - set(self.gnn.nodes))
+        if unknown:
+            raise ValueError(f"Nœuds inconnus: {', '.join(unknown)}")
+        return await self._run_cpu(self._compute_propagation, sources, anomalies, days_ahead, include_series)
+    
+    def _compute_propagation(
+        self,
+        sources: List[str],
+        anomalies: List[float],
+        days_ahead: int,
+        include_series: bool
+    ) -> Dict:
+        series = self.gnn.propagate_batch(sources, anomalies, days_ahead)
+        magnitude = np.abs(series)
+        
+        # Pic (en valeur absolue: crue ou étiage) et premier jour au-delà de 1% de l'anomalie
+        peak_day = magnitude.argmax(axis=1)
+        peak = np.take_along_axis(series, peak_day[:, None, :], axis=1)[:, 0, :] + 0.0  # pas de -0.0
+        reached = magnitude > 0.01 * np.abs(np.asarray(anomalies, dtype=float))[:, None, None]
+        arrival_day = np.where(reached.any(axis=1), reached.argmax(axis=1), -1)
+        
+        scenarios = []
+        for i, (source, anomaly) in enumerate(zip(sources, anomalies)):
+            scenario = {
+                "source": source,
+                "discharge_anomaly_m3_s": anomaly,
+                "peak_m3_s": peak[i].tolist(),
+                "peak_day": peak_day[i].tolist(),
+                "arrival_day": arrival_day[i].tolist(),
+            }
+            if include_series:
+                scenario["series"] = series[i].tolist()
+            scenarios.append(scenario)
+        
+        return {
+            "days_ahead": days_ahead,
+            "nodes": self.gnn.compile().node_ids,
+            "scenarios": scenarios,
+        }
+    
+    def _advance_routing(self):
+        """Aligne le jour 0 de l'état de routage sur la date courante"""
+        today = datetime.utcnow().date()
+        elapsed = (today - self._routing_date).days
+        if elapsed > 0:
+            self.routing.advance(elapsed)
+            self._routing_date = today
+    
+    def route_observation(self, node_id: str, discharge_anomaly: float, day: int = 0) -> Dict:
+        """
+        Intègre une anomalie observée à un nœud: seul l'aval est recalculé.
+        Retourne la variation par nœud affecté et son nouveau pic.
+        """
+        if node_id not in self.gnn.nodes:
+            raise ValueError(f"Nœud inconnu: {node_id}")
+        self._advance_routing()
+        delta = self.routing.update(node_id, discharge_anomaly, day)
+        
+        state = self.routing.state
+        index = self.routing.operator.index
+        return {
+            "node": node_id,
+            "day": day,
+            "discharge_anomaly_m3_s": discharge_anomaly,
+            "affected": {
+                node: {
+                    "delta_m3_s": change.tolist(),
+                    "peak_m3_s": float(state[np.abs(state[:, index[node]]).argmax(), index[node]]),
+                }
+                for node, change in delta.items()
+            },
+        }
+    
+    def routing_snapshot(self) -> Dict:
+        """État courant du routage (listes alignées sur `nodes`)"""
+        self._advance_routing()
+        state = self.routing.state
+        peak_day = np.abs(state).argmax(axis=0)
+        return {
+            "date": self._routing_date.isoformat(),
+            "days_ahead": self.routing.days_ahead,
+            "nodes": self.routing.operator.node_ids,
+            "peak_m3_s": (state[peak_day, np.arange(state.shape[1])] + 0.0).tolist(),
+            "peak_day": peak_day.tolist(),
+            "today_m3_s": (state[0] + 0.0).tolist(),
+        }
+    
     async def generate_alerts(
         self,
         forecast: ForecastShortTerm
     ) -> List[Dict]:
         """
-        Génère alertes hydrologiques basées sur prévisions.
+        Alertes de prévision actives pour la station. Les règles sont déjà évaluées
+        à chaque lot court terme (_compute_short_term_batch): simple lecture du moteur.
         """
-        alerts = []
-        now = datetime.utcnow()
-        
-        # Alerte crue
-        if forecast.predicted_alert_level == AlertLevel.ALERTE_MAX:
-            alerts.append({
-                "alert_id": f"flood_{forecast.station_id}_{now.timestamp()}",
-                "alert_type": "flood",
-                "alert_level": "alerte_max",
-                "trigger_date": now,
-                "event_expected_date": now + timedelta(days=forecast.forecast_horizon_days),
-                "lead_time_days": forecast.forecast_horizon_days,
-                "message_en": f"SEVERE FLOOD WARNING: High-magnitude discharge predicted ({forecast.predicted_discharge_m3_s:.0f} m³/s)",
-                "message_fr": f"ALERTE CRUE SEVèRE: Débit élevé prévu ({forecast.predicted_discharge_m3_s:.0f} m³/s)",
-                "confidence": forecast.confidence_score
-            })
-        
-        # Alerte sécheresse
-        if forecast.predicted_alert_level == AlertLevel.ALERTE and forecast.predicted_discharge_m3_s < 600:
-            alerts.append({
-                "alert_id": f"drought_{forecast.station_id}_{now.timestamp()}",
-                "alert_type": "drought",
-                "alert_level": "alerte",
-                "trigger_date": now,
-                "event_expected_date": now + timedelta(days=3),
-                "lead_time_days": forecast.forecast_horizon_days,
-                "message_en": f"DROUGHT WARNING: Low flow ({forecast.predicted_discharge_m3_s:.0f} m³/s)",
-                "message_fr": f"ALERTE SéCHERESSE: Débit faible ({forecast.predicted_discharge_m3_s:.0f} m³/s)",
-                "confidence": forecast.confidence_score
-            })
-        
-        return alerts
+        return [
+            alert for alert in self.alert_engine.query(location_id=forecast.station_id)
+            if alert["source"] == "forecast"
+        ]
     
     async def get_ensemble_forecast(
         self,
         location_id: str,
-        forecast_days: int = 10
+        forecast_days: int = 10,
+        raster_format: Optional[str] = None,
+        raster_dtype: str = "uint8",
+        n_members: int = 128
+    ) -> Dict:
+        """
+        Ensemble complet de prévisions.
+        `raster_format` (raw, npy, png): la carte d'inondation est encodée en base64
+        au lieu d'une matrice JSON.
+        `n_members`: taille de l'ensemble probabiliste (Monte Carlo).
+        """
+        return await self.cache.get_or_compute(
+            self._cache_key(location_id, "ensemble", forecast_days, raster_format, raster_dtype, n_members),
+            lambda: self._compute_ensemble(location_id, forecast_days, raster_format, raster_dtype, n_members)
+        )
+    
+    @staticmethod
+    def flood_thresholds(location_id: str) -> Dict[str, float]:
+        """Seuils de débit (m³/s) des états 'high' et 'critical_high' de la localisation"""
+        base = LOCATION_DISCHARGE_BASE.get(location_id, 800)
+        return {
+            "high": float(base * WATER_STATUS_RATIO_BOUNDS[2]),
+            "critical_high": float(base * WATER_STATUS_RATIO_BOUNDS[3]),
+        }
+    
+    async def _compute_ensemble(
+        self,
+        location_id: str,
+        forecast_days: int,
+        raster_format: Optional[str],
+        raster_dtype: str,
+        n_members: int = 128
     ) -> Dict:
-        """Ensemble complet de prévisions"""
-        short_term = await self.forecast_short_term(location_id, forecast_days)
-        seasonal = await self.forecast_seasonal(location_id, 3)
-        flood = await self.predict_flood(location_id)
-        dam_opt = await self.optimize_dams(forecast_days)
+        """
+        Sous-prévisions indépendantes lancées en parallèle.
+        Entrées partagées (historique, métriques actuelles) chargées une seule fois.
+        """
+        await self._ensure_models_fitted(location_id)
+        await self._ensure_members_fitted(location_id, wait=False)
+        inputs = await self.data_service.get_forecast_inputs(location_id, recent_samples=self.lstm.input_samples)
+        
+        short_term, seasonal, flood, dam_opt, probabilistic = await asyncio.gather(
+            self.forecast_short_term(location_id, forecast_days, inputs=inputs),
+            self.forecast_seasonal(location_id, 3),
+            self._ensemble_flood(location_id, inputs['current_metrics'], raster_format, raster_dtype),
+            self.optimize_dams(forecast_days),
+            self._run_cpu(
+                self.ensemble.ensemble_forecast,
+                inputs['historical_discharge'], None, location_id, forecast_days,
+                n_members, self.flood_thresholds(location_id)
+            )
+        )
         alerts = await self.generate_alerts(short_term)
         
         return {
             "short_term_forecast": short_term,
+            "probabilistic_forecast": probabilistic,
             "seasonal_forecast": seasonal,
             "flood_prediction": flood,
             "dam_optimization": dam_opt,
             "generated_alerts": alerts,
             "generated_at": datetime.utcnow()
         }
+    
+    async def _ensemble_flood(
+        self,
+        location_id: str,
+        metrics: LocationMetrics,
+        raster_format: Optional[str],
+        raster_dtype: str
+    ):
+        """Carte d'inondation de l'ensemble: JSON ou raster encodé en base64"""
+        if not raster_format or raster_format == "json":
+            return await self.predict_flood(location_id, metrics)
+        
+        flood_meta, grid = await self.predict_flood_raster(location_id, metrics)
+        payload = await self._run_cpu(encode_raster, grid, raster_format, raster_dtype, flood_meta["bbox"])
+        flood = dict(flood_meta)
+        flood["inundation_raster"] = {
+            "format": raster_format,
+            "media_type": RASTER_MEDIA_TYPES[raster_format],
+            "dtype": "uint8" if raster_format == "png" else raster_dtype,
+            "shape": list(grid.shape),
+            "encoding": "base64",
+            "data": base64.b64encode(payload).decode("ascii"),
+        }
+        return flood
@@ -0,0 +1,160 @@
+"""
+Export en flux des séries historiques (/locations/{id}/historical).
+Les données sont encodées par blocs (JSON, NDJSON, CSV, Arrow IPC) et les
+statistiques de synthèse sont cumulées au fil des blocs (une seule passe).
+"""
+import io
+import json
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+# Formats disponibles -> type MIME
+HISTORY_MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def negotiate_history_format(accept: Optional[str], requested: Optional[str] = None) -> str:
+    """Paramètre `format` explicite, sinon en-tête Accept; JSON par défaut"""
+    if requested:
+        requested = requested.lower()
+        if requested not in HISTORY_MEDIA_TYPES:
+            raise ValueError(f"Format inconnu: {requested}")
+    elif accept:
+        for part in accept.split(","):
+            media_type = part.split(";")[0].strip().lower()
+            requested = next((fmt for fmt, known in HISTORY_MEDIA_TYPES.items() if known == media_type), None)
+            if requested:
+                break
+    requested = requested or "json"
+    if requested == "arrow" and pa is None:
+        raise ValueError("Format arrow indisponible (pyarrow non installé)")
+    return requested
+
+
+class RunningStats:
+    """Compteur, moyenne, M2, min, max par colonne, fusionnés bloc par bloc (Chan)"""
+
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+        k = len(columns)
+        self.count = np.zeros(k, dtype=np.int64)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+
+    def update(self, values: np.ndarray):
+        """`values`: (lignes, colonnes), NaN ignorés"""
+        present = ~np.isnan(values)
+        count_b = present.sum(axis=0)
+        seen = count_b > 0
+        if not seen.any():
+            return
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_b = np.where(seen, np.nansum(values, axis=0) / np.maximum(count_b, 1), 0.0)
+            m2_b = np.nansum((values - mean_b) ** 2, axis=0)
+        total = self.count + count_b
+        delta = mean_b - self.mean
+        safe_total = np.maximum(total, 1)
+        self.mean = np.where(seen, self.mean + delta * count_b / safe_total, self.mean)
+        self.m2 = np.where(seen, self.m2 + m2_b + delta ** 2 * self.count * count_b / safe_total, self.m2)
+        self.count = total
+        self.min = np.where(seen, np.fmin(self.min, np.nanmin(np.where(present, values, np.inf), axis=0)), self.min)
+        self.max = np.where(seen, np.fmax(self.max, np.nanmax(np.where(present, values, -np.inf), axis=0)), self.max)
+
+    def summary(self) -> Dict[str, Dict[str, Optional[float]]]:
+        std = np.sqrt(self.m2 / np.maximum(self.count - 1, 1))
+        return {
+            column: {
+                "count": int(self.count[i]),
+                "mean": float(self.mean[i]) if self.count[i] else None,
+                "std": float(std[i]) if self.count[i] > 1 else None,
+                "min": float(self.min[i]) if self.count[i] else None,
+                "max": float(self.max[i]) if self.count[i] else None,
+            }
+            for i, column in enumerate(self.columns)
+        }
+
+
+async def encode_history(
+    chunks: AsyncIterator[pd.DataFrame],
+    fmt: str,
+    columns: List[str],
+    header: Dict
+) -> AsyncIterator[bytes]:
+    """
+    Encode les blocs au fil de l'eau et termine par les statistiques:
+    - json: objet {..., "records": [...], "statistics": {...}} (format historique)
+    - ndjson: une ligne par mesure puis une ligne {"statistics": {...}}
+    - csv: en-tête + lignes, statistiques en commentaire final (# statistics: {...})
+    - arrow: flux IPC, statistiques dans les métadonnées d'un dernier lot vide
+    """
+    stats = RunningStats(columns)
+    first = True
+    writer = sink = None
+    if fmt == "json":
+        yield (json.dumps(header)[:-1] + ', "records": [').encode()
+    elif fmt == "arrow":
+        schema = pa.schema([("timestamp", pa.timestamp("ns"))] + [(c, pa.float64()) for c in columns])
+        sink = io.BytesIO()
+        writer = pa.ipc.new_stream(sink, schema)
+
+    async for chunk in chunks:
+        if chunk.empty:
+            continue
+        chunk = chunk[["timestamp"] + columns]
+        stats.update(chunk[columns].to_numpy(dtype=float))
+
+        if fmt == "json":
+            body = chunk.to_json(orient="records", date_format="iso", date_unit="s")[1:-1]
+            yield ((", " if not first else "") + body).encode()
+        elif fmt == "ndjson":
+            yield chunk.to_json(orient="records", lines=True, date_format="iso", date_unit="s").rstrip("\n").encode() + b"\n"
+        elif fmt == "csv":
+            # Horodatages formatés en bloc (plus rapide que date_format, appliqué élément par élément)
+            timestamps = np.datetime_as_string(chunk["timestamp"].values, unit="s")
+            yield chunk.assign(timestamp=timestamps).to_csv(index=False, header=first).encode()
+        else:
+            writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield _drain(sink)
+        first = False
+
+    summary = stats.summary()
+    if fmt == "json":
+        yield ('], "statistics": ' + json.dumps(summary) + "}").encode()
+    elif fmt == "ndjson":
+        yield (json.dumps({"statistics": summary}) + "\n").encode()
+    elif fmt == "csv":
+        if first:
+            yield (",".join(["timestamp"] + columns) + "\n").encode()
+        yield ("# statistics: " + json.dumps(summary) + "\n").encode()
+    else:
+        empty = pa.RecordBatch.from_pylist([], schema=schema)
+        writer.write_batch(empty, custom_metadata={"statistics": json.dumps(summary)})
+        writer.close()
+        yield _drain(sink)
+
+
+async def single_chunk(frame: pd.DataFrame) -> AsyncIterator[pd.DataFrame]:
+    """Frame déjà calculée présentée comme un flux d'un seul bloc"""
+    yield frame
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    """Octets écrits depuis le dernier appel, tampon remis à zéro"""
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
@@ -0,0 +1,298 @@
+"""
+Ingestion en masse des mesures capteurs (passerelles terrain).
+Lots NDJSON ou JSON colonnaire -> validation vectorisée -> dédoublonnage
+(time, location_id) -> tampon écrit par lots dans hydrological_data.
+"""
+import asyncio
+import io
+import json
+import time
+from concurrent.futures import Executor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.storage.archive import LOCATION_ID_PATTERN
+from app.storage.base import HYDRO_COLUMNS, HydroStorage
+
+
+# Plages physiquement plausibles par mesure (hors plage -> valeur ignorée)
+VALID_RANGES = {
+    "discharge_m3_s": (0.0, 50000.0),
+    "water_level_m": (-10.0, 200.0),
+    "temperature_c": (-10.0, 60.0),
+    "rainfall_mm": (0.0, 1000.0),
+    "ndvi": (-1.0, 1.0),
+    "soil_moisture": (0.0, 100.0),
+}
+
+# Noms alternatifs acceptés des passerelles
+COLUMN_ALIASES = {"time": "timestamp", "station_id": "location_id"}
+
+MAX_LOCATION_ID_LENGTH = 50  # VARCHAR(50)
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def parse_readings(body: bytes, content_type: str) -> pd.DataFrame:
+    """
+    NDJSON (un objet par ligne) ou JSON: colonnaire {"colonne": [...]} (valeurs
+    scalaires diffusées, ex. location_id) ou liste d'objets.
+    """
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    try:
+        if media_type in NDJSON_MEDIA_TYPES:
+            if not body.strip():
+                return pd.DataFrame()
+            return pd.read_json(io.BytesIO(body), lines=True, dtype=False, convert_dates=False)
+        payload = json.loads(body)
+    except ValueError as e:
+        raise ValueError(f"Corps illisible: {e}")
+
+    if isinstance(payload, list):
+        return pd.DataFrame.from_records(payload)
+    if isinstance(payload, dict):
+        if not any(isinstance(v, list) for v in payload.values()):
+            payload = {k: [v] for k, v in payload.items()}
+        lengths = {len(v) for v in payload.values() if isinstance(v, list)}
+        if len(lengths) > 1:
+            raise ValueError("Colonnes de longueurs différentes")
+        return pd.DataFrame(payload)
+    raise ValueError("JSON attendu: objet colonnaire ou liste d'objets")
+
+
+def merge_readings(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Fusionne les lignes d'un même (timestamp, location_id) colonne par colonne:
+    la dernière valeur non manquante de chaque mesure l'emporte, comme dans l'archive.
+    """
+    if not frame.duplicated(subset=["timestamp", "location_id"]).any():
+        return frame
+    merged = frame.groupby(["timestamp", "location_id"], sort=False).last().reset_index()
+    return merged[frame.columns]
+
+
+def validate_readings(frame: pd.DataFrame, now: Optional[datetime] = None) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    Normalise et filtre un lot (sans boucle par ligne).
+    Retourne (lignes valides dédoublonnées, compteurs de rejets).
+    """
+    for alias, name in COLUMN_ALIASES.items():
+        if alias in frame.columns:
+            merged = frame[alias] if name not in frame.columns else frame[name].fillna(frame[alias])
+            frame = frame.drop(columns=alias).assign(**{name: merged})
+    missing = {"timestamp", "location_id"} - set(frame.columns)
+    if missing:
+        raise ValueError(f"Colonnes obligatoires manquantes: {', '.join(sorted(missing))}")
+    now = pd.Timestamp(now or datetime.utcnow())
+
+    timestamps = pd.to_datetime(frame["timestamp"], errors="coerce", utc=True, format="mixed")
+    timestamps = timestamps.dt.tz_convert(None).dt.floor("s")
+    location_ids = frame["location_id"].astype("string").str.strip()
+
+    out = pd.DataFrame({"timestamp": timestamps.values, "location_id": location_ids.values})
+    out_of_range = 0
+    for column in HYDRO_COLUMNS:
+        if column not in frame.columns:
+            out[column] = np.nan
+            continue
+        values = pd.to_numeric(frame[column], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        low, high = VALID_RANGES[column]
+        invalid = (values < low) | (values > high)
+        out_of_range += int(invalid.sum())
+        values[invalid] = np.nan
+        out[column] = values
+
+    invalid_timestamp = out["timestamp"].isna().values
+    future_timestamp = ~invalid_timestamp & (out["timestamp"] > now + pd.Timedelta(hours=1)).values
+    invalid_location = (
+        out["location_id"].isna()
+        | ~out["location_id"].str.match(LOCATION_ID_PATTERN.pattern)
+        | (out["location_id"].str.len() > MAX_LOCATION_ID_LENGTH)
+    ).fillna(True).values.astype(bool)
+    no_measurement = np.isnan(out[HYDRO_COLUMNS].values).all(axis=1)
+
+    rejected = invalid_timestamp | future_timestamp | invalid_location | no_measurement
+    valid = out[~rejected]
+    # Mesures partielles d'un même (time, location_id) fusionnées colonne par colonne
+    deduplicated = merge_readings(valid)
+    deduplicated = deduplicated.astype({"location_id": object}).reset_index(drop=True)
+
+    counts = {
+        "received": int(len(frame)),
+        "accepted": int(len(deduplicated)),
+        "rejected": int(rejected.sum()),
+        "duplicates": int(len(valid) - len(deduplicated)),
+        "out_of_range_values": out_of_range,
+        "invalid_timestamp": int(invalid_timestamp.sum()),
+        "future_timestamp": int(future_timestamp.sum()),
+        "invalid_location": int((invalid_location & ~invalid_timestamp & ~future_timestamp).sum()),
+        "no_valid_measurement": int((no_measurement & ~(invalid_timestamp | future_timestamp | invalid_location)).sum()),
+    }
+    return deduplicated, counts
+
+
+class BufferedWriter:
+    """
+    Tampon d'écriture: les lots sont regroupés et écrits en une opération
+    (COPY sous PostgreSQL) dès `batch_rows` lignes ou toutes les `flush_interval` s.
+    """
+
+    def __init__(
+        self,
+        storage: HydroStorage,
+        batch_rows: int = 5000,
+        flush_interval: float = 2.0,
+        max_pending_rows: int = 200000
+    ):
+        self.storage = storage
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.max_pending_rows = max_pending_rows
+        self._pending: List[pd.DataFrame] = []
+        self._pending_rows = 0
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable] = []
+
+        # Métriques
+        self.rows_written = 0
+        self.duplicates_merged = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.last_flush: Optional[datetime] = None
+
+    def add_listener(self, listener: Callable):
+        """`listener(frame)` appelé après chaque écriture réussie (fonction ou coroutine)"""
+        self._listeners.append(listener)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    @property
+    def pending_rows(self) -> int:
+        return self._pending_rows
+
+    async def submit(self, frame: pd.DataFrame):
+        """Ajoute un lot validé; réveille l'écrivain dès que le seuil est atteint"""
+        if self._pending_rows + len(frame) > self.max_pending_rows:
+            raise OverflowError("Tampon d'ingestion plein, réessayer plus tard")
+        self._pending.append(frame)
+        self._pending_rows += len(frame)
+        if self._pending_rows >= self.batch_rows:
+            if self._task is None:
+                await self.flush()
+            else:
+                self._wake.set()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            pending, self._pending, self._pending_rows = self._pending, [], 0
+            batch = pd.concat(pending, ignore_index=True) if len(pending) > 1 else pending[0]
+            merged = merge_readings(batch)
+
+            start = time.perf_counter()
+            try:
+                written = await self.storage.write_frame(merged)
+            except Exception as e:
+                # Lot conservé pour la prochaine tentative
+                self.flush_errors += 1
+                self._pending.insert(0, merged)
+                self._pending_rows += len(merged)
+                print(f"Erreur écriture ingestion ({len(merged)} lignes): {e}")
+                return 0
+            elapsed = time.perf_counter() - start
+
+            self.flushes += 1
+            self.rows_written += written
+            self.duplicates_merged += len(batch) - len(merged)
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+            self.last_flush = datetime.utcnow()
+
+        for listener in self._listeners:
+            try:
+                result = listener(merged)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(f"Erreur listener ingestion: {e}")
+        return written
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "pending_rows": self._pending_rows,
+            "batch_rows": self.batch_rows,
+            "flush_interval_seconds": self.flush_interval,
+            "rows_written": self.rows_written,
+            "duplicates_merged": self.duplicates_merged,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "flush_avg_ms": 1e3 * self.flush_seconds_total / self.flushes if self.flushes else 0.0,
+            "flush_max_ms": 1e3 * self.flush_seconds_max,
+            "last_flush": self.last_flush.isoformat() if self.last_flush else None,
+        }
+
+
+class IngestService:
+    """Point d'entrée de l'ingestion: analyse + validation hors boucle, puis tampon"""
+
+    def __init__(
+        self,
+        writer: BufferedWriter,
+        executor: Optional[Executor] = None,
+        max_rows_per_request: int = 100000
+    ):
+        self.writer = writer
+        self.executor = executor
+        self.max_rows_per_request = max_rows_per_request
+        self.requests = 0
+        self.totals: Dict[str, int] = {}
+
+    def _prepare(self, body: bytes, content_type: str) -> Tuple[pd.DataFrame, Dict[str, int]]:
+        frame = parse_readings(body, content_type)
+        if len(frame) > self.max_rows_per_request:
+            raise ValueError(f"Au plus {self.max_rows_per_request} mesures par requête")
+        if frame.empty:
+            return frame, {"received": 0, "accepted": 0, "rejected": 0, "duplicates": 0}
+        return validate_readings(frame)
+
+    async def ingest(self, body: bytes, content_type: str) -> Dict:
+        frame, counts = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._prepare, body, content_type
+        )
+        if counts["accepted"]:
+            await self.writer.submit(frame)
+        self.requests += 1
+        for name, value in counts.items():
+            self.totals[name] = self.totals.get(name, 0) + value
+        return {**counts, "pending_rows": self.writer.pending_rows}
+
+    def stats(self) -> Dict:
+        return {"requests": self.requests, **self.totals, "writer": self.writer.stats()}
@@ -0,0 +1,140 @@
+"""
+Diffusion temps réel des métriques (WebSocket /ws/live).
+Un producteur par localisation active, diffusé à tous les abonnés via des
+files bornées (la plus ancienne valeur est abandonnée si le client est lent).
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Set, Tuple
+
+from app.services.data_service import DataService
+
+
+class LiveSubscription:
+    """Abonnement d'un client à une localisation"""
+
+    def __init__(self, location_id: str, queue_size: int):
+        self.location_id = location_id
+        self.queue: "asyncio.Queue[Tuple[float, Dict]]" = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, item: Tuple[float, Dict]) -> bool:
+        """Dépose un message; retire le plus ancien si la file est pleine"""
+        dropped = False
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            dropped = True
+        self.queue.put_nowait(item)
+        return dropped
+
+
+class LiveHub:
+    """Producteurs partagés par localisation + diffusion aux abonnés"""
+
+    def __init__(self, data_service: DataService, interval_seconds: float = 10.0, queue_size: int = 8):
+        self.data_service = data_service
+        self.interval_seconds = interval_seconds
+        self.queue_size = queue_size
+
+        self._subscribers: Dict[str, Set[LiveSubscription]] = {}
+        self._producers: Dict[str, asyncio.Task] = {}
+        self._last_message: Dict[str, Tuple[float, Dict]] = {}
+
+        # Métriques
+        self.messages_published = 0
+        self.messages_dropped = 0
+        self.producer_errors = 0
+        self.sends = 0
+        self.send_lag_total = 0.0
+        self.send_lag_max = 0.0
+        self.send_lag_last = 0.0
+
+    def subscribe(self, location_id: str) -> LiveSubscription:
+        """Inscrit un client; démarre le producteur de la localisation si nécessaire"""
+        subscription = LiveSubscription(location_id, self.queue_size)
+        self._subscribers.setdefault(location_id, set()).add(subscription)
+
+        # Le nouveau client reçoit tout de suite la dernière valeur connue
+        if location_id in self._last_message:
+            subscription.offer(self._last_message[location_id])
+
+        if location_id not in self._producers:
+            self._producers[location_id] = asyncio.create_task(self._produce(location_id))
+        return subscription
+
+    def unsubscribe(self, subscription: LiveSubscription):
+        """Désinscrit un client; arrête le producteur au départ du dernier abonné"""
+        location_id = subscription.location_id
+        subscribers = self._subscribers.get(location_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[location_id]
+            self._last_message.pop(location_id, None)
+            producer = self._producers.pop(location_id, None)
+            if producer is not None:
+                producer.cancel()
+
+    async def _produce(self, location_id: str):
+        """Calcule les métriques une fois par intervalle pour tous les abonnés"""
+        while True:
+            try:
+                metrics = await self.data_service.get_location_metrics(location_id)
+                self.publish(location_id, {
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "discharge_m3_s": metrics.current_discharge,
+                    "water_level_m": metrics.water_level,
+                    "water_status": metrics.water_status,
+                    "alert_level": metrics.alert_level,
+                    "temperature_c": metrics.temperature,
+                    "rainfall_24h": metrics.rainfall_24h,
+                })
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.producer_errors += 1
+                print(f"Erreur producteur live {location_id}: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def publish(self, location_id: str, data: Dict):
+        """Diffuse un message à tous les abonnés de la localisation"""
+        item = (time.monotonic(), data)
+        self._last_message[location_id] = item
+        self.messages_published += 1
+        for subscription in self._subscribers.get(location_id, ()):
+            if subscription.offer(item):
+                self.messages_dropped += 1
+
+    def record_send(self, published_at: float):
+        """Enregistre le délai publication -> envoi effectif au client"""
+        lag = time.monotonic() - published_at
+        self.sends += 1
+        self.send_lag_total += lag
+        self.send_lag_last = lag
+        self.send_lag_max = max(self.send_lag_max, lag)
+
+    async def close(self):
+        for producer in self._producers.values():
+            producer.cancel()
+        await asyncio.gather(*self._producers.values(), return_exceptions=True)
+        self._producers.clear()
+        self._subscribers.clear()
+        self._last_message.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "connections": sum(len(s) for s in self._subscribers.values()),
+            "connections_by_location": {loc: len(s) for loc, s in self._subscribers.items()},
+            "active_producers": len(self._producers),
+            "interval_seconds": self.interval_seconds,
+            "messages_published": self.messages_published,
+            "messages_dropped": self.messages_dropped,
+            "producer_errors": self.producer_errors,
+            "sends": self.sends,
+            "send_lag_avg_ms": 1e3 * self.send_lag_total / self.sends if self.sends else 0.0,
+            "send_lag_max_ms": 1e3 * self.send_lag_max,
+            "send_lag_last_ms": 1e3 * self.send_lag_last,
+        }
@@ -0,0 +1,551 @@
+"""
+Envoi des notifications d'alerte (SMS, e-mail) hors des workers de l'API.
+File durable SQLite (reprise après redémarrage), pool de workers par canal,
+envoi par lots aux fournisseurs qui l'acceptent, déduplication et limitation
+de débit par destinataire, nouvelles tentatives avec attente exponentielle.
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.services.alert_engine import SubscriptionIndex
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notification_messages (
+    message_id TEXT PRIMARY KEY,
+    channel TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notification_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_id TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    sent_at REAL,
+    last_error TEXT,
+    UNIQUE (message_id, recipient)
+);
+CREATE INDEX IF NOT EXISTS idx_notification_queue_ready
+    ON notification_queue (channel, status, available_at);
+"""
+
+LEVEL_LABELS = {
+    "vigilance": "VIGILANCE",
+    "alerte": "ALERTE",
+    "alerte_max": "ALERTE ROUGE",
+}
+
+
+def render_notification(alert: Dict, channel: str) -> Dict:
+    """Contenu d'une notification selon le canal (SMS court, e-mail détaillé)"""
+    label = LEVEL_LABELS.get(alert["alert_level"], alert["alert_level"].upper())
+    title = f"{label} {alert['alert_type'].upper()} - {alert['location_name']}"
+    if channel == "sms":
+        body = (
+            f"{title}\n{alert['message_fr']}\n"
+            f"Action: {alert['recommended_action']}\n"
+            f"Confiance: {alert['confidence']:.0%} | OMVS AQUAMIND"
+        )
+        return {"alert_id": alert["alert_id"], "alert_level": alert["alert_level"], "body": body}
+    body = (
+        f"{alert['message_fr']}\n{alert['message_en']}\n\n"
+        f"Date prévue: {alert['event_expected_date']}\n"
+        f"Confiance: {alert['confidence']:.0%}\n\n"
+        f"Action recommandée: {alert['recommended_action']}"
+    )
+    return {
+        "alert_id": alert["alert_id"],
+        "alert_level": alert["alert_level"],
+        "subject": f"[AQUAMIND] {title}",
+        "body": body,
+    }
+
+
+class NotificationQueue:
+    """
+    File durable (SQLite, WAL). Un message par (alerte, niveau, canal), une ligne
+    par destinataire: UNIQUE (message_id, recipient) assure la déduplication.
+    États: pending -> inflight -> sent | failed (pending à nouveau si nouvel essai).
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        if self.conn is not None:
+            return
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Reprise: les envois interrompus repartent en file
+        with self.conn:
+            self.conn.execute("UPDATE notification_queue SET status = 'pending' WHERE status = 'inflight'")
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    async def _run(self, fn, *args):
+        def call():
+            with self._lock:
+                return fn(self.conn, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    def enqueue(self, message_id: str, channel: str, payload: Dict, recipients: Iterable[str], created_at: float) -> int:
+        """Ajoute un message et ses destinataires (déjà en file: ignorés). Retourne le nombre ajouté"""
+        rows = [(message_id, channel, recipient, created_at, created_at) for recipient in recipients]
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO notification_messages (message_id, channel, payload, created_at) VALUES (?, ?, ?, ?)",
+                (message_id, channel, json.dumps(payload, default=str), created_at)
+            )
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO notification_queue (message_id, channel, recipient, enqueued_at, available_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            return self.conn.total_changes - before
+
+    async def claim(self, channel: str, limit: int) -> List[Tuple]:
+        """Réserve jusqu'à `limit` envois prêts: (id, recipient, attempts, created_at, message_id, payload)"""
+        def claim(conn):
+            with conn:
+                rows = conn.execute(
+                    "SELECT q.id, q.recipient, q.attempts, m.created_at, q.message_id, m.payload "
+                    "FROM notification_queue q JOIN notification_messages m ON m.message_id = q.message_id "
+                    "WHERE q.channel = ? AND q.status = 'pending' AND q.available_at <= ? "
+                    "ORDER BY q.available_at LIMIT ?",
+                    (channel, time.time(), limit)
+                ).fetchall()
+                conn.executemany("UPDATE notification_queue SET status = 'inflight' WHERE id = ?", [(r[0],) for r in rows])
+            return rows
+        return await self._run(claim)
+
+    async def complete(self, ids: List[int], sent_at: float):
+        def complete(conn):
+            with conn:
+                conn.executemany(
+                    "UPDATE notification_queue SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                    [(sent_at, i) for i in ids]
+                )
+        if ids:
+            await self._run(complete)
+
+    async def reschedule(self, updates: List[Tuple[int, str, int, float, Optional[str]]]):
+        """(id, statut, tentatives, disponible à, erreur) pour les nouveaux essais, reports et échecs"""
+        def reschedule(conn):
+            with conn:
+                conn.executemany(
+                    "UPDATE notification_queue SET status = ?, attempts = ?, available_at = ?, last_error = ? WHERE id = ?",
+                    [(status, attempts, available_at, error, i) for i, status, attempts, available_at, error in updates]
+                )
+        if updates:
+            await self._run(reschedule)
+
+    async def prune(self, older_than: float) -> int:
+        """Supprime les envois terminés (sent/failed) avant `older_than` et les messages orphelins"""
+        def prune(conn):
+            with conn:
+                deleted = conn.execute(
+                    "DELETE FROM notification_queue WHERE status IN ('sent', 'failed') AND available_at < ?",
+                    (older_than,)
+                ).rowcount
+                conn.execute(
+                    "DELETE FROM notification_messages WHERE message_id NOT IN "
+                    "(SELECT DISTINCT message_id FROM notification_queue)"
+                )
+            return deleted
+        return await self._run(prune)
+
+    def depth(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT channel, status, COUNT(*) FROM notification_queue GROUP BY channel, status"
+            ).fetchall() if self.conn is not None else []
+        depth: Dict[str, Dict[str, int]] = {}
+        for channel, status, count in rows:
+            depth.setdefault(channel, {})[status] = count
+        return depth
+
+
+class TokenBucket:
+    """Seau à jetons (débit moyen `rate`/s, rafale `capacity`)"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, n: float):
+        """Attend que `n` jetons soient disponibles (n peut dépasser la capacité: attente proportionnelle)"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= n
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class RecipientLimiter:
+    """
+    Seau à jetons par destinataire: au plus `capacity` messages en rafale puis
+    `per_hour` par heure. Les seaux pleins sont oubliés quand la table grossit.
+    """
+
+    def __init__(self, capacity: int = 3, per_hour: float = 6.0, max_entries: int = 1_000_000):
+        self.capacity = capacity
+        self.rate = per_hour / 3600.0
+        self.max_entries = max_entries
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, recipient: str, now: float) -> float:
+        """0 si le message peut partir (jeton consommé), sinon délai d'attente en secondes"""
+        tokens, updated = self._buckets.get(recipient, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[recipient] = (tokens, now)
+            return (1 - tokens) / self.rate
+        self._buckets[recipient] = (tokens - 1, now)
+        if len(self._buckets) > self.max_entries:
+            self._forget(now)
+        return 0.0
+
+    def refund(self, recipient: str):
+        """Rend le jeton d'un envoi qui n'a pas abouti (les nouveaux essais ne sont pas pénalisés)"""
+        bucket = self._buckets.get(recipient)
+        if bucket is not None:
+            self._buckets[recipient] = (min(self.capacity, bucket[0] + 1), bucket[1])
+
+    def _forget(self, now: float):
+        full = [
+            recipient for recipient, (tokens, updated) in self._buckets.items()
+            if tokens + (now - updated) * self.rate >= self.capacity
+        ]
+        for recipient in full:
+            del self._buckets[recipient]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class NotificationProvider:
+    """
+    Fournisseur d'un canal (classe de base). `send_batch` reçoit au plus `max_batch`
+    messages {recipient, body, ...} et renvoie une erreur par message (None = envoyé);
+    une exception fait échouer tout le lot.
+    """
+
+    channel = "abstract"
+
+    def __init__(self, max_batch: int = 1, rate_per_second: Optional[float] = None):
+        self.max_batch = max_batch
+        self.rate_per_second = rate_per_second
+
+    async def send_batch(self, messages: List[Dict]) -> List[Optional[str]]:
+        raise NotImplementedError
+
+
+class LocalSink(NotificationProvider):
+    """
+    Fournisseur factice (tests, démonstration): messages conservés en mémoire
+    et ajoutés à un fichier JSONL si `path`; `failure_rate` simule des échecs.
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        max_batch: int = 100,
+        rate_per_second: Optional[float] = None,
+        path: Optional[str] = None,
+        keep: int = 1000,
+        failure_rate: float = 0.0,
+        latency_seconds: float = 0.0
+    ):
+        super().__init__(max_batch, rate_per_second)
+        self.channel = channel
+        self.path = path
+        self.failure_rate = failure_rate
+        self.latency_seconds = latency_seconds
+        self.messages: deque = deque(maxlen=keep)
+        self.delivered = 0
+        self._rng = random.Random()
+
+    async def send_batch(self, messages: List[Dict]) -> List[Optional[str]]:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        errors = [
+            "échec simulé" if self.failure_rate and self._rng.random() < self.failure_rate else None
+            for _ in messages
+        ]
+        delivered = [m for m, error in zip(messages, errors) if error is None]
+        self.messages.extend(delivered)
+        self.delivered += len(delivered)
+        if self.path and delivered:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps({"channel": self.channel, **m}, default=str) + "\n" for m in delivered)
+        return errors
+
+
+class NotificationDispatcher:
+    """
+    Abonnés d'une alerte -> file durable -> workers par canal -> fournisseurs.
+    Branché sur AlertEngine.add_listener (alertes nouvelles ou aggravées).
+    """
+
+    def __init__(
+        self,
+        queue: NotificationQueue,
+        subscriptions: SubscriptionIndex,
+        limiter: Optional[RecipientLimiter] = None,
+        max_attempts: int = 5,
+        retry_base_seconds: float = 5.0,
+        retry_max_seconds: float = 900.0,
+        poll_interval: float = 1.0,
+        retention_seconds: float = 7 * 86400
+    ):
+        self.queue = queue
+        self.subscriptions = subscriptions
+        self.limiter = limiter if limiter is not None else RecipientLimiter()
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+
+        self.providers: Dict[str, NotificationProvider] = {}
+        self._workers: Dict[str, int] = {}
+        self._throttles: Dict[str, TokenBucket] = {}
+        self._wake: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing = False
+        self._rng = random.Random()
+
+        # Métriques
+        self.counters: Dict[str, Dict[str, int]] = {}
+        self.alerts_received = 0
+        self.duplicates = 0
+        self.enqueue_errors = 0
+        self._latencies: deque = deque(maxlen=10000)  # Alerte -> accusé du fournisseur (s)
+        self._sent_times: deque = deque(maxlen=100000)  # (instant, nombre envoyé)
+
+    def register(self, provider: NotificationProvider, workers: int = 1):
+        """Ajoute un fournisseur pour son canal avec `workers` workers concurrents"""
+        self.providers[provider.channel] = provider
+        self._workers[provider.channel] = workers
+        if provider.rate_per_second:
+            self._throttles[provider.channel] = TokenBucket(provider.rate_per_second, max(provider.rate_per_second, provider.max_batch))
+        self.counters[provider.channel] = {
+            "enqueued": 0, "sent": 0, "failed": 0, "retried": 0, "rate_limited": 0, "batches": 0,
+        }
+
+    @property
+    def channels(self) -> List[str]:
+        return list(self.providers)
+
+    async def start(self):
+        self.queue.open()
+        self._loop = asyncio.get_running_loop()
+        await self.queue.prune(time.time() - self.retention_seconds)
+        for channel, workers in self._workers.items():
+            self._wake[channel] = asyncio.Event()
+            for _ in range(workers):
+                self._tasks.append(asyncio.create_task(self._worker(channel)))
+        self._tasks.append(asyncio.create_task(self._maintenance()))
+
+    async def close(self):
+        self._closing = True
+        for event in self._wake.values():
+            event.set()
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self.queue.close()
+
+    def on_alert(self, alert: Dict, subscription_ids: Set[str]):
+        """Listener du moteur d'alertes: mise en file hors de l'appelant (thread quelconque)"""
+        self.alerts_received += 1
+        if not subscription_ids:
+            return
+        created_at = time.time()
+        if self._loop is None or self._loop.is_closed():
+            # Dispatcher non démarré: la file durable conserve les envois
+            self.queue.open()
+            self._enqueue(alert, subscription_ids, created_at)
+            return
+        asyncio.run_coroutine_threadsafe(self.enqueue_alert(alert, subscription_ids, created_at), self._loop)
+
+    async def enqueue_alert(self, alert: Dict, subscription_ids: Set[str], created_at: Optional[float] = None) -> int:
+        created_at = created_at or time.time()
+        try:
+            inserted = await asyncio.get_running_loop().run_in_executor(
+                None, self._enqueue, alert, subscription_ids, created_at
+            )
+        except Exception as e:
+            self.enqueue_errors += 1
+            print(f"Erreur mise en file des notifications: {e}")
+            return 0
+        for channel in self.channels:
+            self._wake[channel].set()
+        return inserted
+
+    def _enqueue(self, alert: Dict, subscription_ids: Set[str], created_at: float) -> int:
+        """Regroupe les destinataires par canal (un même destinataire une seule fois)"""
+        recipients: Dict[str, Set[str]] = {}
+        for subscription_id in subscription_ids:
+            subscription = self.subscriptions.get(subscription_id)
+            if subscription is None:
+                continue
+            channel, address = subscription.get("notification_method"), subscription.get("notification_address")
+            if channel in self.providers and address:
+                recipients.setdefault(channel, set()).add(address)
+        inserted = 0
+        for channel, addresses in recipients.items():
+            message_id = f"{alert['alert_id']}:{alert['alert_level']}:{channel}"
+            added = self.queue.enqueue(message_id, channel, render_notification(alert, channel), addresses, created_at)
+            self.counters[channel]["enqueued"] += added
+            self.duplicates += len(addresses) - added
+            inserted += added
+        return inserted
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.retry_base_seconds * 2 ** (attempts - 1), self.retry_max_seconds)
+        return delay * (0.5 + self._rng.random())
+
+    async def _wait(self, channel: str):
+        event = self._wake[channel]
+        try:
+            await asyncio.wait_for(event.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+
+    async def _worker(self, channel: str):
+        provider = self.providers[channel]
+        counters = self.counters[channel]
+        payloads: Dict[str, Dict] = {}
+        while not self._closing:
+            try:
+                rows = await self.queue.claim(channel, provider.max_batch)
+            except Exception as e:
+                print(f"Erreur lecture file de notifications ({channel}): {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if not rows:
+                await self._wait(channel)
+                continue
+
+            # Limitation par destinataire: les messages en excès sont reportés
+            now = time.time()
+            ready, updates = [], []
+            for row_id, recipient, attempts, created_at, message_id, payload in rows:
+                wait = self.limiter.take(recipient, now)
+                if wait > 0:
+                    counters["rate_limited"] += 1
+                    updates.append((row_id, "pending", attempts, now + wait, "limite de débit du destinataire"))
+                    continue
+                if message_id not in payloads:
+                    if len(payloads) > 256:
+                        payloads.clear()
+                    payloads[message_id] = json.loads(payload)
+                ready.append((row_id, recipient, attempts, created_at, payloads[message_id]))
+            if not ready:
+                await self.queue.reschedule(updates)
+                continue
+
+            throttle = self._throttles.get(channel)
+            if throttle is not None:
+                await throttle.acquire(len(ready))
+            messages = [{"recipient": recipient, **payload} for _, recipient, _, _, payload in ready]
+            try:
+                errors = await provider.send_batch(messages)
+            except Exception as e:
+                errors = [str(e)] * len(ready)
+            counters["batches"] += 1
+
+            sent_at = time.time()
+            sent_ids = []
+            for (row_id, recipient, attempts, created_at, _), error in zip(ready, errors):
+                if error is None:
+                    sent_ids.append(row_id)
+                    self._latencies.append(sent_at - created_at)
+                    continue
+                self.limiter.refund(recipient)
+                if attempts + 1 >= self.max_attempts:
+                    counters["failed"] += 1
+                    updates.append((row_id, "failed", attempts + 1, sent_at, error))
+                else:
+                    counters["retried"] += 1
+                    updates.append((row_id, "pending", attempts + 1, sent_at + self._backoff(attempts + 1), error))
+            counters["sent"] += len(sent_ids)
+            self._sent_times.append((sent_at, len(sent_ids)))
+            await self.queue.complete(sent_ids, sent_at)
+            await self.queue.reschedule(updates)
+
+    async def _maintenance(self):
+        """Purge périodique des envois terminés"""
+        while not self._closing:
+            await asyncio.sleep(3600)
+            try:
+                await self.queue.prune(time.time() - self.retention_seconds)
+            except Exception as e:
+                print(f"Erreur purge file de notifications: {e}")
+
+    def stats(self) -> Dict:
+        now = time.time()
+        recent = sum(n for t, n in self._sent_times if t >= now - 60)
+        latencies = np.fromiter(self._latencies, dtype=float)
+        return {
+            "channels": {
+                channel: {
+                    **self.counters[channel],
+                    "workers": self._workers[channel],
+                    "max_batch": self.providers[channel].max_batch,
+                    "provider": type(self.providers[channel]).__name__,
+                }
+                for channel in self.providers
+            },
+            "queue": self.queue.depth(),
+            "alerts_received": self.alerts_received,
+            "duplicates": self.duplicates,
+            "enqueue_errors": self.enqueue_errors,
+            "throughput_per_s_1m": recent / 60.0,
+            "latency_ms": {
+                "count": len(latencies),
+                "p50": 1e3 * float(np.percentile(latencies, 50)) if len(latencies) else None,
+                "p95": 1e3 * float(np.percentile(latencies, 95)) if len(latencies) else None,
+                "max": 1e3 * float(latencies.max()) if len(latencies) else None,
+            },
+            "rate_limited_recipients": len(self.limiter),
+        }
@@ -0,0 +1,132 @@
+"""
+Encodage compact des grilles de probabilité (cartes d'inondation).
+Quantification uint8/float16 et formats binaires (brut + en-tête, NPY, PNG).
+"""
+import io
+import struct
+import zlib
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+# Formats disponibles -> type MIME
+RASTER_MEDIA_TYPES = {
+    "json": "application/json",
+    "raw": "application/vnd.aquamind.raster",
+    "npy": "application/x-npy",
+    "png": "image/png",
+}
+
+RASTER_DTYPES = {"uint8": 1, "float16": 2}
+
+# En-tête du format brut (little-endian, 52 octets):
+# magic, version, code dtype, réservé, lignes, colonnes, échelle, bbox (nord, sud, est, ouest)
+RAW_HEADER = struct.Struct("<4sBBHIIf4d")
+RAW_MAGIC = b"AQRS"
+RAW_VERSION = 1
+
+
+def negotiate_raster_format(accept: Optional[str], requested: Optional[str] = None) -> str:
+    """
+    Choisit le format de sortie: paramètre `format` explicite, sinon en-tête Accept.
+    JSON par défaut.
+    """
+    if requested:
+        requested = requested.lower()
+        if requested not in RASTER_MEDIA_TYPES:
+            raise ValueError(f"Format inconnu: {requested}")
+        return requested
+
+    if accept:
+        for part in accept.split(","):
+            media_type = part.split(";")[0].strip().lower()
+            for fmt, known in RASTER_MEDIA_TYPES.items():
+                if media_type == known:
+                    return fmt
+    return "json"
+
+
+def quantize(grid: np.ndarray, dtype: str = "uint8") -> Tuple[np.ndarray, float]:
+    """
+    Quantifie une grille de probabilités [0, 1].
+    Retourne (grille quantifiée, échelle) avec valeur = code * échelle.
+    """
+    if dtype == "uint8":
+        codes = np.rint(np.clip(grid, 0.0, 1.0) * 255.0).astype(np.uint8)
+        return codes, 1.0 / 255.0
+    if dtype == "float16":
+        return grid.astype(np.float16), 1.0
+    raise ValueError(f"dtype non supporté: {dtype}")
+
+
+def encode_raw(grid: np.ndarray, dtype: str, bbox: Dict[str, float]) -> bytes:
+    """En-tête fixe (RAW_HEADER) suivi des valeurs quantifiées, ordre ligne par ligne"""
+    codes, scale = quantize(grid, dtype)
+    rows, cols = codes.shape
+    header = RAW_HEADER.pack(
+        RAW_MAGIC, RAW_VERSION, RASTER_DTYPES[dtype], 0, rows, cols, scale,
+        bbox["north"], bbox["south"], bbox["east"], bbox["west"]
+    )
+    return header + np.ascontiguousarray(codes, dtype=codes.dtype.newbyteorder("<")).tobytes()
+
+
+def decode_raw(payload: bytes) -> Tuple[np.ndarray, Dict[str, float]]:
+    """Décode le format brut en probabilités float32 + bbox (utilitaire client/tests)"""
+    magic, _version, dtype_code, _, rows, cols, scale, north, south, east, west = RAW_HEADER.unpack_from(payload)
+    if magic != RAW_MAGIC:
+        raise ValueError("En-tête raster invalide")
+    dtype = np.dtype("<u1") if dtype_code == RASTER_DTYPES["uint8"] else np.dtype("<f2")
+    codes = np.frombuffer(payload, dtype=dtype, offset=RAW_HEADER.size, count=rows * cols)
+    grid = codes.reshape(rows, cols).astype(np.float32) * scale
+    return grid, {"north": north, "south": south, "east": east, "west": west}
+
+
+def encode_npy(grid: np.ndarray, dtype: str) -> bytes:
+    """Tableau NumPy (.npy) quantifié"""
+    codes, _ = quantize(grid, dtype)
+    buffer = io.BytesIO()
+    np.save(buffer, codes, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data)) + tag + data
+        + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    )
+
+
+def encode_png(pixels: np.ndarray, compression: int = 6) -> bytes:
+    """
+    PNG 8 bits sans dépendance externe.
+    `pixels`: uint8 (H, W) en niveaux de gris ou (H, W, 4) en RGBA.
+    """
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    height, width = pixels.shape[:2]
+    color_type = 0 if pixels.ndim == 2 else 6
+
+    # Chaque ligne est préfixée par le filtre 0 (aucun)
+    scanlines = np.zeros((height, 1 + pixels[0].size), dtype=np.uint8)
+    scanlines[:, 1:] = pixels.reshape(height, -1)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), compression))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def encode_raster(grid: np.ndarray, fmt: str, dtype: str, bbox: Dict[str, float]) -> bytes:
+    """Encode une grille dans un format binaire (raw, npy, png)"""
+    if fmt == "raw":
+        return encode_raw(grid, dtype, bbox)
+    if fmt == "npy":
+        return encode_npy(grid, dtype)
+    if fmt == "png":
+        # PNG: toujours quantifié sur 8 bits
+        codes, _ = quantize(grid, "uint8")
+        return encode_png(codes)
+    raise ValueError(f"Format binaire inconnu: {fmt}")
@@ -0,0 +1,314 @@
+"""
+Mosaïque d'inondation du bassin, mémoire-mappée, servie en tuiles XYZ.
+Les prévisions sont écrites à pleine résolution dans un raster disque
+(stocké par blocs) avec une pyramide de niveaux précalculée (max 2x2).
+Plusieurs processus partagent les fichiers: création et écritures sous verrou de fichier.
+"""
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+from app.services.raster_encoding import encode_png
+
+
+# Emprise du bassin du fleuve Sénégal (degrés)
+BASIN_BBOX = {"north": 17.0, "south": 10.0, "east": -7.0, "west": -17.5}
+
+# Couleur des zones inondées (alpha = probabilité)
+FLOOD_RGB = (0, 90, 255)
+
+
+def _downsample_max(block: np.ndarray) -> np.ndarray:
+    """Réduit un bloc d'un facteur 2 (max sur 2x2, bords complétés par 0)"""
+    rows, cols = block.shape
+    if rows % 2 or cols % 2:
+        padded = np.zeros((rows + rows % 2, cols + cols % 2), dtype=block.dtype)
+        padded[:rows, :cols] = block
+        block = padded
+    return np.maximum(
+        np.maximum(block[0::2, 0::2], block[0::2, 1::2]),
+        np.maximum(block[1::2, 0::2], block[1::2, 1::2])
+    )
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Verrou exclusif entre processus (flock sous POSIX, msvcrt.locking sous Windows)"""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _allocate(path: str, n_bytes: int):
+    """Fichier de `n_bytes` octets nuls écrit sous un nom temporaire puis renommé"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.truncate(n_bytes)
+    os.replace(tmp_path, path)
+
+
+def tile_bounds(z: int, x: int, y: int) -> Dict[str, float]:
+    """Emprise géographique d'une tuile XYZ (Web Mercator)"""
+    n = 2 ** z
+    return {
+        "north": math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n)))),
+        "south": math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n)))),
+        "west": x / n * 360.0 - 180.0,
+        "east": (x + 1) / n * 360.0 - 180.0,
+    }
+
+
+class BlockedRaster:
+    """
+    Raster 2D uint8 stocké par blocs carrés dans un memmap.
+    Une fenêtre ne touche que les blocs qu'elle recouvre (localité disque).
+    """
+
+    def __init__(self, path: str, shape: Tuple[int, int], block: int, mode: str):
+        self.shape = tuple(shape)
+        self.block = block
+        self._data = np.memmap(path, dtype=np.uint8, mode=mode, shape=self.layout(shape, block))
+
+    @staticmethod
+    def layout(shape: Tuple[int, int], block: int) -> Tuple[int, int, int, int]:
+        """(lignes de blocs, colonnes de blocs, block, block)"""
+        return -(-shape[0] // block), -(-shape[1] // block), block, block
+
+    def _blocks(self, r0: int, r1: int, c0: int, c1: int):
+        b = self.block
+        for br in range(r0 // b, (r1 - 1) // b + 1):
+            rs, re = max(r0, br * b), min(r1, (br + 1) * b)
+            for bc in range(c0 // b, (c1 - 1) // b + 1):
+                cs, ce = max(c0, bc * b), min(c1, (bc + 1) * b)
+                yield br, bc, rs, re, cs, ce
+
+    def read(self, r0: int, r1: int, c0: int, c1: int) -> np.ndarray:
+        r1, c1 = min(r1, self.shape[0]), min(c1, self.shape[1])
+        out = np.zeros((max(r1 - r0, 0), max(c1 - c0, 0)), dtype=np.uint8)
+        b = self.block
+        for br, bc, rs, re, cs, ce in self._blocks(r0, r1, c0, c1):
+            out[rs - r0:re - r0, cs - c0:ce - c0] = self._data[br, bc, rs - br * b:re - br * b, cs - bc * b:ce - bc * b]
+        return out
+
+    def write(self, r0: int, c0: int, patch: np.ndarray):
+        r1, c1 = r0 + patch.shape[0], c0 + patch.shape[1]
+        b = self.block
+        for br, bc, rs, re, cs, ce in self._blocks(r0, r1, c0, c1):
+            self._data[br, bc, rs - br * b:re - br * b, cs - bc * b:ce - bc * b] = patch[rs - r0:re - r0, cs - c0:ce - c0]
+
+    def gather(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Valeurs aux intersections rows x cols (indices valides)"""
+        b = self.block
+        return self._data[(rows // b)[:, None], (cols // b)[None, :], (rows % b)[:, None], (cols % b)[None, :]]
+
+    def flush(self):
+        self._data.flush()
+
+
+class FloodTileStore:
+    """Raster d'inondation du bassin + pyramide, partagé entre workers via mmap"""
+
+    def __init__(
+        self,
+        root: str,
+        bbox: Optional[Dict[str, float]] = None,
+        resolution_deg: float = 0.00027,  # ~30 m
+        tile_size: int = 256,
+        tile_cache_size: int = 2048
+    ):
+        self.root = root
+        self.bbox = bbox or BASIN_BBOX
+        self.resolution_deg = resolution_deg
+        self.tile_size = tile_size
+        os.makedirs(root, exist_ok=True)
+
+        height = int(math.ceil((self.bbox["north"] - self.bbox["south"]) / resolution_deg))
+        width = int(math.ceil((self.bbox["east"] - self.bbox["west"]) / resolution_deg))
+
+        # Niveaux: 0 = pleine résolution, chaque niveau divise par 2
+        shapes = [(height, width)]
+        while max(shapes[-1]) > tile_size:
+            h, w = shapes[-1]
+            shapes.append(((h + 1) // 2, (w + 1) // 2))
+
+        metadata = {"bbox": self.bbox, "resolution_deg": resolution_deg, "shapes": shapes}
+        level_paths = [os.path.join(root, f"flood_L{k}.u8") for k in range(len(shapes))]
+        version_path = os.path.join(root, "version.i8")
+        self._lock_path = os.path.join(root, "tiles.lock")
+        with _file_lock(self._lock_path):
+            if not self._reusable(metadata, level_paths + [version_path]):
+                # Pyramide créée une seule fois (premier processus): fichiers neufs renommés
+                # en place, jamais tronqués sous un autre processus qui les a mappés;
+                # métadonnées écrites en dernier. Taille réservée d'emblée: fichiers creux
+                # là où le système le permet (ext4, XFS, APFS), sinon alloués en entier
+                # (~1 Go pour le niveau 0 à 30 m).
+                for path, shape in zip(level_paths, shapes):
+                    _allocate(path, int(np.prod(BlockedRaster.layout(shape, tile_size))))
+                _allocate(version_path, np.dtype(np.int64).itemsize)
+                tmp_path = os.path.join(root, f"metadata.json.{os.getpid()}.tmp")
+                with open(tmp_path, "w") as f:
+                    json.dump(metadata, f)
+                os.replace(tmp_path, os.path.join(root, "metadata.json"))
+
+        self.levels: List[BlockedRaster] = [
+            BlockedRaster(path, shape, tile_size, "r+") for path, shape in zip(level_paths, shapes)
+        ]
+        # Compteur de version partagé entre processus (invalide les caches de tuiles)
+        self._version = np.memmap(version_path, dtype=np.int64, mode="r+", shape=(1,))
+
+        self._write_lock = threading.Lock()
+        self._tile_cache: "OrderedDict[Tuple[int, int, int], Tuple[int, bytes]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.tile_cache_size = tile_cache_size
+        self._empty_tile = encode_png(np.zeros((tile_size, tile_size, 4), dtype=np.uint8))
+
+    def _reusable(self, metadata: Dict, paths: List[str]) -> bool:
+        """Fichiers existants créés pour la même emprise et la même résolution"""
+        metadata_path = os.path.join(self.root, "metadata.json")
+        if not os.path.exists(metadata_path) or not all(os.path.exists(path) for path in paths):
+            return False
+        with open(metadata_path) as f:
+            return json.load(f) == json.loads(json.dumps(metadata))
+
+    @property
+    def version(self) -> int:
+        return int(self._version[0])
+
+    @property
+    def max_zoom(self) -> int:
+        """Zoom à partir duquel une tuile est plus fine que la résolution native"""
+        degrees_per_tile = self.resolution_deg * self.tile_size
+        return int(math.ceil(math.log2(360.0 / degrees_per_tile)))
+
+    def metadata(self) -> Dict:
+        return {
+            "bbox": self.bbox,
+            "resolution_deg": self.resolution_deg,
+            "levels": [list(level.shape) for level in self.levels],
+            "tile_size": self.tile_size,
+            "max_native_zoom": self.max_zoom,
+            "version": self.version,
+        }
+
+    def write(self, grid: np.ndarray, bbox: Dict[str, float]):
+        """
+        Écrit une grille de probabilités [0, 1] à sa position dans la mosaïque
+        (rééchantillonnage au plus proche) puis met à jour la pyramide sur la zone modifiée.
+        """
+        res = self.resolution_deg
+        row0 = int(math.floor((self.bbox["north"] - bbox["north"]) / res))
+        row1 = int(math.ceil((self.bbox["north"] - bbox["south"]) / res))
+        col0 = int(math.floor((bbox["west"] - self.bbox["west"]) / res))
+        col1 = int(math.ceil((bbox["east"] - self.bbox["west"]) / res))
+
+        base = self.levels[0]
+        r0, r1 = max(row0, 0), min(row1, base.shape[0])
+        c0, c1 = max(col0, 0), min(col1, base.shape[1])
+        if r0 >= r1 or c0 >= c1:
+            return
+
+        # Indices source pour chaque pixel cible
+        src_rows = ((np.arange(r0, r1) - row0 + 0.5) * grid.shape[0] / (row1 - row0)).astype(np.intp)
+        src_cols = ((np.arange(c0, c1) - col0 + 0.5) * grid.shape[1] / (col1 - col0)).astype(np.intp)
+        codes = np.rint(np.clip(grid, 0.0, 1.0) * 255.0).astype(np.uint8)
+        patch = codes[src_rows][:, src_cols]
+
+        # Écritures sérialisées entre threads (pool de calcul) et entre processus
+        # (workers uvicorn, lots planifiés): pyramide et version cohérentes
+        with self._write_lock, _file_lock(self._lock_path):
+            base.write(r0, c0, patch)
+
+            # Pyramide: recalcule uniquement les blocs parents de la zone modifiée
+            for k in range(1, len(self.levels)):
+                child, parent = self.levels[k - 1], self.levels[k]
+                r0, r1 = r0 // 2, min((r1 + 1) // 2, parent.shape[0])
+                c0, c1 = c0 // 2, min((c1 + 1) // 2, parent.shape[1])
+                parent.write(r0, c0, _downsample_max(child.read(2 * r0, 2 * r1, 2 * c0, 2 * c1))[:r1 - r0, :c1 - c0])
+
+            self._version[0] += 1
+
+    def flush(self):
+        for level in self.levels:
+            level.flush()
+        self._version.flush()
+
+    def cached_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """Tuile déjà rendue pour la version courante de la mosaïque, None sinon"""
+        key = (z, x, y)
+        with self._cache_lock:
+            cached = self._tile_cache.get(key)
+            if cached is None or cached[0] != self.version:
+                return None
+            self._tile_cache.move_to_end(key)
+            return cached[1]
+
+    def render_tile(self, z: int, x: int, y: int) -> bytes:
+        """Tuile PNG RGBA (256x256) pour les coordonnées XYZ (appelable depuis le pool de calcul)"""
+        version = self.version
+        png = self.cached_tile(z, x, y)
+        if png is not None:
+            return png
+
+        png = self._render(z, x, y)
+        with self._cache_lock:
+            self._tile_cache[(z, x, y)] = (version, png)
+            if len(self._tile_cache) > self.tile_cache_size:
+                self._tile_cache.popitem(last=False)
+        return png
+
+    def _render(self, z: int, x: int, y: int) -> bytes:
+        bounds = tile_bounds(z, x, y)
+        if (bounds["south"] >= self.bbox["north"] or bounds["north"] <= self.bbox["south"]
+                or bounds["west"] >= self.bbox["east"] or bounds["east"] <= self.bbox["west"]):
+            return self._empty_tile
+
+        size = self.tile_size
+        # Niveau le plus grossier dont la résolution reste inférieure à celle d'un pixel de tuile
+        pixel_deg = (bounds["east"] - bounds["west"]) / size
+        k = int(np.clip(math.floor(math.log2(pixel_deg / self.resolution_deg)), 0, len(self.levels) - 1))
+        level = self.levels[k]
+        level_res = self.resolution_deg * 2 ** k
+
+        # Centres des pixels (latitude non linéaire en Web Mercator)
+        n = 2 ** z
+        lons = bounds["west"] + (np.arange(size) + 0.5) * pixel_deg
+        merc_y = (y + (np.arange(size) + 0.5) / size) / n
+        lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * merc_y))))
+
+        rows = np.floor((self.bbox["north"] - lats) / level_res).astype(np.intp)
+        cols = np.floor((lons - self.bbox["west"]) / level_res).astype(np.intp)
+        valid_rows = (rows >= 0) & (rows < level.shape[0])
+        valid_cols = (cols >= 0) & (cols < level.shape[1])
+
+        values = np.zeros((size, size), dtype=np.uint8)
+        if valid_rows.any() and valid_cols.any():
+            values[np.ix_(valid_rows, valid_cols)] = level.gather(rows[valid_rows], cols[valid_cols])
+        if not values.any():
+            return self._empty_tile
+
+        rgba = np.empty((size, size, 4), dtype=np.uint8)
+        rgba[..., 0], rgba[..., 1], rgba[..., 2] = FLOOD_RGB
+        rgba[..., 3] = values
+        return encode_png(rgba)
@@ -0,0 +1 @@
+# AQUAMIND Storage Package
@@ -0,0 +1,252 @@
+"""
+Archive colonnaire locale des séries horaires (fichiers .npy mappés en mémoire).
+Une partition par (localisation, année): tableau (colonnes x heures de l'année),
+NaN pour les heures sans mesure. Les lectures par plage ne touchent que les
+années concernées et renvoient des vues sans copie quand la plage tient dans une année.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.storage.base import HYDRO_COLUMNS
+
+
+HOUR = np.timedelta64(1, "h")
+# Identifiants utilisables comme nom de répertoire
+LOCATION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$")
+
+
+def _year_bounds(year: int) -> Tuple[np.datetime64, np.datetime64]:
+    return np.datetime64(f"{year:04d}-01-01T00", "h"), np.datetime64(f"{year + 1:04d}-01-01T00", "h")
+
+
+def _to_hour(value) -> np.datetime64:
+    return np.datetime64(pd.Timestamp(value).floor("H").to_datetime64(), "h")
+
+
+class HistoryArchive:
+    """
+    Archive horaire mappée en mémoire, partitionnée par localisation et année.
+    Un seul processus écrit; `read_only` ouvre les partitions en lecture seule
+    (workers du pool de prévisions, qui voient les écritures via les pages partagées).
+    """
+
+    def __init__(self, root: str, max_open_chunks: int = 256, read_only: bool = False):
+        self.root = root
+        self.max_open_chunks = max_open_chunks
+        self.read_only = read_only
+        self._chunks: "OrderedDict[Tuple[str, int], np.memmap]" = OrderedDict()
+        self._span: Dict[str, Tuple[np.datetime64, np.datetime64]] = {}
+        self._lock = threading.RLock()
+        self._listeners: List[Callable] = []
+        os.makedirs(root, exist_ok=True)
+
+        # Métriques
+        self.rows_written = 0
+        self.reads = 0
+        self.zero_copy_reads = 0
+
+    def add_listener(self, listener: Callable):
+        """`listener(location_id, première heure, dernière heure)` après chaque écriture"""
+        self._listeners.append(listener)
+
+    def _path(self, location_id: str, year: int) -> str:
+        if not LOCATION_ID_PATTERN.match(location_id):
+            raise ValueError(f"Identifiant de localisation invalide: {location_id!r}")
+        return os.path.join(self.root, location_id, f"{year:04d}.npy")
+
+    def _years(self, location_id: str) -> List[int]:
+        directory = os.path.join(self.root, location_id)
+        if not LOCATION_ID_PATTERN.match(location_id) or not os.path.isdir(directory):
+            return []
+        return sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith(".npy"))
+
+    def _chunk(self, location_id: str, year: int, create: bool = False) -> Optional[np.memmap]:
+        """Partition (colonnes x heures) ouverte en lecture/écriture (LRU des fichiers ouverts)"""
+        if create and self.read_only:
+            raise PermissionError(f"Archive en lecture seule: {self.root}")
+        key = (location_id, year)
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is not None:
+                self._chunks.move_to_end(key)
+                return chunk
+            path = self._path(location_id, year)
+            if os.path.exists(path):
+                chunk = np.load(path, mmap_mode="r" if self.read_only else "r+")
+            elif create:
+                # Partition initialisée (NaN) sous un nom temporaire puis renommée:
+                # un lecteur ne voit jamais un fichier à moitié créé
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                start, end = _year_bounds(year)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                blank = np.lib.format.open_memmap(
+                    tmp_path, mode="w+", dtype=np.float64,
+                    shape=(len(HYDRO_COLUMNS), int((end - start) / HOUR))
+                )
+                blank[:] = np.nan
+                blank.flush()
+                del blank
+                os.replace(tmp_path, path)
+                chunk = np.load(path, mmap_mode="r+")
+            else:
+                return None
+            self._chunks[key] = chunk
+            if len(self._chunks) > self.max_open_chunks:
+                _, evicted = self._chunks.popitem(last=False)
+                if not self.read_only:
+                    evicted.flush()
+            return chunk
+
+    def span(self, location_id: str) -> Optional[Tuple[np.datetime64, np.datetime64]]:
+        """(première heure, dernière heure) archivées pour la localisation"""
+        with self._lock:
+            if location_id in self._span:
+                return self._span[location_id]
+            years = self._years(location_id)
+            if not years:
+                return None
+            bounds = []
+            for year in (years[0], years[-1]):
+                filled = np.flatnonzero(np.isfinite(self._chunk(location_id, year)).any(axis=0))
+                if len(filled):
+                    bounds.append(_year_bounds(year)[0] + filled[[0, -1]] * HOUR)
+            if not bounds:
+                return None
+            span = (bounds[0][0], bounds[-1][1])
+            self._span[location_id] = span
+            return span
+
+    def last_time(self, location_id: str) -> Optional[pd.Timestamp]:
+        span = self.span(location_id)
+        return pd.Timestamp(span[1]) if span else None
+
+    def has_data(self, location_id: str) -> bool:
+        return self.span(location_id) is not None
+
+    def write_frame(self, frame: pd.DataFrame) -> int:
+        """
+        Range des mesures (location_id, timestamp, colonnes) dans les créneaux horaires.
+        Seules les valeurs présentes sont écrites; la dernière mesure d'une heure l'emporte.
+        """
+        if frame.empty:
+            return 0
+        hours = pd.to_datetime(frame["timestamp"]).values.astype("datetime64[h]")
+        years = hours.astype("datetime64[Y]").astype(int) + 1970
+        location_ids = frame["location_id"].values
+        columns = [c for c in HYDRO_COLUMNS if c in frame.columns]
+        values = frame[columns].to_numpy(dtype=float)
+
+        partitions = pd.DataFrame({"location_id": location_ids, "year": years}).groupby(["location_id", "year"]).indices
+        touched: Dict[str, Tuple[np.datetime64, np.datetime64]] = {}
+        with self._lock:
+            for (location_id, year), rows in partitions.items():
+                chunk = self._chunk(location_id, int(year), create=True)
+                slots = ((hours[rows] - _year_bounds(int(year))[0]) / HOUR).astype(np.int64)
+                for j, column in enumerate(columns):
+                    present = np.isfinite(values[rows, j])
+                    chunk[HYDRO_COLUMNS.index(column), slots[present]] = values[rows[present], j]
+                written = hours[rows]
+                span = self.span(location_id) or (written.min(), written.max())
+                self._span[location_id] = (min(span[0], written.min()), max(span[1], written.max()))
+                previous = touched.get(location_id, (written.min(), written.max()))
+                touched[location_id] = (min(previous[0], written.min()), max(previous[1], written.max()))
+            for location_id, (first, last) in touched.items():
+                for listener in self._listeners:
+                    listener(location_id, first, last)
+        self.rows_written += len(frame)
+        return len(frame)
+
+    def read(
+        self,
+        location_id: str,
+        start: datetime,
+        end: datetime,
+        columns: Optional[List[str]] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Séries horaires sur [start, end) (heures entières): {'timestamp', colonne: valeurs}.
+        Vues sur les fichiers mappés si la plage tient dans une partition (ne pas modifier),
+        sinon une copie par colonne demandée. NaN pour les heures absentes.
+        """
+        columns = columns or HYDRO_COLUMNS
+        first, last = _to_hour(start), _to_hour(end)
+        n_hours = max(0, int((last - first) / HOUR))
+        result = {"timestamp": np.arange(first, first + n_hours * HOUR, HOUR).astype("datetime64[ns]")}
+        self.reads += 1
+
+        pieces = []
+        year = int(first.astype("datetime64[Y]").astype(int)) + 1970
+        cursor = first
+        while cursor < last:
+            year_start, year_end = _year_bounds(year)
+            stop = min(last, year_end)
+            pieces.append((self._chunk(location_id, year), int((cursor - year_start) / HOUR), int((stop - year_start) / HOUR)))
+            cursor, year = stop, year + 1
+
+        if len(pieces) == 1 and pieces[0][0] is not None:
+            chunk, a, b = pieces[0]
+            self.zero_copy_reads += 1
+            for column in columns:
+                result[column] = chunk[HYDRO_COLUMNS.index(column), a:b]
+            return result
+
+        for column in columns:
+            index = HYDRO_COLUMNS.index(column)
+            out = np.full(n_hours, np.nan)
+            offset = 0
+            for chunk, a, b in pieces:
+                if chunk is not None:
+                    out[offset:offset + b - a] = chunk[index, a:b]
+                offset += b - a
+            result[column] = out
+        return result
+
+    def read_frame(self, location_id: str, start: datetime, end: datetime, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """`read` en DataFrame, heures sans aucune mesure retirées"""
+        arrays = self.read(location_id, start, end, columns)
+        measured = np.zeros(len(arrays["timestamp"]), dtype=bool)
+        for column, values in arrays.items():
+            if column != "timestamp":
+                measured |= ~np.isnan(values)
+        return pd.DataFrame({column: values[measured] for column, values in arrays.items()})
+
+    def refresh(self):
+        """Oublie les bornes et partitions ouvertes (lecteur: nouvelles années et heures écrites ailleurs)"""
+        with self._lock:
+            self._span.clear()
+            self._chunks.clear()
+
+    def flush(self):
+        if self.read_only:
+            return
+        with self._lock:
+            for chunk in self._chunks.values():
+                chunk.flush()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._chunks.clear()
+
+    def stats(self) -> Dict:
+        locations = sorted(
+            name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name))
+        )
+        chunk_files = [self._path(loc, year) for loc in locations for year in self._years(loc)]
+        return {
+            "root": self.root,
+            "locations": len(locations),
+            "chunks": len(chunk_files),
+            "open_chunks": len(self._chunks),
+            "bytes_on_disk": int(sum(os.path.getsize(p) for p in chunk_files)),
+            "rows_written": self.rows_written,
+            "reads": self.reads,
+            "zero_copy_reads": self.zero_copy_reads,
+        }
@@ -0,0 +1,227 @@
+"""
+Interface de stockage des séries hydrologiques (table hydrological_data).
+Les implémentations (PostgreSQL/TimescaleDB, SQLite) exposent les mêmes
+requêtes par plage de temps et des statistiques d'exécution.
+"""
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# Colonnes de mesure de hydrological_data (hors clé time, location_id)
+HYDRO_COLUMNS = [
+    "discharge_m3_s",
+    "water_level_m",
+    "temperature_c",
+    "rainfall_mm",
+    "ndvi",
+    "soil_moisture",
+]
+
+# Colonnes écrites dans la table forecasts (id et created_at par défaut)
+FORECAST_COLUMNS = [
+    "forecast_date",
+    "location_id",
+    "forecast_type",
+    "horizon_days",
+    "predicted_value",
+    "confidence",
+    "model_used",
+]
+
+# Colonnes de climatology_monthly (clé location_id, month)
+CLIMATOLOGY_COLUMNS = ["location_id", "month", "count", "mean", "m2", "last_time"]
+
+# Colonnes de subscriptions lues et écrites (id = subscription_id, alert_types en JSON)
+SUBSCRIPTION_COLUMNS = [
+    "id",
+    "location_id",
+    "alert_types",
+    "min_level",
+    "notification_method",
+    "notification_address",
+    "created_at",
+]
+
+
+class QueryTimer:
+    """Durées d'exécution par requête nommée (compteur, moyenne, max, p95 glissant)"""
+
+    def __init__(self, window: int = 256):
+        self.window = window
+        self._durations: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._totals: Dict[str, float] = {}
+        self._max: Dict[str, float] = {}
+        self.errors = 0
+
+    @contextmanager
+    def measure(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        self._durations.setdefault(name, deque(maxlen=self.window)).append(seconds)
+        self._counts[name] = self._counts.get(name, 0) + 1
+        self._totals[name] = self._totals.get(name, 0.0) + seconds
+        self._max[name] = max(self._max.get(name, 0.0), seconds)
+
+    def stats(self) -> Dict:
+        queries = {}
+        for name, durations in self._durations.items():
+            recent = np.fromiter(durations, dtype=float)
+            queries[name] = {
+                "count": self._counts[name],
+                "avg_ms": 1e3 * self._totals[name] / self._counts[name],
+                "max_ms": 1e3 * self._max[name],
+                "p95_ms": 1e3 * float(np.percentile(recent, 95)),
+            }
+        return {"errors": self.errors, "queries": queries}
+
+
+def empty_frame() -> pd.DataFrame:
+    """Frame vide au format de get_historical_data"""
+    return pd.DataFrame({
+        "timestamp": pd.DatetimeIndex([], dtype="datetime64[ns]"),
+        **{column: np.zeros(0) for column in HYDRO_COLUMNS},
+    })
+
+
+def measurement_rows(frame: pd.DataFrame) -> List[list]:
+    """Mesures ligne par ligne (ordre HYDRO_COLUMNS), None pour les valeurs manquantes"""
+    values = frame.reindex(columns=HYDRO_COLUMNS).to_numpy(dtype=float)
+    rows = values.astype(object)
+    rows[np.isnan(values)] = None
+    return rows.tolist()
+
+
+def subscription_row(subscription: Dict) -> tuple:
+    """Abonnement -> ligne dans l'ordre SUBSCRIPTION_COLUMNS"""
+    return (
+        subscription["subscription_id"],
+        subscription["location_id"],
+        json.dumps(subscription["alert_types"]),
+        subscription["min_level"],
+        subscription.get("notification_method"),
+        subscription.get("notification_address"),
+        subscription["created_at"],
+    )
+
+
+def row_subscription(row) -> Dict:
+    """Ligne (ordre SUBSCRIPTION_COLUMNS) -> abonnement"""
+    subscription_id, location_id, alert_types, min_level, method, address, created_at = row
+    return {
+        "subscription_id": str(subscription_id),
+        "location_id": location_id,
+        "alert_types": json.loads(alert_types) if isinstance(alert_types, str) else list(alert_types),
+        "min_level": min_level,
+        "created_at": created_at,
+        "notification_method": method,
+        "notification_address": address,
+    }
+
+
+def rows_to_frame(rows: List, columns: List[str]) -> pd.DataFrame:
+    """Lignes (time, mesures...) -> DataFrame avec colonne `timestamp`"""
+    if not rows:
+        return empty_frame()
+    frame = pd.DataFrame.from_records(rows, columns=["timestamp"] + columns)
+    frame["timestamp"] = pd.to_datetime(frame["timestamp"])
+    for column in columns:
+        frame[column] = frame[column].astype(float)
+    return frame
+
+
+class HydroStorage:
+    """Stockage des mesures hydrologiques (classe de base)"""
+
+    backend = "abstract"
+
+    def __init__(self):
+        self.timer = QueryTimer()
+        self.connected = False
+
+    async def connect(self):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    async def fetch_range(
+        self,
+        location_id: str,
+        start: datetime,
+        end: datetime,
+        columns: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """Mesures d'une localisation sur [start, end), triées par temps"""
+        raise NotImplementedError
+
+    async def fetch_latest(self, location_ids: List[str]) -> pd.DataFrame:
+        """Dernière mesure de chaque localisation (colonnes location_id, timestamp, mesures)"""
+        raise NotImplementedError
+
+    async def write_frame(self, frame: pd.DataFrame) -> int:
+        """Insère ou remplace des mesures (colonnes location_id, timestamp, mesures)"""
+        raise NotImplementedError
+
+    async def write_forecasts(self, rows: List[tuple]) -> int:
+        """Ajoute des prévisions à la table forecasts (tuples dans l'ordre FORECAST_COLUMNS)"""
+        raise NotImplementedError
+
+    async def read_climatology(self) -> List[Dict]:
+        """Lignes de climatology_monthly (format MonthlyClimatology.to_records)"""
+        raise NotImplementedError
+
+    async def write_climatology(self, records: List[Dict]) -> int:
+        """Insère ou met à jour climatology_monthly par (location_id, month)"""
+        raise NotImplementedError
+
+    async def read_subscriptions(self) -> List[Dict]:
+        """Abonnements actifs (format SubscriptionIndex: subscription_id, alert_types en liste...)"""
+        raise NotImplementedError
+
+    async def write_subscription(self, subscription: Dict):
+        """Enregistre un abonnement (dictionnaire de SubscriptionIndex.subscribe)"""
+        raise NotImplementedError
+
+    async def deactivate_subscription(self, subscription_id: str) -> bool:
+        """Marque un abonnement inactif (is_active = false); False s'il est inconnu"""
+        raise NotImplementedError
+
+    def pool_stats(self) -> Dict:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "connected": self.connected,
+            "pool": self.pool_stats(),
+            **self.timer.stats(),
+        }
+
+
+def create_storage(url: Optional[str]) -> Optional[HydroStorage]:
+    """Stockage selon DATABASE_URL (postgresql://... ou sqlite:///chemin); None si absent"""
+    if not url:
+        return None
+    if url.startswith(("postgresql://", "postgres://")):
+        from app.storage.postgres import PostgresStorage
+        return PostgresStorage(url)
+    if url.startswith("sqlite://"):
+        from app.storage.sqlite import SQLiteStorage
+        return SQLiteStorage(url[len("sqlite:///"):] or ":memory:")
+    raise ValueError(f"DATABASE_URL non supportée: {url.split(':', 1)[0]}")
@@ -0,0 +1,232 @@
+"""
+Stockage PostgreSQL/TimescaleDB (asyncpg, pool de connexions).
+Les requêtes sont des textes SQL constants: asyncpg les prépare une fois par
+connexion et les garde dans son cache de requêtes préparées.
+"""
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+from app.storage.base import (
+    CLIMATOLOGY_COLUMNS, FORECAST_COLUMNS, HYDRO_COLUMNS, SUBSCRIPTION_COLUMNS, HydroStorage,
+    empty_frame, measurement_rows, row_subscription, rows_to_frame, subscription_row
+)
+
+
+class PostgresStorage(HydroStorage):
+    """hydrological_data via un pool asyncpg"""
+
+    backend = "postgresql"
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        statement_cache_size: Optional[int] = None
+    ):
+        super().__init__()
+        self.dsn = dsn
+        self.min_size = min_size or int(os.environ.get("DB_POOL_MIN_SIZE", "2"))
+        self.max_size = max_size or int(os.environ.get("DB_POOL_MAX_SIZE", "10"))
+        self.statement_cache_size = statement_cache_size or int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "128"))
+        self.pool = None
+        self._statements: Dict[str, int] = {}
+        self._range_sql: Dict[tuple, str] = {}
+        self.acquires = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+
+    async def connect(self):
+        if asyncpg is None:
+            raise RuntimeError("asyncpg n'est pas installé (pip install asyncpg)")
+        self.pool = await asyncpg.create_pool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            statement_cache_size=self.statement_cache_size,
+            max_inactive_connection_lifetime=300,
+        )
+        self.connected = True
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+        self.connected = False
+
+    @asynccontextmanager
+    async def _connection(self):
+        start = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            wait = time.perf_counter() - start
+            self.acquires += 1
+            self.acquire_wait_total += wait
+            self.acquire_wait_max = max(self.acquire_wait_max, wait)
+            yield conn
+
+    def _use(self, sql: str) -> str:
+        self._statements[sql] = self._statements.get(sql, 0) + 1
+        return sql
+
+    def _range_query(self, columns: List[str]) -> str:
+        key = tuple(columns)
+        sql = self._range_sql.get(key)
+        if sql is None:
+            # (location_id, time) -> parcours de idx_hydrological_location_time
+            sql = (
+                f"SELECT time, {', '.join(columns)} FROM hydrological_data "
+                "WHERE location_id = $1 AND time >= $2 AND time < $3 "
+                "ORDER BY time"
+            )
+            self._range_sql[key] = sql
+        return sql
+
+    async def fetch_range(
+        self,
+        location_id: str,
+        start: datetime,
+        end: datetime,
+        columns: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        columns = [c for c in HYDRO_COLUMNS if c in columns] if columns else HYDRO_COLUMNS
+        sql = self._use(self._range_query(columns))
+        with self.timer.measure("fetch_range"):
+            async with self._connection() as conn:
+                rows = await conn.fetch(sql, location_id, start, end)
+        return rows_to_frame([tuple(r) for r in rows], columns)
+
+    async def fetch_latest(self, location_ids: List[str]) -> pd.DataFrame:
+        # Une descente d'index par localisation (LATERAL ... LIMIT 1)
+        sql = self._use(
+            f"SELECT l.location_id, h.time, {', '.join('h.' + c for c in HYDRO_COLUMNS)} "
+            "FROM unnest($1::varchar[]) AS l(location_id) "
+            "CROSS JOIN LATERAL ("
+            "SELECT * FROM hydrological_data d WHERE d.location_id = l.location_id "
+            "ORDER BY d.time DESC LIMIT 1"
+            ") h"
+        )
+        with self.timer.measure("fetch_latest"):
+            async with self._connection() as conn:
+                rows = await conn.fetch(sql, list(location_ids))
+        if not rows:
+            return empty_frame().assign(location_id=pd.Series([], dtype=object))
+        frame = rows_to_frame([tuple(r)[1:] for r in rows], HYDRO_COLUMNS)
+        frame.insert(0, "location_id", [r[0] for r in rows])
+        return frame
+
+    async def write_frame(self, frame: pd.DataFrame) -> int:
+        """COPY vers une table temporaire puis fusion (upsert) dans hydrological_data"""
+        if frame.empty:
+            return 0
+        columns = ["time", "location_id"] + HYDRO_COLUMNS
+        staging_sql = self._use(
+            "CREATE TEMP TABLE IF NOT EXISTS hydrological_staging "
+            "(LIKE hydrological_data INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        # Mesure partielle: les colonnes absentes (NULL) conservent la valeur existante
+        merge_sql = self._use(
+            f"INSERT INTO hydrological_data ({', '.join(columns)}) "
+            f"SELECT {', '.join(columns)} FROM hydrological_staging "
+            "ON CONFLICT (time, location_id) DO UPDATE SET "
+            + ", ".join(f"{c} = COALESCE(EXCLUDED.{c}, hydrological_data.{c})" for c in HYDRO_COLUMNS)
+        )
+        records = _frame_records(frame)
+        with self.timer.measure("write_frame"):
+            async with self._connection() as conn:
+                async with conn.transaction():
+                    await conn.execute(staging_sql)
+                    await conn.copy_records_to_table("hydrological_staging", records=records, columns=columns)
+                    await conn.execute(merge_sql)
+        return len(records)
+
+    async def write_forecasts(self, rows: List[tuple]) -> int:
+        """COPY direct dans forecasts (ajout seul, un lot par exécution planifiée)"""
+        if not rows:
+            return 0
+        with self.timer.measure("write_forecasts"):
+            async with self._connection() as conn:
+                await conn.copy_records_to_table("forecasts", records=rows, columns=FORECAST_COLUMNS)
+        return len(rows)
+
+    async def read_climatology(self) -> List[Dict]:
+        sql = self._use(f"SELECT {', '.join(CLIMATOLOGY_COLUMNS)} FROM climatology_monthly")
+        with self.timer.measure("read_climatology"):
+            async with self._connection() as conn:
+                rows = await conn.fetch(sql)
+        return [dict(row) for row in rows]
+
+    async def write_climatology(self, records: List[Dict]) -> int:
+        if not records:
+            return 0
+        sql = self._use(
+            f"INSERT INTO climatology_monthly ({', '.join(CLIMATOLOGY_COLUMNS)}) "
+            "VALUES ($1, $2, $3, $4, $5, $6) "
+            "ON CONFLICT (location_id, month) DO UPDATE SET "
+            + ", ".join(f"{c} = EXCLUDED.{c}" for c in CLIMATOLOGY_COLUMNS[2:])
+            + ", updated_at = CURRENT_TIMESTAMP"
+        )
+        rows = [tuple(record[c] for c in CLIMATOLOGY_COLUMNS) for record in records]
+        with self.timer.measure("write_climatology"):
+            async with self._connection() as conn:
+                await conn.executemany(sql, rows)
+        return len(rows)
+
+    async def read_subscriptions(self) -> List[Dict]:
+        sql = self._use(f"SELECT {', '.join(SUBSCRIPTION_COLUMNS)} FROM subscriptions WHERE is_active")
+        with self.timer.measure("read_subscriptions"):
+            async with self._connection() as conn:
+                rows = await conn.fetch(sql)
+        return [row_subscription(tuple(row)) for row in rows]
+
+    async def write_subscription(self, subscription: Dict):
+        sql = self._use(
+            f"INSERT INTO subscriptions ({', '.join(SUBSCRIPTION_COLUMNS)}) "
+            "VALUES ($1::uuid, $2, $3::json, $4, $5, $6, $7)"
+        )
+        with self.timer.measure("write_subscription"):
+            async with self._connection() as conn:
+                await conn.execute(sql, *subscription_row(subscription))
+
+    async def deactivate_subscription(self, subscription_id: str) -> bool:
+        sql = self._use(
+            "UPDATE subscriptions SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP "
+            "WHERE id = $1::uuid AND is_active"
+        )
+        with self.timer.measure("deactivate_subscription"):
+            async with self._connection() as conn:
+                status = await conn.execute(sql, subscription_id)
+        return status != "UPDATE 0"
+
+    def pool_stats(self) -> Dict:
+        return {
+            "size": self.pool.get_size() if self.pool else 0,
+            "idle": self.pool.get_idle_size() if self.pool else 0,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "acquires": self.acquires,
+            "acquire_wait_avg_ms": 1e3 * self.acquire_wait_total / self.acquires if self.acquires else 0.0,
+            "acquire_wait_max_ms": 1e3 * self.acquire_wait_max,
+            "statement_cache_size": self.statement_cache_size,
+            "statements": len(self._statements),
+            "statement_executions": sum(self._statements.values()),
+        }
+
+
+def _frame_records(frame: pd.DataFrame) -> List[tuple]:
+    """(time, location_id, mesures...) avec None pour les valeurs manquantes"""
+    times = pd.to_datetime(frame["timestamp"]).dt.to_pydatetime()
+    values = measurement_rows(frame)
+    return [
+        (t, location_id, *row)
+        for t, location_id, row in zip(times, frame["location_id"].tolist(), values)
+    ]
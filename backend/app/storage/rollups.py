@@ -0,0 +1,233 @@
+"""
+Agrégats multi-résolution (horaire, journalier, hebdomadaire) pour les graphiques.
+Dérivés de l'archive horaire et tenus à jour à chaque écriture dans l'archive
+(seuls les seaux touchés sont recalculés): une requête coûte O(points affichés).
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.storage.archive import HOUR, HistoryArchive
+from app.storage.base import HYDRO_COLUMNS
+
+
+# Résolution -> (heures par seau, décalage en heures de l'alignement)
+# Semaines alignées sur le lundi (1970-01-01 était un jeudi)
+ROLLUP_RESOLUTIONS = {
+    "hourly": (1, 0),
+    "daily": (24, 0),
+    "weekly": (168, 72),
+}
+ROLLUP_STATS = ("mean", "min", "max", "count")
+# Résolutions matérialisées (l'horaire est lu directement dans l'archive)
+STORED_RESOLUTIONS = ("daily", "weekly")
+EPOCH_HOUR = np.datetime64(0, "h")
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices de `n_out` points préservant la forme
+    de la courbe (premier et dernier points conservés).
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n) if n_out >= n else np.linspace(0, n - 1, max(n_out, 0)).astype(np.int64)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Moyenne du seau suivant (dernier point pour le dernier seau)
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def point_rollup_frame(frame: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """Mesures ponctuelles au format des agrégats (moyenne = min = max, nombre 0/1)"""
+    data = {"timestamp": frame["timestamp"].values}
+    for column in columns:
+        values = frame[column].to_numpy(dtype=float)
+        data[f"{column}_mean"] = data[f"{column}_min"] = data[f"{column}_max"] = values
+        data[f"{column}_count"] = (~np.isnan(values)).astype(np.int32)
+    return pd.DataFrame(data)
+
+
+def decimate(frame: pd.DataFrame, max_points: int, driver: str) -> pd.DataFrame:
+    """Réduit à `max_points` lignes par LTTB sur la colonne `driver` (NaN exclus)"""
+    if len(frame) <= max_points:
+        return frame
+    frame = frame[frame[driver].notna().values]
+    x = frame["timestamp"].values.astype("datetime64[s]").astype(np.int64)
+    return frame.iloc[lttb_indices(x, frame[driver].values, max_points)].reset_index(drop=True)
+
+
+class _RollupTable:
+    """Seaux contigus [origin, origin + n) d'une (localisation, résolution)"""
+
+    def __init__(self, origin: int, n_buckets: int, n_columns: int):
+        self.origin = origin
+        self.count = np.zeros((n_buckets, n_columns), dtype=np.int32)
+        self.sum = np.zeros((n_buckets, n_columns))
+        self.min = np.full((n_buckets, n_columns), np.nan)
+        self.max = np.full((n_buckets, n_columns), np.nan)
+
+    @property
+    def end(self) -> int:
+        return self.origin + len(self.count)
+
+    def cover(self, first: int, last: int):
+        """Étend la table pour couvrir les seaux [first, last] (réserve du double à droite)"""
+        if first >= self.origin and last < self.end:
+            return
+        new_origin = min(first, self.origin)
+        new_end = max(last + 1, self.end)
+        if new_end > self.end:
+            new_end = max(new_end, self.origin + 2 * len(self.count))
+        pad_left, pad_right = self.origin - new_origin, new_end - self.end
+        widths = ((pad_left, pad_right), (0, 0))
+        self.count = np.pad(self.count, widths)
+        self.sum = np.pad(self.sum, widths)
+        self.min = np.pad(self.min, widths, constant_values=np.nan)
+        self.max = np.pad(self.max, widths, constant_values=np.nan)
+        self.origin = new_origin
+
+
+class RollupStore:
+    """Agrégats min/max/moyenne/nombre par seau, alimentés par l'archive horaire"""
+
+    def __init__(self, archive: HistoryArchive):
+        self.archive = archive
+        self._tables: Dict[Tuple[str, str], _RollupTable] = {}
+        self._lock = threading.RLock()
+        archive.add_listener(self.refresh)
+
+        # Métriques
+        self.builds = 0
+        self.buckets_refreshed = 0
+        self.queries = 0
+
+    @staticmethod
+    def _bucket(hours: np.ndarray, resolution: str) -> np.ndarray:
+        size, offset = ROLLUP_RESOLUTIONS[resolution]
+        return ((hours - EPOCH_HOUR).astype(np.int64) + offset) // size
+
+    @staticmethod
+    def _bucket_start(bucket: np.ndarray, resolution: str) -> np.ndarray:
+        size, offset = ROLLUP_RESOLUTIONS[resolution]
+        return EPOCH_HOUR + (np.asarray(bucket, dtype=np.int64) * size - offset) * HOUR
+
+    def _compute(self, location_id: str, resolution: str, first: int, last: int, table: _RollupTable):
+        """Recalcule les seaux [first, last] depuis l'archive (vectorisé par remodelage)"""
+        size, _ = ROLLUP_RESOLUTIONS[resolution]
+        start = self._bucket_start(first, resolution)
+        stop = self._bucket_start(last + 1, resolution)
+        arrays = self.archive.read(location_id, start, stop, HYDRO_COLUMNS)
+        values = np.stack([arrays[c] for c in HYDRO_COLUMNS], axis=1).reshape(last - first + 1, size, len(HYDRO_COLUMNS))
+        present = ~np.isnan(values)
+        rows = slice(first - table.origin, last + 1 - table.origin)
+        table.count[rows] = present.sum(axis=1)
+        table.sum[rows] = np.where(present, values, 0.0).sum(axis=1)
+        with np.errstate(all="ignore"):
+            table.min[rows] = np.where(present.any(axis=1), np.nanmin(np.where(present, values, np.inf), axis=1), np.nan)
+            table.max[rows] = np.where(present.any(axis=1), np.nanmax(np.where(present, values, -np.inf), axis=1), np.nan)
+        self.buckets_refreshed += last - first + 1
+
+    def _table(self, location_id: str, resolution: str) -> Optional[_RollupTable]:
+        """Table de la résolution, construite depuis l'archive au premier accès"""
+        key = (location_id, resolution)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                return table
+            span = self.archive.span(location_id)
+            if span is None:
+                return None
+            first, last = self._bucket(np.array(span), resolution)
+            table = _RollupTable(int(first), int(last - first + 1), len(HYDRO_COLUMNS))
+            self._compute(location_id, resolution, int(first), int(last), table)
+            self._tables[key] = table
+            self.builds += 1
+            return table
+
+    def build(self, location_id: str):
+        for resolution in STORED_RESOLUTIONS:
+            self._table(location_id, resolution)
+
+    def refresh(self, location_id: str, first_hour: np.datetime64, last_hour: np.datetime64):
+        """Listener de l'archive: recalcule les seaux touchés des tables déjà construites"""
+        with self._lock:
+            for resolution in STORED_RESOLUTIONS:
+                table = self._tables.get((location_id, resolution))
+                if table is None:
+                    continue
+                first, last = (int(b) for b in self._bucket(np.array([first_hour, last_hour]), resolution))
+                table.cover(first, last)
+                self._compute(location_id, resolution, first, last, table)
+
+    def query(
+        self,
+        location_id: str,
+        start: pd.Timestamp,
+        end: pd.Timestamp,
+        resolution: str,
+        columns: Optional[List[str]] = None
+    ) -> Optional[pd.DataFrame]:
+        """
+        Seaux non vides sur [start, end): timestamp (début du seau) puis
+        <colonne>_mean/_min/_max/_count. None si l'archive ne couvre pas la localisation.
+        """
+        columns = columns or HYDRO_COLUMNS
+        if resolution == "hourly":
+            return self._query_hourly(location_id, start, end, columns)
+        table = self._table(location_id, resolution)
+        if table is None:
+            return None
+        self.queries += 1
+        hours = np.array([pd.Timestamp(start).to_datetime64(), pd.Timestamp(end).to_datetime64()]).astype("datetime64[h]")
+        first, stop = self._bucket(hours - np.array([0, 1]) * HOUR, resolution) + np.array([0, 1])
+        first, stop = max(int(first), table.origin), min(int(stop), table.end)
+        if stop <= first:
+            return pd.DataFrame({"timestamp": pd.DatetimeIndex([], dtype="datetime64[ns]")})
+        rows = slice(first - table.origin, stop - table.origin)
+        indices = [HYDRO_COLUMNS.index(c) for c in columns]
+        count = table.count[rows][:, indices]
+        keep = count.any(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, table.sum[rows][:, indices] / count, np.nan)
+        data = {"timestamp": self._bucket_start(np.arange(first, stop)[keep], resolution).astype("datetime64[ns]")}
+        for j, column in enumerate(columns):
+            data[f"{column}_mean"] = mean[keep, j]
+            data[f"{column}_min"] = table.min[rows][keep, indices[j]]
+            data[f"{column}_max"] = table.max[rows][keep, indices[j]]
+            data[f"{column}_count"] = count[keep, j]
+        return pd.DataFrame(data)
+
+    def _query_hourly(self, location_id: str, start, end, columns: List[str]) -> Optional[pd.DataFrame]:
+        """Résolution horaire: créneaux de l'archive (une valeur par heure)"""
+        if not self.archive.has_data(location_id):
+            return None
+        self.queries += 1
+        return point_rollup_frame(self.archive.read_frame(location_id, start, end, columns), columns)
+
+    def estimated_points(self, days_back: int, resolution: str) -> int:
+        size, _ = ROLLUP_RESOLUTIONS[resolution]
+        return -(-days_back * 24 // size) + 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "tables": len(self._tables),
+                "buckets": int(sum(len(t.count) for t in self._tables.values())),
+                "builds": self.builds,
+                "buckets_refreshed": self.buckets_refreshed,
+                "queries": self.queries,
+            }
@@ -0,0 +1,299 @@
+"""
+Stockage embarqué SQLite (fichier ou mémoire), sans serveur.
+Une connexion unique (WAL) sérialisée par un verrou; les requêtes
+s'exécutent dans le pool de threads pour ne pas bloquer la boucle.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.storage.base import (
+    CLIMATOLOGY_COLUMNS, FORECAST_COLUMNS, HYDRO_COLUMNS, SUBSCRIPTION_COLUMNS, HydroStorage,
+    empty_frame, measurement_rows, row_subscription, subscription_row
+)
+
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS hydrological_data (
+    time INTEGER NOT NULL,
+    location_id TEXT NOT NULL,
+    {', '.join(f'{c} REAL' for c in HYDRO_COLUMNS)},
+    PRIMARY KEY (time, location_id)
+);
+CREATE INDEX IF NOT EXISTS idx_hydrological_location_time
+    ON hydrological_data (location_id, time DESC);
+CREATE TABLE IF NOT EXISTS forecasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    forecast_date INTEGER NOT NULL,
+    location_id TEXT NOT NULL,
+    forecast_type TEXT NOT NULL,
+    horizon_days INTEGER,
+    predicted_value REAL,
+    confidence REAL,
+    model_used TEXT,
+    created_at INTEGER DEFAULT (strftime('%s', 'now'))
+);
+CREATE INDEX IF NOT EXISTS idx_forecasts_location_type
+    ON forecasts (location_id, forecast_type, forecast_date DESC);
+CREATE TABLE IF NOT EXISTS climatology_monthly (
+    location_id TEXT NOT NULL,
+    month INTEGER NOT NULL CHECK (month BETWEEN 1 AND 12),
+    count INTEGER NOT NULL DEFAULT 0,
+    mean REAL NOT NULL DEFAULT 0,
+    m2 REAL NOT NULL DEFAULT 0,
+    last_time INTEGER,
+    updated_at INTEGER DEFAULT (strftime('%s', 'now')),
+    PRIMARY KEY (location_id, month)
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT,
+    location_id TEXT NOT NULL,
+    alert_types TEXT NOT NULL,
+    min_level TEXT NOT NULL DEFAULT 'vigilance',
+    notification_method TEXT,
+    notification_address TEXT,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    created_at INTEGER DEFAULT (strftime('%s', 'now')),
+    updated_at INTEGER DEFAULT (strftime('%s', 'now'))
+);
+"""
+
+
+def _epoch_seconds(values) -> np.ndarray:
+    """Horodatages -> secondes UTC (colonne time, entier)"""
+    return np.asarray(pd.to_datetime(values).values, dtype="datetime64[s]").astype(np.int64)
+
+
+def _to_epoch(value: datetime) -> int:
+    return int(_epoch_seconds([value])[0])
+
+
+class SQLiteStorage(HydroStorage):
+    """hydrological_data dans une base SQLite locale"""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = ":memory:", cached_statements: int = 128):
+        super().__init__()
+        self.path = path
+        self.cached_statements = cached_statements
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.lock_wait_total = 0.0
+        self.lock_wait_max = 0.0
+        self.executions = 0
+
+    async def connect(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._open)
+        self.connected = True
+
+    def _open(self):
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    async def close(self):
+        if self.conn is not None:
+            with self._lock:
+                self.conn.close()
+            self.conn = None
+        self.connected = False
+
+    async def _run(self, name: str, fn, *args):
+        """Exécute `fn(conn, *args)` sous le verrou, dans le pool de threads"""
+        def call():
+            start = time.perf_counter()
+            with self._lock:
+                wait = time.perf_counter() - start
+                self.lock_wait_total += wait
+                self.lock_wait_max = max(self.lock_wait_max, wait)
+                self.executions += 1
+                with self.timer.measure(name):
+                    return fn(self.conn, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    async def fetch_range(
+        self,
+        location_id: str,
+        start: datetime,
+        end: datetime,
+        columns: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        columns = [c for c in HYDRO_COLUMNS if c in columns] if columns else HYDRO_COLUMNS
+        sql = (
+            f"SELECT time, {', '.join(columns)} FROM hydrological_data "
+            "WHERE location_id = ? AND time >= ? AND time < ? ORDER BY time"
+        )
+
+        def query(conn):
+            return conn.execute(sql, (location_id, _to_epoch(start), _to_epoch(end))).fetchall()
+
+        rows = await self._run("fetch_range", query)
+        return _rows_frame(rows, columns)
+
+    async def fetch_latest(self, location_ids: List[str]) -> pd.DataFrame:
+        sql = (
+            f"SELECT location_id, time, {', '.join(HYDRO_COLUMNS)} FROM hydrological_data "
+            "WHERE location_id = ? ORDER BY time DESC LIMIT 1"
+        )
+
+        def query(conn):
+            rows = []
+            for location_id in location_ids:
+                rows.extend(conn.execute(sql, (location_id,)).fetchall())
+            return rows
+
+        rows = await self._run("fetch_latest", query)
+        frame = _rows_frame([row[1:] for row in rows], HYDRO_COLUMNS)
+        frame.insert(0, "location_id", pd.Series([row[0] for row in rows], dtype=object))
+        return frame
+
+    async def write_frame(self, frame: pd.DataFrame) -> int:
+        if frame.empty:
+            return 0
+        # Mesure partielle: les colonnes absentes (NULL) conservent la valeur existante
+        sql = (
+            f"INSERT INTO hydrological_data (time, location_id, {', '.join(HYDRO_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * (len(HYDRO_COLUMNS) + 2))}) "
+            "ON CONFLICT (time, location_id) DO UPDATE SET "
+            + ", ".join(f"{c} = coalesce(excluded.{c}, {c})" for c in HYDRO_COLUMNS)
+        )
+        values = measurement_rows(frame)
+        records = [
+            (t, location_id, *row)
+            for t, location_id, row in zip(
+                _epoch_seconds(frame["timestamp"]).tolist(), frame["location_id"].tolist(), values
+            )
+        ]
+
+        def write(conn):
+            with conn:
+                conn.executemany(sql, records)
+
+        await self._run("write_frame", write)
+        return len(records)
+
+    async def write_forecasts(self, rows: List[tuple]) -> int:
+        if not rows:
+            return 0
+        sql = (
+            f"INSERT INTO forecasts ({', '.join(FORECAST_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(FORECAST_COLUMNS))})"
+        )
+        # forecast_date en secondes UTC, comme hydrological_data.time
+        dates = _epoch_seconds([row[0] for row in rows]).tolist()
+        records = [(date, *row[1:]) for date, row in zip(dates, rows)]
+
+        def write(conn):
+            with conn:
+                conn.executemany(sql, records)
+
+        await self._run("write_forecasts", write)
+        return len(records)
+
+    async def read_climatology(self) -> List[Dict]:
+        sql = f"SELECT {', '.join(CLIMATOLOGY_COLUMNS)} FROM climatology_monthly"
+
+        def query(conn):
+            return conn.execute(sql).fetchall()
+
+        rows = await self._run("read_climatology", query)
+        records = [dict(zip(CLIMATOLOGY_COLUMNS, row)) for row in rows]
+        for record in records:
+            if record["last_time"] is not None:
+                record["last_time"] = datetime.utcfromtimestamp(record["last_time"])
+        return records
+
+    async def write_climatology(self, records: List[Dict]) -> int:
+        if not records:
+            return 0
+        sql = (
+            f"INSERT INTO climatology_monthly ({', '.join(CLIMATOLOGY_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(CLIMATOLOGY_COLUMNS))}) "
+            "ON CONFLICT (location_id, month) DO UPDATE SET "
+            + ", ".join(f"{c} = excluded.{c}" for c in CLIMATOLOGY_COLUMNS[2:])
+            + ", updated_at = strftime('%s', 'now')"
+        )
+        rows = [
+            (*(record[c] for c in CLIMATOLOGY_COLUMNS[:-1]),
+             _to_epoch(record["last_time"]) if record["last_time"] is not None else None)
+            for record in records
+        ]
+
+        def write(conn):
+            with conn:
+                conn.executemany(sql, rows)
+
+        await self._run("write_climatology", write)
+        return len(rows)
+
+    async def read_subscriptions(self) -> List[Dict]:
+        sql = f"SELECT {', '.join(SUBSCRIPTION_COLUMNS)} FROM subscriptions WHERE is_active"
+
+        def query(conn):
+            return conn.execute(sql).fetchall()
+
+        rows = await self._run("read_subscriptions", query)
+        return [row_subscription((*row[:-1], datetime.utcfromtimestamp(row[-1]))) for row in rows]
+
+    async def write_subscription(self, subscription: Dict):
+        sql = (
+            f"INSERT INTO subscriptions ({', '.join(SUBSCRIPTION_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(SUBSCRIPTION_COLUMNS))})"
+        )
+        row = subscription_row(subscription)
+        # created_at en secondes UTC, comme les autres horodatages de la base
+        row = (*row[:-1], _to_epoch(row[-1]))
+
+        def write(conn):
+            with conn:
+                conn.execute(sql, row)
+
+        await self._run("write_subscription", write)
+
+    async def deactivate_subscription(self, subscription_id: str) -> bool:
+        sql = (
+            "UPDATE subscriptions SET is_active = 0, updated_at = strftime('%s', 'now') "
+            "WHERE id = ? AND is_active"
+        )
+
+        def write(conn):
+            with conn:
+                return conn.execute(sql, (subscription_id,)).rowcount
+
+        return await self._run("deactivate_subscription", write) > 0
+
+    def pool_stats(self) -> Dict:
+        return {
+            "size": 1 if self.conn is not None else 0,
+            "path": self.path,
+            "executions": self.executions,
+            "lock_wait_avg_ms": 1e3 * self.lock_wait_total / self.executions if self.executions else 0.0,
+            "lock_wait_max_ms": 1e3 * self.lock_wait_max,
+            "statement_cache_size": self.cached_statements,
+        }
+
+
+def _rows_frame(rows: List[tuple], columns: List[str]) -> pd.DataFrame:
+    if not rows:
+        return empty_frame()[["timestamp"] + columns]
+    data = np.array(rows, dtype=float)
+    frame = pd.DataFrame({"timestamp": pd.to_datetime(data[:, 0].astype(np.int64), unit="s")})
+    for i, column in enumerate(columns):
+        frame[column] = data[:, i + 1]
+    return frame
@@ -0,0 +1,90 @@
+"""
+Benchmark de DataService.get_historical_data.
+Mesure le débit (lignes/seconde) pour des fenêtres de 90 jours, 1 an et plusieurs années:
+- ancienne boucle Python ligne par ligne (référence)
+- génération vectorisée à froid (cache vide)
+- appel à chaud (cache valide)
+- extension incrémentale (cache décalé d'une heure)
+
+Usage (depuis backend/): python scripts/benchmark_historical.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.data_service import DataService  # noqa: E402
+
+
+WINDOWS_DAYS = [90, 365, 3 * 365, 10 * 365]
+LEGACY_MAX_DAYS = 365  # La boucle de référence est trop lente au-delà
+
+
+def legacy_loop(days_back: int) -> pd.DataFrame:
+    """Implémentation d'origine (une itération Python par heure)"""
+    dates = pd.date_range(end=pd.Timestamp.utcnow().floor('H'), periods=days_back * 24, freq='H')
+    discharge_values, rainfall_values, temp_values, ndvi_values = [], [], [], []
+    for date in dates:
+        seasonal = 1250 * (0.8 + 0.7 * np.sin(2 * np.pi * date.month / 12))
+        discharge_values.append(max(100, seasonal * (1 + np.random.normal(0, 0.15))))
+        rainfall_values.append(max(0, 5 + 25 * np.sin(2 * np.pi * date.month / 12) + np.random.normal(0, 10)))
+        temp_values.append(25 + 8 * np.cos(2 * np.pi * date.month / 12)
+                           + 5 * np.sin(date.hour * 2 * np.pi / 24) + np.random.normal(0, 1))
+        ndvi_values.append(-0.2 + 0.7 * np.sin(2 * np.pi * date.month / 12) + np.random.normal(0, 0.05))
+    return pd.DataFrame({
+        'timestamp': dates,
+        'discharge_m3_s': discharge_values,
+        'rainfall_mm': rainfall_values,
+        'temperature_c': temp_values,
+        'ndvi': ndvi_values
+    })
+
+
+def _timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def run():
+    print(f"{'fenêtre':>10} {'lignes':>9} {'mode':>12} {'durée (ms)':>11} {'lignes/s':>14}")
+    for days in WINDOWS_DAYS:
+        rows = days * 24
+        results = []
+
+        if days <= LEGACY_MAX_DAYS:
+            results.append(("boucle", _timed(lambda: legacy_loop(days), repeat=1)))
+
+        service = DataService(db=None)
+        start = time.perf_counter()
+        await service.get_historical_data("station_001", days)
+        results.append(("vectorisé", time.perf_counter() - start))
+
+        start = time.perf_counter()
+        await service.get_historical_data("station_001", days)
+        results.append(("cache", time.perf_counter() - start))
+
+        # Simule le passage d'une heure: décale le cache d'une heure dans le passé
+        key = ("station_001", days)
+        shifted = service._historical_cache[key].copy()
+        shifted['timestamp'] = shifted['timestamp'] - pd.Timedelta(hours=1)
+        service._historical_cache[key] = shifted
+        start = time.perf_counter()
+        await service.get_historical_data("station_001", days)
+        results.append(("incrémental", time.perf_counter() - start))
+
+        for mode, seconds in results:
+            label = f"{days} j"
+            print(f"{label:>10} {rows:>9} {mode:>12} {seconds * 1e3:>11.2f} {rows / seconds:>14,.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -52,6 +52,18 @@ CREATE TABLE IF NOT EXISTS forecasts (
     INDEX (forecast_date, location_id)
 );
 
+-- Monthly discharge climatology (running count / mean / M2 per location and month)
+CREATE TABLE IF NOT EXISTS climatology_monthly (
+    location_id VARCHAR(50) NOT NULL,
+    month SMALLINT NOT NULL CHECK (month BETWEEN 1 AND 12),
+    count BIGINT NOT NULL DEFAULT 0,
+    mean DOUBLE PRECISION NOT NULL DEFAULT 0,
+    m2 DOUBLE PRECISION NOT NULL DEFAULT 0,
+    last_time TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (location_id, month)
+);
+
 -- Alerts table
 CREATE TABLE IF NOT EXISTS alerts (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -75,17 +87,24 @@ CREATE TABLE IF NOT EXISTS alerts (
 -- Subscriptions table
 CREATE TABLE IF NOT EXISTS subscriptions (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    user_id UUID NOT NULL REFERENCES users(id),
+    user_id UUID REFERENCES users(id),
     location_id VARCHAR(50) NOT NULL,
     alert_types JSON NOT NULL,
-    notification_method VARCHAR(50) NOT NULL,
-    notification_address VARCHAR(255) NOT NULL,
+    min_level VARCHAR(20) NOT NULL DEFAULT 'vigilance',
+    notification_method VARCHAR(50),
+    notification_address VARCHAR(255),
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     UNIQUE (user_id, location_id, notification_address)
 );
 
+-- API subscriptions (/alerts/subscribe): user and notification channel are optional
+ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS min_level VARCHAR(20) NOT NULL DEFAULT 'vigilance';
+ALTER TABLE subscriptions ALTER COLUMN user_id DROP NOT NULL;
+ALTER TABLE subscriptions ALTER COLUMN notification_method DROP NOT NULL;
+ALTER TABLE subscriptions ALTER COLUMN notification_address DROP NOT NULL;
+
 -- Audit log
 CREATE TABLE IF NOT EXISTS audit_log (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -112,7 +131,7 @@ CREATE INDEX IF NOT EXISTS idx_alerts_location_type
 
 -- Grant permissions
 GRANT SELECT ON ALL TABLES IN SCHEMA public TO aquamind;
-GRANT INSERT, UPDATE ON hydrological_data, forecasts, alerts TO aquamind;
+GRANT INSERT, UPDATE ON hydrological_data, forecasts, alerts, climatology_monthly TO aquamind;
 GRANT ALL ON users, subscriptions, audit_log TO aquamind;
 
 -- Initialize some data
@@ -0,0 +1,11 @@
+import pytest
+
+from app.storage.sqlite import SQLiteStorage
+
+
+@pytest.fixture
+async def storage(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "hydro.db"))
+    await storage.connect()
+    yield storage
+    await storage.close()
@@ -0,0 +1,21 @@
+"""Données de test partagées"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from app.storage.base import HYDRO_COLUMNS
+
+
+START = datetime(2024, 8, 1)
+
+
+def readings(location_id: str, hours: int, discharge: float = 100.0, start: datetime = START) -> pd.DataFrame:
+    """Mesures horaires validées (format validate_readings), débit seul renseigné"""
+    frame = pd.DataFrame({
+        "timestamp": pd.date_range(start, periods=hours, freq="H"),
+        "location_id": location_id,
+        **{column: np.nan for column in HYDRO_COLUMNS},
+    })
+    frame["discharge_m3_s"] = discharge + np.arange(hours, dtype=float)
+    return frame
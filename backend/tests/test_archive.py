@@ -0,0 +1,43 @@
+"""
+Archive horaire: un processus écrit, les workers lisent en lecture seule.
+"""
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from app.storage.archive import HistoryArchive
+from tests.factories import START, readings
+
+
+def test_read_only_archive_sees_writer_updates(tmp_path):
+    writer = HistoryArchive(str(tmp_path))
+    writer.write_frame(readings("bakel", 24))
+    reader = HistoryArchive(str(tmp_path), read_only=True)
+
+    arrays = reader.read("bakel", START, START + timedelta(days=1), ["discharge_m3_s"])
+    np.testing.assert_allclose(arrays["discharge_m3_s"], 100.0 + np.arange(24))
+    assert reader.last_time("bakel") == START + timedelta(hours=23)
+
+    # Heures d'une partition déjà ouverte: visibles via les pages partagées
+    writer.write_frame(readings("bakel", 24, discharge=500.0, start=START + timedelta(days=1)))
+    arrays = reader.read("bakel", START + timedelta(days=1), START + timedelta(days=2), ["discharge_m3_s"])
+    np.testing.assert_allclose(arrays["discharge_m3_s"], 500.0 + np.arange(24))
+
+    # Nouvelle partition (année suivante) et nouvelles bornes: après refresh
+    writer.write_frame(readings("bakel", 2, start=START.replace(year=START.year + 1)))
+    assert reader.last_time("bakel") == START + timedelta(hours=23)
+    reader.refresh()
+    assert reader.last_time("bakel") == START.replace(year=START.year + 1) + timedelta(hours=1)
+    assert not list(tmp_path.glob("bakel/*.tmp"))
+
+
+def test_read_only_archive_refuses_writes(tmp_path):
+    HistoryArchive(str(tmp_path)).write_frame(readings("bakel", 2))
+    reader = HistoryArchive(str(tmp_path), read_only=True)
+
+    with pytest.raises(PermissionError):
+        reader.write_frame(readings("kayes", 2))
+    with pytest.raises(ValueError, match="read-only"):
+        reader.read("bakel", START, START + timedelta(hours=2))["discharge_m3_s"][0] = 0.0
+    reader.close()
@@ -0,0 +1,243 @@
+"""
+Ingestion en masse: analyse NDJSON/colonnaire, validation vectorisée
+(compteurs de rejets, dédoublonnage) et tampon d'écriture vers le stockage.
+"""
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.ingest_service import BufferedWriter, IngestService, parse_readings, validate_readings
+from tests.factories import START, readings
+
+
+NOW = datetime(2024, 8, 2)
+
+
+def ndjson(*records) -> bytes:
+    return "\n".join(json.dumps(record) for record in records).encode()
+
+
+def test_parse_ndjson():
+    frame = parse_readings(
+        ndjson(
+            {"timestamp": "2024-08-01T00:00:00Z", "location_id": "bakel", "discharge_m3_s": 120.5},
+            {"timestamp": "2024-08-01T01:00:00Z", "location_id": "bakel", "rainfall_mm": 3},
+        ),
+        "application/x-ndjson; charset=utf-8",
+    )
+
+    assert len(frame) == 2
+    assert frame["timestamp"].tolist() == ["2024-08-01T00:00:00Z", "2024-08-01T01:00:00Z"]
+    assert frame["discharge_m3_s"].iloc[0] == 120.5
+    assert np.isnan(frame["discharge_m3_s"].iloc[1])
+
+
+def test_parse_columnar_broadcasts_scalars():
+    body = json.dumps({
+        "location_id": "kayes",
+        "timestamp": ["2024-08-01T00:00:00", "2024-08-01T01:00:00", "2024-08-01T02:00:00"],
+        "water_level_m": [4.1, 4.2, 4.3],
+    }).encode()
+
+    frame = parse_readings(body, "application/json")
+
+    assert frame["location_id"].tolist() == ["kayes"] * 3
+    assert frame["water_level_m"].tolist() == [4.1, 4.2, 4.3]
+
+
+def test_parse_record_list_and_single_object():
+    records = [{"timestamp": "2024-08-01T00:00:00", "location_id": "bakel", "ndvi": 0.4}]
+
+    assert len(parse_readings(json.dumps(records).encode(), "application/json")) == 1
+    assert len(parse_readings(json.dumps(records[0]).encode(), "application/json")) == 1
+    assert parse_readings(b"  \n", "application/x-ndjson").empty
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (b"{pas du json", "application/json"),
+    (b'{"timestamp": ["2024-08-01"], "location_id": ["a", "b"]}', "application/json"),
+    (b'"texte"', "application/json"),
+    (b'{"timestamp": "2024-08-01"}\n{oups', "application/x-ndjson"),
+])
+def test_parse_rejects_malformed_body(body, content_type):
+    with pytest.raises(ValueError):
+        parse_readings(body, content_type)
+
+
+def test_validate_requires_key_columns():
+    with pytest.raises(ValueError, match="location_id"):
+        validate_readings(pd.DataFrame({"timestamp": ["2024-08-01T00:00:00"]}), now=NOW)
+
+
+def test_validate_accepts_aliases_and_normalizes():
+    frame = pd.DataFrame({
+        "time": ["2024-08-01T02:00:00+02:00", "2024-08-01T01:00:00.750"],
+        "station_id": [" bakel ", "bakel"],
+        "discharge_m3_s": ["150", 151],
+    })
+
+    valid, counts = validate_readings(frame, now=NOW)
+
+    assert counts["accepted"] == 2 and counts["rejected"] == 0
+    # Fuseau converti en UTC, fractions de seconde tronquées, identifiant nettoyé
+    assert valid["timestamp"].tolist() == [pd.Timestamp("2024-08-01T00:00:00"), pd.Timestamp("2024-08-01T01:00:00")]
+    assert valid["location_id"].tolist() == ["bakel", "bakel"]
+    assert valid["discharge_m3_s"].tolist() == [150.0, 151.0]
+
+
+def test_validate_drops_out_of_range_values():
+    frame = pd.DataFrame({
+        "timestamp": ["2024-08-01T00:00:00", "2024-08-01T01:00:00"],
+        "location_id": "bakel",
+        "discharge_m3_s": [-5.0, 200.0],
+        "ndvi": [0.5, 3.0],
+        "rainfall_mm": [2.0, "n/a"],
+    })
+
+    valid, counts = validate_readings(frame, now=NOW)
+
+    assert counts["out_of_range_values"] == 2
+    assert counts["accepted"] == 2
+    assert np.isnan(valid["discharge_m3_s"].iloc[0]) and valid["ndvi"].iloc[0] == 0.5
+    assert valid["discharge_m3_s"].iloc[1] == 200.0 and np.isnan(valid["ndvi"].iloc[1])
+    # Valeur illisible: manquante, sans compter comme hors plage
+    assert np.isnan(valid["rainfall_mm"].iloc[1])
+
+
+def test_validate_rejects_rows_and_counts_reasons():
+    frame = pd.DataFrame({
+        "timestamp": [
+            "2024-08-01T00:00:00",  # valide
+            "pas une date",  # horodatage invalide
+            "2024-08-02T02:00:00",  # plus d'une heure dans le futur
+            "2024-08-02T00:30:00",  # futur toléré (horloge de la passerelle)
+            "2024-08-01T00:00:00",  # identifiant invalide
+            "2024-08-01T00:00:00",  # identifiant trop long
+            "2024-08-01T00:00:00",  # aucune mesure exploitable
+        ],
+        "location_id": ["bakel", "bakel", "bakel", "bakel", "../etc", "x" * 51, "kayes"],
+        "discharge_m3_s": [100.0, 100.0, 100.0, 100.0, 100.0, 100.0, -1.0],
+    })
+
+    valid, counts = validate_readings(frame, now=NOW)
+
+    assert valid["location_id"].tolist() == ["bakel", "bakel"]
+    assert counts == {
+        "received": 7,
+        "accepted": 2,
+        "rejected": 5,
+        "duplicates": 0,
+        "out_of_range_values": 1,
+        "invalid_timestamp": 1,
+        "future_timestamp": 1,
+        "invalid_location": 2,
+        "no_valid_measurement": 1,
+    }
+
+
+def test_validate_deduplicates_on_time_and_location():
+    frame = pd.DataFrame({
+        "timestamp": ["2024-08-01T00:00:00", "2024-08-01T00:00:00", "2024-08-01T00:00:00", "2024-08-01T01:00:00"],
+        "location_id": ["bakel", "bakel", "kayes", "bakel"],
+        "discharge_m3_s": [100.0, 110.0, 500.0, 120.0],
+    })
+
+    valid, counts = validate_readings(frame, now=NOW)
+
+    assert counts["duplicates"] == 1 and counts["accepted"] == 3
+    bakel = valid[valid["location_id"] == "bakel"].sort_values("timestamp")
+    assert bakel["discharge_m3_s"].tolist() == [110.0, 120.0]
+
+
+def test_validate_merges_partial_readings():
+    frame = pd.DataFrame({
+        "timestamp": ["2024-08-01T00:00:00", "2024-08-01T00:00:00", "2024-08-01T00:00:00"],
+        "location_id": "bakel",
+        "discharge_m3_s": [100.0, np.nan, 105.0],
+        "rainfall_mm": [np.nan, 4.0, np.nan],
+        "water_level_m": [3.5, 3.6, np.nan],
+    })
+
+    valid, counts = validate_readings(frame, now=NOW)
+
+    assert counts["duplicates"] == 2 and counts["accepted"] == 1
+    # Dernière valeur présente de chaque mesure
+    row = valid.iloc[0]
+    assert (row["discharge_m3_s"], row["rainfall_mm"], row["water_level_m"]) == (105.0, 4.0, 3.6)
+    assert list(valid.columns) == list(readings("bakel", 1).columns)
+
+
+async def test_buffered_writer_merges_partial_readings(storage):
+    writer = BufferedWriter(storage, batch_rows=1000)
+    await writer.submit(readings("bakel", 2))
+    rainfall = readings("bakel", 2).assign(discharge_m3_s=np.nan, rainfall_mm=[1.0, 2.0])
+    await writer.submit(rainfall)
+
+    assert await writer.flush() == 2
+
+    frame = await storage.fetch_range("bakel", START, START + timedelta(days=1))
+    assert frame["discharge_m3_s"].tolist() == [100.0, 101.0]
+    assert frame["rainfall_mm"].tolist() == [1.0, 2.0]
+
+
+async def test_buffered_writer_merges_duplicates(storage):
+    writer = BufferedWriter(storage, batch_rows=1000)
+    await writer.submit(readings("bakel", 24))
+    # Mêmes (timestamp, location_id) sur 12 h: la dernière valeur reçue gagne
+    await writer.submit(readings("bakel", 12, discharge=700.0, start=START + timedelta(hours=12)))
+    assert writer.pending_rows == 36
+
+    assert await writer.flush() == 24
+    assert writer.pending_rows == 0
+    assert writer.duplicates_merged == 12
+
+    frame = await storage.fetch_range("bakel", START, START + timedelta(days=1))
+    np.testing.assert_allclose(frame["discharge_m3_s"].iloc[:12], 100.0 + np.arange(12))
+    np.testing.assert_allclose(frame["discharge_m3_s"].iloc[12:], 700.0 + np.arange(12))
+
+
+async def test_buffered_writer_flushes_at_threshold(storage):
+    written = []
+    writer = BufferedWriter(storage, batch_rows=24)
+    writer.add_listener(lambda frame: written.append(len(frame)))
+
+    await writer.submit(readings("bakel", 12))
+    assert written == []
+    await writer.submit(readings("bakel", 12, start=START + timedelta(hours=12)))
+
+    assert written == [24]
+    assert writer.stats()["flushes"] == 1
+
+
+async def test_buffered_writer_keeps_batch_after_failure(storage):
+    writer = BufferedWriter(storage, batch_rows=1000)
+    await writer.submit(readings("bakel", 6))
+    await storage.close()
+
+    assert await writer.flush() == 0
+    assert writer.flush_errors == 1
+    assert writer.pending_rows == 6
+
+    await storage.connect()
+    assert await writer.flush() == 6
+    assert len(await storage.fetch_range("bakel", START, START + timedelta(days=1))) == 6
+
+
+async def test_ingest_service_end_to_end(storage):
+    service = IngestService(BufferedWriter(storage, batch_rows=1), max_rows_per_request=3)
+    body = ndjson(
+        {"time": "2024-08-01T00:00:00Z", "station_id": "bakel", "discharge_m3_s": 100},
+        {"time": "2024-08-01T01:00:00Z", "station_id": "bakel", "discharge_m3_s": 101},
+        {"time": "2024-08-01T01:00:00Z", "station_id": "../bakel", "discharge_m3_s": 101},
+    )
+
+    result = await service.ingest(body, "application/x-ndjson")
+
+    assert result["accepted"] == 2 and result["rejected"] == 1 and result["pending_rows"] == 0
+    assert len(await storage.fetch_range("bakel", START, START + timedelta(days=1))) == 2
+    with pytest.raises(ValueError, match="Au plus 3"):
+        await service.ingest(ndjson(*[{"timestamp": "2024-08-01", "location_id": "bakel"}] * 4), "application/x-ndjson")
+    assert service.stats()["requests"] == 1
@@ -0,0 +1,130 @@
+"""
+Dispatcher de notifications contre LocalSink: envoi, déduplication,
+nouvelles tentatives et limitation de débit par destinataire.
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.services.alert_engine import SubscriptionIndex
+from app.services.notifications import LocalSink, NotificationDispatcher, NotificationQueue, RecipientLimiter
+
+
+def make_alert(alert_id: str, level: str = "alerte") -> dict:
+    return {
+        "alert_id": alert_id,
+        "alert_type": "flood",
+        "alert_level": level,
+        "location_name": "Bakel",
+        "message_fr": "ALERTE CRUE: Débit élevé",
+        "message_en": "FLOOD WARNING: High discharge",
+        "recommended_action": "Évacuer les zones basses",
+        "event_expected_date": "2024-09-01",
+        "confidence": 0.8,
+    }
+
+
+async def wait_until(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "délai dépassé"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def subscriptions():
+    index = SubscriptionIndex()
+    index.subscribe("bakel", ["flood"], notification_method="sms", notification_address="+221770000001")
+    index.subscribe("bakel", ["flood"], notification_method="sms", notification_address="+221770000002")
+    # Même destinataire via deux abonnements: un seul envoi
+    index.subscribe("*", ["*"], notification_method="sms", notification_address="+221770000001")
+    return index
+
+
+@pytest.fixture
+async def dispatcher(subscriptions):
+    dispatchers = []
+
+    async def start(sink: LocalSink, **options) -> NotificationDispatcher:
+        options.setdefault("poll_interval", 0.02)
+        dispatcher = NotificationDispatcher(NotificationQueue(), subscriptions, **options)
+        dispatcher.register(sink)
+        await dispatcher.start()
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield start
+    for dispatcher in dispatchers:
+        await dispatcher.close()
+
+
+def recipients(subscriptions: SubscriptionIndex) -> set:
+    return subscriptions.match("bakel", "flood", "alerte")
+
+
+async def test_delivers_once_per_recipient(dispatcher, subscriptions, tmp_path):
+    sink = LocalSink("sms", path=str(tmp_path / "sms.jsonl"))
+    notifications = await dispatcher(sink)
+
+    assert await notifications.enqueue_alert(make_alert("a1"), recipients(subscriptions)) == 2
+    # Même alerte au même niveau: rien de nouveau en file
+    assert await notifications.enqueue_alert(make_alert("a1"), recipients(subscriptions)) == 0
+    await wait_until(lambda: sink.delivered == 2)
+
+    assert notifications.duplicates == 2
+    assert sorted(m["recipient"] for m in sink.messages) == ["+221770000001", "+221770000002"]
+    with open(tmp_path / "sms.jsonl", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert {line["alert_id"] for line in lines} == {"a1"}
+    assert all(line["body"].startswith("ALERTE FLOOD - Bakel") for line in lines)
+
+
+async def test_retries_failed_sends(dispatcher, subscriptions):
+    sink = LocalSink("sms", failure_rate=1.0)
+    notifications = await dispatcher(sink, retry_base_seconds=0.05, retry_max_seconds=0.1)
+
+    await notifications.enqueue_alert(make_alert("a2"), recipients(subscriptions))
+    await wait_until(lambda: notifications.counters["sms"]["retried"] >= 2)
+    assert sink.delivered == 0
+
+    sink.failure_rate = 0.0
+    await wait_until(lambda: sink.delivered == 2)
+    assert notifications.counters["sms"]["sent"] == 2
+    assert notifications.counters["sms"]["failed"] == 0
+    assert notifications.queue.depth()["sms"] == {"sent": 2}
+
+
+async def test_gives_up_after_max_attempts(dispatcher, subscriptions):
+    sink = LocalSink("sms", failure_rate=1.0)
+    notifications = await dispatcher(sink, max_attempts=2, retry_base_seconds=0.01, retry_max_seconds=0.01)
+
+    await notifications.enqueue_alert(make_alert("a3"), recipients(subscriptions))
+    await wait_until(lambda: notifications.counters["sms"]["failed"] == 2)
+
+    assert notifications.counters["sms"]["retried"] == 2
+    assert notifications.queue.depth()["sms"] == {"failed": 2}
+
+
+async def test_rate_limits_each_recipient(dispatcher, subscriptions):
+    sink = LocalSink("sms")
+    notifications = await dispatcher(sink, limiter=RecipientLimiter(capacity=2, per_hour=1.0))
+
+    for alert_id in ("b1", "b2", "b3"):
+        await notifications.enqueue_alert(make_alert(alert_id), recipients(subscriptions))
+    # Deux envois en rafale par destinataire, le troisième est reporté
+    await wait_until(lambda: notifications.counters["sms"]["rate_limited"] == 2 and sink.delivered == 4)
+
+    assert sink.delivered == 4
+    assert notifications.counters["sms"]["rate_limited"] == 2
+    assert notifications.queue.depth()["sms"] == {"sent": 4, "pending": 2}
+
+
+def test_limiter_refund_restores_token():
+    limiter = RecipientLimiter(capacity=1, per_hour=3600.0)
+
+    assert limiter.take("+221770000001", now=0.0) == 0.0
+    assert limiter.take("+221770000001", now=0.0) == pytest.approx(1.0)
+    limiter.refund("+221770000001")
+    assert limiter.take("+221770000001", now=0.0) == 0.0
+    assert len(limiter) == 1
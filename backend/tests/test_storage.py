@@ -0,0 +1,65 @@
+"""
+Stockage SQLite: aller-retour des mesures (fusion des écritures partielles) et des abonnements.
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from tests.factories import START, readings
+
+
+async def test_write_and_fetch_range(storage):
+    assert await storage.write_frame(readings("bakel", 48)) == 48
+    await storage.write_frame(readings("kayes", 24, discharge=500.0))
+
+    frame = await storage.fetch_range("bakel", START, START + timedelta(hours=24), ["discharge_m3_s"])
+
+    assert list(frame.columns) == ["timestamp", "discharge_m3_s"]
+    assert len(frame) == 24
+    assert frame["timestamp"].iloc[0] == pd.Timestamp(START)
+    np.testing.assert_allclose(frame["discharge_m3_s"], 100.0 + np.arange(24))
+
+
+async def test_write_replaces_existing_rows(storage):
+    await storage.write_frame(readings("bakel", 24))
+    await storage.write_frame(readings("bakel", 2, discharge=900.0, start=START + timedelta(hours=23)))
+
+    frame = await storage.fetch_range("bakel", START, START + timedelta(days=2))
+    latest = await storage.fetch_latest(["bakel", "inconnue"])
+
+    assert len(frame) == 25
+    assert frame["discharge_m3_s"].iloc[23] == 900.0
+    assert np.isnan(frame["water_level_m"]).all()
+    assert latest["location_id"].tolist() == ["bakel"]
+    assert latest["discharge_m3_s"].iloc[0] == 901.0
+
+
+async def test_partial_write_keeps_existing_columns(storage):
+    await storage.write_frame(readings("bakel", 2))
+    rainfall = readings("bakel", 2).assign(discharge_m3_s=np.nan, rainfall_mm=[1.0, 2.0])
+    await storage.write_frame(rainfall)
+
+    frame = await storage.fetch_range("bakel", START, START + timedelta(days=1))
+
+    assert frame["discharge_m3_s"].tolist() == [100.0, 101.0]
+    assert frame["rainfall_mm"].tolist() == [1.0, 2.0]
+    assert np.isnan(frame["water_level_m"]).all()
+
+
+async def test_subscriptions_round_trip(storage):
+    subscription = {
+        "subscription_id": "0b0f4a4e-8d7c-4d35-9a55-2f1c7e3b6a10",
+        "location_id": "bakel",
+        "alert_types": ["drought", "flood"],
+        "min_level": "alerte",
+        "created_at": START,
+        "notification_method": "sms",
+        "notification_address": "+221770000000",
+    }
+    await storage.write_subscription(subscription)
+
+    assert await storage.read_subscriptions() == [subscription]
+    assert await storage.deactivate_subscription(subscription["subscription_id"])
+    assert not await storage.deactivate_subscription(subscription["subscription_id"])
+    assert await storage.read_subscriptions() == []
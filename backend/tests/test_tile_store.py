@@ -0,0 +1,41 @@
+"""
+Mosaïque d'inondation partagée entre processus: création unique, version commune.
+"""
+import numpy as np
+
+from app.services.tile_store import FloodTileStore
+
+BBOX = {"west": -12.0, "south": 14.0, "east": -11.0, "north": 15.0}
+
+
+def _store(root, resolution_deg=0.01):
+    return FloodTileStore(str(root), bbox=BBOX, resolution_deg=resolution_deg, tile_size=16)
+
+
+def test_second_store_reuses_pyramid_without_truncating(tmp_path):
+    first = _store(tmp_path)
+    first.write(np.ones((10, 10)), BBOX)
+    assert first.version == 1
+
+    second = _store(tmp_path)
+    assert second.version == 1
+    assert second.levels[0].read(0, 100, 0, 100).min() == 255
+    assert second.levels[-1].read(0, 1, 0, 1)[0, 0] == 255
+
+    # Version commune: une écriture d'un processus invalide les caches de l'autre
+    second.write(np.zeros((10, 10)), BBOX)
+    assert first.version == 2
+    assert first.levels[0].read(0, 100, 0, 100).max() == 0
+
+
+def test_store_recreated_when_resolution_changes(tmp_path):
+    first = _store(tmp_path)
+    first.write(np.ones((10, 10)), BBOX)
+
+    other = _store(tmp_path, resolution_deg=0.02)
+    assert other.version == 0
+    assert other.levels[0].shape == (50, 50)
+    assert other.levels[0].read(0, 50, 0, 50).max() == 0
+    # Les fichiers remplacés ne sont pas tronqués sous le processus qui les a mappés
+    assert first.levels[0].read(0, 100, 0, 100).min() == 255
+    assert not list(tmp_path.glob("*.tmp"))
@@ -100,6 +100,14 @@ export default function Maps() {
             attribution='&copy; OpenStreetMap contributors'
           />
 
+          {/* Probabilité d'inondation (tuiles servies par le backend) */}
+          <TileLayer
+            url="/api/tiles/flood/{z}/{x}/{y}"
+            opacity={0.8}
+            maxNativeZoom={16}
+            zIndex={10}
+          />
+
           {/* Topologie du Fleuve */}
           {(selectedLayer === 'all') && (
             <Polyline